@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""Times and memory-profiles the input set generator's main operations on
+synthetic github, npm and pypi datasets of 1k to 1M projects, and keeps the
+results in a json history so a run can be compared with the last one.
+
+Run it from the repo root (it benchmarks the working tree):
+    python benchmarks/bench.py --scales 1k,10k,100k
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import tracemalloc
+import subprocess
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import click
+
+# benchmark the working tree, not an installed copy
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from r2c_isg import util
+from r2c_isg.structures import Dataset
+from r2c_isg.structures.projects import project_map
+from r2c_isg.structures.versions import version_map
+
+HISTORY = os.path.join(ROOT, 'benchmarks', 'history.json')
+REGISTRIES = ['github', 'npm', 'pypi']
+
+# versions per synthetic project
+VERSIONS = 3
+
+# the synthetic files (the cache is the datasets' requests cache)
+FILES = {'csv': 'projects.csv', 'inputset': 'inputset.json',
+         'snapshot': 'dataset.snap', 'cache': 'cache'}
+
+# changes smaller than these are noise, whatever the threshold
+MIN_SECONDS = 0.005
+MIN_BYTES = 1 << 20
+
+
+class Context(object):
+    """A benchmark's registry and scale, and the synthetic files it needs
+    (generated on first use and shared by all the registry/scale's
+    benchmarks)."""
+
+    def __init__(self, registry: str, n: int, workdir: str):
+        self.registry = registry
+        self.n = n
+        self.dir = os.path.join(workdir, '%s-%d' % (registry, n))
+        self.cache_dir = os.path.join(self.dir, 'cache')
+        os.makedirs(self.cache_dir)
+        self._files = {}
+
+    def dataset(self) -> Dataset:
+        """A synthetic dataset (rebuilt every time; benchmarks change it)."""
+        ds = Dataset(self.registry, cache_dir=self.cache_dir)
+        ds.name, ds.version = 'bench', '1.0'
+        rand = random.Random(self.n)
+        p_class = project_map[self.registry]
+        v_class = version_map[self.registry]
+        for i in range(self.n):
+            if self.registry == 'github':
+                p = p_class(uuids_={'url': lambda p: p.url}, url=url(i),
+                            download_count=rand.randrange(10 ** 6))
+                p.versions = [v_class(uuids_={'commit': lambda v: v.sha},
+                                      sha='%040x' % (i * VERSIONS + j))
+                              for j in range(VERSIONS)]
+            else:
+                p = p_class(uuids_={'name': lambda p: p.name}, name=name(i),
+                            download_count=rand.randrange(10 ** 6))
+                p.versions = [v_class(uuids_={'version': lambda v: v.version},
+                                      version='%d.0.0' % j)
+                              for j in range(VERSIONS)]
+            ds.projects.append(p)
+
+        return ds
+
+    def file(self, kind: str) -> str:
+        """The path of a synthetic csv, input set, snapshot or (cached) api
+        responses."""
+        if kind not in self._files:
+            path = os.path.join(self.dir, FILES[kind])
+            with redirect_stdout(io.StringIO()):
+                getattr(self, '_write_' + kind)(path)
+            self._files[kind] = path
+
+        return self._files[kind]
+
+    def _write_csv(self, path: str) -> None:
+        with open(path, 'w', newline='') as file:
+            writer = csv.writer(file)
+            for i in range(self.n):
+                for j in range(VERSIONS):
+                    if self.registry == 'github':
+                        writer.writerow([url(i),
+                                         '%040x' % (i * VERSIONS + j)])
+                    else:
+                        writer.writerow([name(i), '%d.0.0' % j])
+
+    def _write_inputset(self, path: str) -> None:
+        self.dataset().export_inputset(path)
+
+    def _write_snapshot(self, path: str) -> None:
+        self.dataset().backup(path)
+
+    def _write_cache(self, path: str) -> None:
+        # Note: The responses are written where the api caches them (see
+        # Api.cache_path), so a get finds every one of them in the cache.
+        ds = self.dataset()
+        api = ds.api
+        for i, p in enumerate(ds.projects):
+            api_url = api._make_api_url(p)
+            if self.registry == 'github':
+                responses = {
+                    api_url: {'url': api_url, 'html_url': url(i),
+                              'stargazers_count': i},
+                    api_url + '/commits?page=1': [
+                        {'sha': '%040x' % (i * VERSIONS + j)}
+                        for j in range(VERSIONS)],
+                    api_url + '/commits?page=2': []
+                }
+            elif self.registry == 'npm':
+                versions = {'%d.0.0' % j: {'name': name(i),
+                                           'version': '%d.0.0' % j}
+                            for j in range(VERSIONS)}
+                responses = {api_url: {
+                    'name': name(i), 'description': 'package %d' % i,
+                    'dist-tags': {'latest': '%d.0.0' % (VERSIONS - 1)},
+                    'versions': versions}}
+            else:
+                releases = {'%d.0.0' % j: [{'packagetype': 'sdist'}]
+                            for j in range(VERSIONS)}
+                responses = {api_url: {
+                    'info': {'name': name(i), 'summary': 'project %d' % i,
+                             'version': '%d.0.0' % (VERSIONS - 1)},
+                    'releases': releases}}
+
+            for request_url, data in responses.items():
+                with open(api.cache_path(request_url), 'w') as file:
+                    json.dump({'url': request_url, 'status': 200,
+                               'timestamp': str(datetime.utcnow()),
+                               'json': data}, file)
+
+
+def name(i: int) -> str:
+    return 'pkg-%07d' % i
+
+
+def url(i: int) -> str:
+    return 'https://github.com/org%d/repo-%07d' % (i % 1000, i)
+
+
+# name -> (setup(ctx) -> state, run(ctx, state), largest scale or None);
+# setup isn't timed
+BENCHMARKS = OrderedDict([
+    # Note: CsvLoader looks up each row's project with find_project (a
+    # linear search), so loading a csv takes quadratic time.
+    ('load_csv', (
+        lambda ctx: ctx.file('csv'),
+        lambda ctx, path: Dataset.load_file(path, ctx.registry,
+                                            fileargs='url v.commit'
+                                            if ctx.registry == 'github'
+                                            else 'name v.version',
+                                            cache_dir=ctx.cache_dir),
+        1000)),
+    ('load_inputset', (
+        lambda ctx: ctx.file('inputset'),
+        lambda ctx, path: Dataset.import_inputset(path, ctx.registry,
+                                                  cache_dir=ctx.cache_dir),
+        None)),
+    ('find_project', (
+        lambda ctx: ctx.dataset(),
+        # the last project (a full scan)
+        lambda ctx, ds: ds.find_project(**(
+            {'url': url(ctx.n - 1)} if ctx.registry == 'github'
+            else {'name': name(ctx.n - 1)})),
+        None)),
+    ('sort', (
+        lambda ctx: ctx.dataset(),
+        lambda ctx, ds: ds.sort('desc download_count'),
+        None)),
+    ('sample', (
+        lambda ctx: ctx.dataset(),
+        lambda ctx, ds: ds.sample(max(ctx.n // 10, 1), seed='bench'),
+        None)),
+    ('trim', (
+        lambda ctx: ctx.dataset(),
+        lambda ctx, ds: ds.trim(1, on_versions=True, newest=True),
+        None)),
+    ('to_inputset', (
+        lambda ctx: ctx.dataset(),
+        lambda ctx, ds: ds.to_inputset(),
+        None)),
+    ('export_inputset', (
+        lambda ctx: ctx.dataset(),
+        lambda ctx, ds: ds.export_inputset(os.path.join(ctx.dir, 'out.json')),
+        None)),
+    ('backup', (
+        lambda ctx: ctx.dataset(),
+        lambda ctx, ds: ds.backup(os.path.join(ctx.dir, 'out.snap')),
+        None)),
+    ('restore', (
+        lambda ctx: ctx.file('snapshot'),
+        lambda ctx, path: Dataset.restore(path),
+        None)),
+    # get -mv with every response already cached
+    ('get_cached', (
+        lambda ctx: ctx.file('cache') and ctx.dataset(),
+        lambda ctx, ds: (ds.get_projects_meta(),
+                         ds.get_project_versions(historical='all')),
+        None))
+])
+
+
+def parse_scale(text: str) -> int:
+    """Parses a scale, eg, '10k' or '1m'."""
+    text = text.strip().lower()
+    units = {'k': 10 ** 3, 'm': 10 ** 6}
+    try:
+        if text[-1:] in units:
+            return int(float(text[:-1]) * units[text[-1]])
+        return int(text)
+    except ValueError:
+        raise click.BadParameter('Invalid scale "%s"; use a number, eg, '
+                                 '1000, 10k or 1m.' % text)
+
+
+def measure(ctx: Context, bench: tuple, repeat: int) -> dict:
+    """Times a benchmark (best of repeat runs) and measures its peak memory
+    (in a separate, traced run)."""
+    setup, run, _ = bench
+    seconds = []
+    for _ in range(repeat):
+        state = setup(ctx)
+        with redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run(ctx, state)
+            seconds.append(time.perf_counter() - start)
+        del state
+
+    # Note: Tracing slows allocation-heavy code down a lot, so the peak is
+    # measured separately from the times.
+    state = setup(ctx)
+    with redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        try:
+            run(ctx, state)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    return {'seconds': min(seconds), 'peak_bytes': peak}
+
+
+def machine() -> str:
+    """Identifies the machine/interpreter (runs are only compared with runs
+    from the same one)."""
+    return '%s/%s/python %s' % (platform.node(), platform.machine(),
+                                platform.python_version())
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def baseline(history: list, key: str) -> dict:
+    """The most recent earlier result for a benchmark on this machine."""
+    for past in reversed(history):
+        if past['machine'] == machine() and key in past['results']:
+            return past['results'][key]
+
+    return None
+
+
+def regressed(result: dict, base: dict, threshold: float) -> list:
+    """What got worse (seconds and/or peak_bytes) by more than the threshold
+    (and the noise floor)."""
+    worse = []
+    for field, floor in [('seconds', MIN_SECONDS), ('peak_bytes', MIN_BYTES)]:
+        if result[field] > base[field] * (1 + threshold) \
+                and result[field] - base[field] > floor:
+            worse.append(field)
+
+    return worse
+
+
+@click.command()
+@click.option('-s', '--scales', default='1k,10k,100k',
+              help='Comma-separated project counts (defaults to '
+                   '"1k,10k,100k"; add 1m for the full suite).')
+@click.option('-r', '--registries', default=','.join(REGISTRIES),
+              help='Comma-separated registries (defaults to all).')
+@click.option('-b', '--only', 'names',
+              help='Comma-separated benchmarks (defaults to all): %s.'
+                   % ', '.join(BENCHMARKS))
+@click.option('-n', '--repeat', type=int, default=3,
+              help='Runs per benchmark; the best time is kept (defaults to '
+                   '3).')
+@click.option('-t', '--threshold', type=float, default=0.2,
+              help='How much slower (or bigger) than the last run counts as '
+                   'a regression (defaults to 0.2, ie, 20%).')
+@click.option('-H', '--history', 'history_path', default=HISTORY,
+              help='The json history file (defaults to %s).'
+                   % os.path.relpath(HISTORY, ROOT))
+@click.option('--no-save', is_flag=True, default=False,
+              help="Compares with the history but doesn't add this run.")
+@click.option('--check', is_flag=True, default=False,
+              help='Exits with an error if anything regressed.')
+def main(scales, registries, names, repeat, threshold, history_path,
+         no_save, check):
+    """Runs the benchmarks."""
+    scales = [parse_scale(s) for s in scales.split(',')]
+    registries = registries.split(',')
+    names = names.split(',') if names else list(BENCHMARKS)
+    for registry in registries:
+        if registry not in REGISTRIES:
+            raise click.BadParameter('Unknown registry "%s".' % registry)
+    for bench in names:
+        if bench not in BENCHMARKS:
+            raise click.BadParameter('Unknown benchmark "%s".' % bench)
+
+    history = []
+    if os.path.isfile(history_path):
+        with open(history_path) as file:
+            history = json.load(file)['runs']
+
+    progress, util.PROGRESS = util.PROGRESS, False
+    workdir = tempfile.mkdtemp(prefix='r2c-isg-bench-')
+    results = OrderedDict()
+    regressions = []
+    print('%-16s %-7s %9s %10s %10s  %s' % ('benchmark', 'registry', 'scale',
+                                           'seconds', 'peak MB',
+                                           'vs. last run'))
+    try:
+        for n in scales:
+            for registry in registries:
+                ctx = Context(registry, n, workdir)
+                for bench in names:
+                    largest = BENCHMARKS[bench][2]
+                    if largest is not None and n > largest:
+                        continue
+
+                    key = '%s/%s/%d' % (bench, registry, n)
+                    result = measure(ctx, BENCHMARKS[bench], repeat)
+                    results[key] = result
+
+                    base = baseline(history, key)
+                    change = ''
+                    if base:
+                        change = '%+.0f%% time, %+.0f%% memory' % (
+                            100 * (result['seconds'] / base['seconds'] - 1)
+                            if base['seconds'] else 0,
+                            100 * (result['peak_bytes'] /
+                                   base['peak_bytes'] - 1)
+                            if base['peak_bytes'] else 0)
+                        worse = regressed(result, base, threshold)
+                        if worse:
+                            regressions.append(key)
+                            change += ' REGRESSED (%s)' % ', '.join(worse)
+
+                    print('%-16s %-7s %9s %10.4f %10.1f  %s'
+                          % (bench, registry, '{:,}'.format(n),
+                             result['seconds'],
+                             result['peak_bytes'] / (1 << 20), change))
+                    sys.stdout.flush()
+
+    finally:
+        util.PROGRESS = progress
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if not no_save:
+        history.append({
+            'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'commit': git_commit(),
+            'machine': machine(),
+            'repeat': repeat,
+            'results': results
+        })
+        with open(history_path, 'w') as file:
+            json.dump({'runs': history}, file, indent=4)
+        print('Saved the results to %s.' % history_path)
+
+    if regressions:
+        print('%d benchmarks regressed by more than %.0f%%: %s'
+              % (len(regressions), threshold * 100, ', '.join(regressions)))
+        if check:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,19 @@
 import os
 import json
 import shutil
-import requests
+import tempfile
 from typing import Optional, Union
 from datetime import datetime, timedelta
 from hashlib import md5
 from abc import ABC, abstractmethod
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
 
 from r2c_isg.structures import Project
+from r2c_isg.structures.journal import record
+
+
+class CriticalApiError(Exception):
+    """An api error that stops a whole get (eg, a bad token or a rate
+    limit), rather than failing a single project."""
 
 
 class Api(ABC):
@@ -23,6 +27,8 @@ class Api(ABC):
 
     def configure(self, **kwargs):
         """Populates the api with data from a dictionary."""
+        record(self)
+
         # set/create the cache dir
         self.cache_dir = kwargs.pop('cache_dir', None) or self.cache_dir
         if not os.path.exists(self.cache_dir):
@@ -41,12 +47,13 @@ class Api(ABC):
             headers: dict = {}, data: dict = {}, **_
     ) -> (int, Optional[Union[dict, list]]):
         """Loads a url from cache or downloads it from the web."""
+        # Note: requests is imported on first use; it's slow to import and
+        # most commands never hit the web.
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
 
-        # url + request type + headers + data uniquely identifies a
-        # request in the cache
-        uuid = '%s%s%s%s' % (url, request_type, str(headers), str(data))
-        filename = md5(uuid.encode()).hexdigest()
-        filepath = '%s/%s.json' % (self.cache_dir, filename)
+        filepath = self.cache_path(url, request_type, headers, data)
 
         # request-specific nocache setting overrides the api-level setting
         nocache = nocache if nocache is not None else self.nocache
@@ -96,28 +103,47 @@ class Api(ABC):
 
         # save the response json to cache (only 2xx response codes are cached)
         if r.status_code in range(200, 300):
-            with open(filepath, 'w') as json_file:
-                cached = {
-                    'url': url,
-                    'status': r.status_code,
-                    'timestamp': datetime.utcnow(),
-                    'json': data
-                }
-                json.dump(cached, json_file, indent=4, default=str)
+            # Note: Worker threads (eg, "get --workers") may request the same
+            # url at once, so the file is written under a temporary name and
+            # swapped in whole; a reader never sees it half-written.
+            fd, temp_path = tempfile.mkstemp(dir=self.cache_dir,
+                                             suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as json_file:
+                    cached = {
+                        'url': url,
+                        'status': r.status_code,
+                        'timestamp': datetime.utcnow(),
+                        'json': data
+                    }
+                    json.dump(cached, json_file, indent=4, default=str)
+                os.replace(temp_path, filepath)
+            except BaseException:
+                os.remove(temp_path)
+                raise
 
         return r.status_code, data
 
+    def cache_path(self, url: str, request_type: str = 'get',
+                   headers: dict = {}, data: dict = {}) -> str:
+        """The file a request is cached in."""
+        # url + request type + headers + data uniquely identifies a
+        # request in the cache
+        uuid = '%s%s%s%s' % (url, request_type, str(headers), str(data))
+        filename = md5(uuid.encode()).hexdigest()
+        return '%s/%s.json' % (self.cache_dir, filename)
+
     def clear_cache(self):
         """Deletes all cached files."""
         shutil.rmtree(self.cache_dir)
         os.mkdir(self.cache_dir)
 
     @abstractmethod
-    def get_project(self, project: Project, **kwargs) -> None: pass
+    def get_project(self, project: Project, **kwargs) -> int: pass
 
     @abstractmethod
     def get_versions(self, project: Project,
-                     hist: str = 'all', **kwargs) -> None: pass
+                     hist: str = 'all', **kwargs) -> int: pass
 
     def __repr__(self):
         return self.__class__.__name__
@@ -1,10 +1,10 @@
 from typing import Optional, Union
 from itertools import count
-from tqdm import tqdm
 
-from r2c_isg.apis import Api
+from r2c_isg.apis import Api, CriticalApiError
 from r2c_isg.structures.projects import GithubRepo
 from r2c_isg.structures.versions import GithubCommit
+from r2c_isg.util import progress
 
 
 class Github(Api):
@@ -41,11 +41,12 @@ class Github(Api):
         if self._base_api_url in url:
             if status == 401:
                 # invalid personal access token--critical error
-                raise Exception('Incorrect/invalid personal access token. '
-                                'Please double check your token and try again')
+                raise CriticalApiError(
+                    'Incorrect/invalid personal access token. Please double '
+                    'check your token and try again')
             elif status == 403:
                 # rate limiting--critical error
-                raise Exception(
+                raise CriticalApiError(
                     'The github api is limiting your request rate (HTTP %d). '
                     '%s' % (
                         status,
@@ -61,20 +62,12 @@ class Github(Api):
         return status, data
 
     def _make_api_url(self, project: GithubRepo) -> str:
-        if 'name' in project.uuids_ and 'org' in project.meta_:
-            name = project.uuids_['name']()
-            org = project.meta_['org']()
+        # Note: The url is built from the repo's canonical owner/name, so
+        # duplicate spellings of a repo share one (cached) request.
+        return '%s/repos/%s' % (self._base_api_url, project.canonical_key())
 
-        else:
-            # extract the name/org from the url
-            url = project.uuids_['url']()
-            name = project.get_name()
-            org = url.strip('/').split('/')[-2]
-
-        return '%s/repos/%s/%s' % (self._base_api_url, org, name)
-
-    def get_project(self, project: GithubRepo, **kwargs) -> None:
-        """Gets a repo's metadata."""
+    def get_project(self, project: GithubRepo, **kwargs) -> int:
+        """Gets a repo's metadata; returns the HTTP status."""
 
         # load the url from cache or the web
         url = self._make_api_url(project)
@@ -85,22 +78,35 @@ class Github(Api):
             print(' ' * 9 + 'Warning: Unexpected response from github api '
                             '(HTTP %d); failed to retrieve metadata for %s.'
                   % (status, project.get_name()))
-            return
+            return status
+
+        self.update_project(project, data)
+
+        return status
+
+    @staticmethod
+    def update_project(project: GithubRepo, data: dict) -> None:
+        """Updates a repo's metadata from its json (as returned by the api,
+        or read from a dump of it)."""
 
         # the 'url' key actually relates to the api; indicate as much
+        data = dict(data)
         data['api_url'] = data.pop('url', '')
 
-        # update the project
-        project.update(**data)
+        # update the project (attributes are decoded lazily)
+        project.update_raw(data)
 
     def get_versions(self, project: GithubRepo,
-                     historical: str = 'all', **kwargs) -> None:
-        """Gets a repo's commits."""
+                     historical: str = 'all', **kwargs) -> int:
+        """Gets a repo's commits; returns the HTTP status (of the first page
+        that failed, if any)."""
 
         # github commit json is paginated--30 commits per page
         api_url = self._make_api_url(project)
+        failed = None
         desc = '             %s' % project.get_name()
-        iterator = tqdm(count(start=1), leave=False, unit='page', desc=desc)
+        iterator = progress(count(start=1), leave=False, unit='page',
+                            desc=desc)
         for i in iterator:
             # load the url from cache or from the web
             url = '%s/commits?page=%d' % (api_url, i)
@@ -112,11 +118,12 @@ class Github(Api):
                 print(' ' * 9 + 'Warning: Github api returned 404 for url %s;'
                       ' assuming malformed url for project %s.'
                       % (url, project.get_name()))
-                return  # give up trying to load commits for this repo
+                return status  # give up loading commits for this repo
             elif status != 200:
                 print(' ' * 9 + 'Warning: Unexpected response from github '
                       'api (HTTP %d); failed to retrieve some of the versions '
                       'of %s (%s).' % (status, project.get_name(), url))
+                failed = failed or status
                 continue  # keep trying to load commits; move on to next page
 
             if not data:
@@ -136,17 +143,19 @@ class Github(Api):
 
                 if commit:
                     # update the existing commit
-                    commit.update(**v_data)
+                    commit.update_raw(v_data)
 
                 else:
                     # create a new commit
                     uuids = {
                         'commit': lambda v: v.sha
                     }
-                    commit = GithubCommit(uuids_=uuids, **v_data)
+                    commit = GithubCommit(uuids_=uuids, raw_=v_data)
                     project.versions.append(commit)
 
             if historical == 'latest':
                 # stop after the first page of results
                 iterator.close()
                 break
+
+        return failed or 200
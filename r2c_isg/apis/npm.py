@@ -1,19 +1,45 @@
 from typing import Optional, Union
 
-from r2c_isg.apis import Api
+from r2c_isg.apis import Api, CriticalApiError
 from r2c_isg.structures.projects import NpmPackage
 from r2c_isg.structures.versions import NpmVersion
 
 
 class Npm(Api):
     def __init__(self, **kwargs):
+        # set the default local mirror (see NpmMirror; opened on first use)
+        self.mirror = None
+        self._mirror = None
+
         super().__init__(**kwargs)
 
         # set the base url for npm's api
         self._base_api_url = 'https://registry.npmjs.com'
 
+    def configure(self, **kwargs):
+        """Populates the npm api with data from a dictionary."""
+        super().configure(**kwargs)
+
+        # set the local mirror's path
+        mirror = kwargs.pop('npm_mirror', None)
+        if mirror and mirror != self.mirror:
+            self.mirror = mirror
+            self._mirror = None
+
     def request(self, url, **kwargs) -> (int, Optional[Union[dict, list]]):
-        """Manages API rate limitations before calling super().request()."""
+        """Serves package documents from the local mirror (if any), and
+        manages API rate limitations before calling super().request()."""
+
+        # packages that are mirrored don't need the registry (any others,
+        # eg, new since the last sync, fall back to it)
+        if self.mirror and url.startswith(self._base_api_url + '/'):
+            if not self._mirror:
+                from r2c_isg.apis.npm_mirror import NpmMirror
+                self._mirror = NpmMirror(self.mirror)
+
+            doc = self._mirror.get(url[len(self._base_api_url) + 1:])
+            if doc is not None:
+                return 200, doc
 
         # get the response code/data
         status, data = super().request(url, **kwargs)
@@ -30,17 +56,19 @@ class Npm(Api):
         if self._base_api_url in url:
             # rate limiting--critical error
             if status == 429:
-                raise Exception('The npm registry is limiting your request rate'
-                                ' (HTTP %d). Please try again later.' % status)
+                raise CriticalApiError('The npm registry is limiting your '
+                                       'request rate (HTTP %d). Please try '
+                                       'again later.' % status)
 
         return status, data
 
     def _make_api_url(self, project: NpmPackage) -> str:
-        # get the package name and convert to api url
-        return '%s/%s' % (self._base_api_url, project.get_name())
+        # get the package's canonical name and convert to api url (so
+        # duplicate spellings of a package share one cached request)
+        return '%s/%s' % (self._base_api_url, project.canonical_key())
 
-    def get_project(self, project: NpmPackage, **kwargs) -> None:
-        """Gets a package's metadata."""
+    def get_project(self, project: NpmPackage, **kwargs) -> int:
+        """Gets a package's metadata; returns the HTTP status."""
 
         # load the url from cache or the web
         url = self._make_api_url(project)
@@ -51,17 +79,16 @@ class Npm(Api):
             print(' ' * 9 + 'Warning: Unexpected response from npm registry '
                             '(HTTP %d); failed to retrieve metadata for %s.'
                   % (status, project.get_name()))
-            return
+            return status
 
-        # ignore version-related data--use get_versions() for that
-        data.pop('versions', None)
+        self.update_project(project, data)
 
-        # update the project
-        project.update(**data)
+        return status
 
     def get_versions(self, project: NpmPackage,
-                     historical: str = 'all', **kwargs) -> None:
-        """Gets a version's historical releases."""
+                     historical: str = 'all', **kwargs) -> int:
+        """Gets a version's historical releases; returns the HTTP
+        status."""
 
         # load the url from cache or from the web
         url = self._make_api_url(project)
@@ -72,15 +99,43 @@ class Npm(Api):
             print(' ' * 9 + 'Warning: Unexpected response from npm registry '
                             '(HTTP %d); failed to retrieve versions for %s.'
                   % (status, project.get_name()))
-            return
+            return status
+
+        self.update_versions(project, data, historical)
+
+        return status
+
+    @staticmethod
+    def update_project(project: NpmPackage, data: dict) -> None:
+        """Updates a package's metadata from its registry document (as
+        returned by the api, or read from a registry dump)."""
+
+        # ignore version-related data--use update_versions() for that--except
+        # for the latest release's dependencies (see expand-deps); the
+        # document is copied, since its versions may be used next
+        data = dict(data)
+        versions = data.pop('versions', None) or {}
+        latest = versions.get(data.get('dist-tags', {}).get('latest', ''), {})
+        data['dependencies'] = latest.get('dependencies', None) or {}
+
+        # update the project (attributes are decoded lazily)
+        project.update_raw(data)
+
+    @staticmethod
+    def update_versions(project: NpmPackage, data: dict,
+                        historical: str = 'all') -> None:
+        """Updates a package's versions from its registry document (as
+        returned by the api, or read from a registry dump)."""
 
-        # get the versions list from the data
-        versions = data['versions']
+        # get the versions list from the data (unpublished packages have
+        # none)
+        versions = data.get('versions', None) or {}
 
         if historical == 'latest':
             # trim the new versions data to the latest version only
-            latest_key = data['dist-tags']['latest']
-            versions = {latest_key: versions[latest_key]}
+            latest_key = data.get('dist-tags', {}).get('latest', '')
+            versions = {latest_key: versions[latest_key]} \
+                if latest_key in versions else {}
 
         for _, v_data in versions.items():
             version = project.find_version(**v_data)
@@ -90,12 +145,12 @@ class Npm(Api):
 
             if version:
                 # update the existing version
-                version.update(**v_data)
+                version.update_raw(v_data)
 
             else:
                 # create a new version
                 uuids = {
                     'version': lambda v: v.version
                 }
-                version = NpmVersion(uuids_=uuids, **v_data)
+                version = NpmVersion(uuids_=uuids, raw_=v_data)
                 project.versions.append(version)
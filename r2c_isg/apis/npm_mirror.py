@@ -0,0 +1,146 @@
+import json
+import zlib
+import sqlite3
+import threading
+from typing import Optional
+from urllib.parse import quote
+
+from r2c_isg.util import progress
+
+# npm's couchdb replica (for its _changes feed) and the registry (for any
+# documents the feed leaves out)
+REPLICATE_URL = 'https://replicate.npmjs.com'
+REGISTRY_URL = 'https://registry.npmjs.com'
+
+
+class NpmMirror(object):
+    """A local copy of npm registry documents (packuments), kept in a sqlite
+    database and brought up to date by following the registry's couchdb
+    _changes feed from the last sequence number it saw. After the first
+    sync, a sync only downloads the packages that changed since the last
+    one. Documents are stored zlib-compressed."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+        # Note: The connection is shared by the api's worker threads (see
+        # "get --workers"), so all access goes through a lock.
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS docs '
+                         '(name TEXT PRIMARY KEY, doc BLOB NOT NULL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS state '
+                         '(key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._db.commit()
+
+    @property
+    def seq(self):
+        """The last sequence number synced (None before the first sync)."""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM state "
+                                   "WHERE key = 'seq'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get(self, name: str) -> Optional[dict]:
+        """Returns a package's document, or None if it isn't mirrored."""
+        with self._lock:
+            row = self._db.execute('SELECT doc FROM docs WHERE name = ?',
+                                   (name,)).fetchone()
+        return json.loads(zlib.decompress(row[0]).decode()) if row else None
+
+    def sync(self, url: str = REPLICATE_URL,
+             registry_url: str = REGISTRY_URL, batch: int = 500,
+             max_changes: int = None) -> (int, int):
+        """Applies the changes since the last sync (or all of them, the
+        first time), batch changes per request and at most max_changes in
+        all; returns the number of packages updated and deleted."""
+        # Note: requests is imported on first use (see Api.request).
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        if batch < 1:
+            raise Exception('The batch size must be at least 1.')
+
+        session = requests.Session()
+        session.mount('', HTTPAdapter(max_retries=Retry(
+            total=3, backoff_factor=1, status_forcelist=[502, 503, 504])))
+
+        def fetch(fetch_url: str, **params) -> dict:
+            r = session.get(fetch_url, params=params, timeout=300)
+            if r.status_code != 200:
+                raise Exception('Error syncing the npm mirror (HTTP %d from '
+                                '%s).' % (r.status_code, fetch_url))
+            return r.json()
+
+        seq = self.seq
+        updated = 0
+        deleted = 0
+        seen = 0
+        bar = progress(unit='change', leave=False,
+                       desc='         Syncing npm mirror')
+        try:
+            while max_changes is None or seen < max_changes:
+                limit = batch if max_changes is None \
+                    else min(batch, max_changes - seen)
+                params = {'include_docs': 'true', 'limit': limit}
+                if seq is not None:
+                    params['since'] = seq
+                data = fetch('%s/_changes' % url.rstrip('/'), **params)
+                results = data.get('results', [])
+
+                rows = []
+                gone = []
+                for change in results:
+                    name = change['id']
+                    if change.get('deleted', False):
+                        gone.append((name,))
+                        continue
+                    if name.startswith('_design/'):
+                        continue
+
+                    # Note: The feed may leave documents out (npm's replica
+                    # no longer includes them); they're got from the
+                    # registry instead.
+                    doc = change.get('doc', None) or fetch('%s/%s' % (
+                        registry_url.rstrip('/'), quote(name, safe='@')))
+                    rows.append((name, zlib.compress(
+                        json.dumps(doc, separators=(',', ':')).encode())))
+
+                if results:
+                    seq = data.get('last_seq', results[-1]['seq'])
+
+                # each batch is committed with its sequence number, so an
+                # interrupted sync picks up where it stopped
+                with self._lock:
+                    self._db.executemany('INSERT OR REPLACE INTO docs '
+                                         'VALUES (?, ?)', rows)
+                    self._db.executemany('DELETE FROM docs WHERE name = ?',
+                                         gone)
+                    if seq is not None:
+                        self._db.execute(
+                            'INSERT OR REPLACE INTO state VALUES (?, ?)',
+                            ('seq', json.dumps(seq)))
+                    self._db.commit()
+
+                updated += len(rows)
+                deleted += len(gone)
+                seen += len(results)
+                bar.update(len(results))
+
+                if len(results) < limit:
+                    # caught up
+                    break
+
+        finally:
+            bar.close()
+
+        return updated, deleted
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute('SELECT COUNT(*) FROM docs').fetchone()[0]
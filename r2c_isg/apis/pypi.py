@@ -28,11 +28,13 @@ class Pypi(Api):
         return status, data
 
     def _make_api_url(self, project: PypiProject) -> str:
-        # get the package name and convert to api url
-        return '%s/pypi/%s/json' % (self._base_api_url, project.get_name())
+        # get the project's normalized name and convert to api url (so
+        # duplicate spellings of a project share one cached request)
+        return '%s/pypi/%s/json' % (self._base_api_url,
+                                    project.canonical_key())
 
-    def get_project(self, project: PypiProject, **kwargs) -> None:
-        """Gets a project's metadata."""
+    def get_project(self, project: PypiProject, **kwargs) -> int:
+        """Gets a project's metadata; returns the HTTP status."""
 
         # load the url from cache or the web
         url = self._make_api_url(project)
@@ -43,21 +45,16 @@ class Pypi(Api):
             print(' ' * 9 + 'Warning: Unexpected response from pypi api '
                             '(HTTP %d); failed to retrieve metadata for %s.'
                   % (status, project.get_name()))
-            return
+            return status
 
-        # ignore version-related data--use get_versions() for that
-        data.pop('releases', None)
-
-        # break out the contents of the 'info' dict
-        for k, v in data.pop('info', {}).items():
-            data[k] = v
+        self.update_project(project, data)
 
-        # update the project
-        project.update(**data)
+        return status
 
     def get_versions(self, project: PypiProject,
-                     historical: str = 'all', **kwargs) -> None:
-        """Gets a project's historical releases."""
+                     historical: str = 'all', **kwargs) -> int:
+        """Gets a project's historical releases; returns the HTTP
+        status."""
 
         # load the url from cache or from the web
         url = self._make_api_url(project)
@@ -68,15 +65,43 @@ class Pypi(Api):
             print(' ' * 9 + 'Warning: Unexpected response from pypi api '
                             '(HTTP %d); failed to retrieve versions for %s.'
                   % (status, project.get_name()))
-            return
+            return status
+
+        self.update_versions(project, data, historical)
+
+        return status
+
+    @staticmethod
+    def update_project(project: PypiProject, data: dict) -> None:
+        """Updates a project's metadata from its json (as returned by the
+        api, or read from a dump of it)."""
+
+        # ignore version-related data--use update_versions() for that; the
+        # json is copied, since its releases may be used next
+        data = dict(data)
+        data.pop('releases', None)
+
+        # break out the contents of the 'info' dict
+        for k, v in data.pop('info', {}).items():
+            data[k] = v
+
+        # update the project (attributes are decoded lazily)
+        project.update_raw(data)
+
+    @staticmethod
+    def update_versions(project: PypiProject, data: dict,
+                        historical: str = 'all') -> None:
+        """Updates a project's releases from its json (as returned by the
+        api, or read from a dump of it)."""
 
         # get the releases list from the data
-        releases = data['releases']
+        releases = data.get('releases', None) or {}
 
         if historical == 'latest':
             # trim the new versions data to the latest release only
-            latest_key: str = data['info']['version']
-            releases = {latest_key: releases[latest_key]}
+            latest_key: str = data.get('info', {}).get('version', '')
+            releases = {latest_key: releases[latest_key]} \
+                if latest_key in releases else {}
 
         for v_str, v_data in releases.items():
             # Note: The pypi api returns versions as a dict mapping of
@@ -102,12 +127,12 @@ class Pypi(Api):
 
             if release:
                 # update the existing release
-                release.update(**v_data)
+                release.update_raw(v_data)
 
             else:
                 # create a new release
                 uuids = {
                     'version': lambda v: v.version
                 }
-                release = PypiRelease(uuids_=uuids, **v_data)
+                release = PypiRelease(uuids_=uuids, raw_=v_data)
                 project.versions.append(release)
@@ -1,27 +1,41 @@
 #!/usr/bin/env python3
 
 import os
+import time
+import shlex
 import shutil
 import click
 import json
 import atexit
-import webbrowser
-from copy import deepcopy
 from datetime import timedelta
+from typing import TYPE_CHECKING, Optional
 from click import argument, option, Choice, Path
 from click_shell import shell
 
 from r2c_isg.structures import Dataset
+from r2c_isg.structures.journal import Journal
 from r2c_isg.structures.projects import project_map
-from r2c_isg.util import get_dataset, print_error
+from r2c_isg.util import get_dataset, parse_duration, print_error
 from r2c_isg.loaders.file import fileloader_map
 from r2c_isg.loaders.web import webloader_map
 
+if TYPE_CHECKING:
+    from r2c_isg.structures.checkpoint import Checkpoint
+
 
 DEBUG = False
 # store meta/api settings if a dataset hasn't yet been loaded
 TEMP_SETTINGS = dict()
 TEMP_DIR = '.tmp/'
+# where "get" saves its progress (see "get --resume")
+CHECKPOINT_DIR = '.get_checkpoint'
+# committed journals, most recent last (used by the "undo" command)
+HISTORY = []
+UNDO_LEVELS = 10
+# set while running a script; commands fail fast and skip rollbacks
+BATCH = False
+# commands that neither read nor reorder the projects
+COMMUTING = ['get', 'set-meta', 'set-api', 'sync-npm', 'and']
 
 
 @shell(chain=True, prompt='r2c-isg> ')
@@ -43,8 +57,8 @@ def cli(ctx, debug, quiet):
     # register the cleanup callback on exit
     atexit.register(cleanup)
 
-    # print the welcome screen
-    if not quiet:
+    # print the welcome screen (only when starting the interactive shell)
+    if not quiet and ctx.invoked_subcommand is None:
         print('=' * 100)
         print('Welcome to the R2C input set generator! We currently support '
               'the following registries: %s. For more info on specific '
@@ -84,6 +98,56 @@ def cli(ctx, debug, quiet):
         print('=' * 100)
 
 
+def begin(ctx) -> Journal:
+    """Starts recording changes so a command can be rolled back."""
+    journal = Journal()
+
+    # scripts stop at the first error, so they never need to roll back
+    if not BATCH:
+        journal.start()
+        journal.record(ctx.obj)
+
+        # Note: Changes to a disk-backed dataset's projects are held back by
+        # its store (see Journal), so it's recorded up front; otherwise
+        # commands that only change projects couldn't be rolled back, and
+        # "undo" would silently skip them.
+        ds = ctx.obj.get('dataset', None)
+        if ds and hasattr(ds.projects, 'savepoint'):
+            journal.record(ds)
+
+    return journal
+
+
+def commit(journal: Journal) -> None:
+    """Stops recording changes, keeping them around for "undo"."""
+    journal.commit()
+
+    if not BATCH:
+        HISTORY.append(journal)
+        del HISTORY[:-UNDO_LEVELS]
+
+
+def fail(err: Exception, journal: Journal = None) -> None:
+    """Prints a command's error and rolls back its changes (or, when
+    running a script, stops the script)."""
+    if BATCH:
+        raise err
+
+    print_error(err, DEBUG)
+    if journal:
+        journal.rollback()
+
+
+def sample_spec(n: int, seed: str, weight: str = None, inverse: bool = False,
+                strata: str = None, hashed: bool = False) -> Optional[dict]:
+    """Builds the sampling spec loaders use to sample while loading."""
+    if n is None:
+        return None
+
+    return {'n': n, 'seed': seed, 'weight': weight, 'inverse': inverse,
+            'strata': strata, 'hashed': hashed}
+
+
 @cli.command('and')
 def spacer():
     """Does absolutely nothing, but sure does make command strings more
@@ -115,123 +179,216 @@ weblist_options = '; '.join(['%s: %s' % (
 @option('-p', '--parser', 'fileargs', type=str,
         help='Handle for a custom-build json parser. No json parsers '
              'are implemented by default.')
+@option('-s', '--store', type=Path(),
+        help='Keeps the projects in a sqlite file on disk instead of in '
+             'memory (for datasets too large to fit in RAM).')
+@option('--sample', 'sample_n', type=int,
+        help='Samples N projects while loading, so only the sampled projects '
+             'are built. Gives the same projects as loading everything and '
+             'then running "sample" with the same seed.')
+@option('--seed', type=str, help='Sets the random seed for --sample.')
+@option('--weight', type=str,
+        help='Weights --sample by a key (eg, download_count), as in "sample".')
+@option('--inverse', is_flag=True, default=False,
+        help='Weights --sample by the inverse of --weight (eg, for ranks).')
+@option('--strata', type=str,
+        help='Samples N projects per value of a key (eg, org) for --sample.')
+@option('--hashed', is_flag=True, default=False,
+        help='Samples by a hash of project names for --sample, so the sample '
+             'stays the same as the list grows (see "sample").')
+@option('--refresh', is_flag=True, default=False,
+        help='Refreshes the current dataset from a newer copy of its weblist '
+             '(or github user/org) instead of building a new dataset: '
+             'projects still listed keep everything got for them, new '
+             'projects are added and delisted ones are dropped.')
+@option('--flag-removed', is_flag=True, default=False,
+        help='Keeps delisted projects when refreshing (at the end, with '
+             'delisted set to true) instead of dropping them.')
 @click.pass_context
-def load(ctx, registry, from_type, name_or_path, fileargs):
+def load(ctx, registry, from_type, name_or_path, fileargs, store, sample_n,
+         seed, weight, inverse, strata, hashed, refresh, flag_removed):
     """Generates a dataset from a weblist name or file path."""
-    backup_ds = None
-    
-    try:
-        backup_ds = deepcopy(ctx.obj.get('dataset', None))
+    journal = begin(ctx)
 
+    try:
         if registry == 'noreg':
             registry = None
 
         global TEMP_SETTINGS
 
+        if refresh and from_type == 'file':
+            raise Exception('Only weblists and github users/orgs can be '
+                            'refreshed.')
+        if refresh and store:
+            raise Exception('A refreshed dataset stays where it is; --store '
+                            'cannot be used with --refresh.')
+
         if from_type == 'file':
             # read in a file (fileargs is either a header string for csv
             # or a parser handle for json)
-            ds = Dataset.load_file(name_or_path, registry,
-                                   fileargs=fileargs, **TEMP_SETTINGS)
+            ds = Dataset.load_file(name_or_path, registry, fileargs=fileargs,
+                                   store=store,
+                                   sample=sample_spec(sample_n, seed, weight,
+                                                      inverse, strata, hashed),
+                                   **TEMP_SETTINGS)
+
+        elif refresh:
+            # diff a newer copy of the list against the current dataset
+            ds = get_dataset(ctx)
+            listed = Dataset.load_web(name_or_path, registry,
+                                      from_type=from_type,
+                                      sample=sample_spec(sample_n, seed,
+                                                         weight, inverse,
+                                                         strata, hashed),
+                                      **TEMP_SETTINGS)
+            ds.refresh(listed, flag_removed)
 
         else:
             # download a weblist or organization repo list
-            ds = Dataset.load_web(name_or_path, registry,
-                                  from_type=from_type, **TEMP_SETTINGS)
+            ds = Dataset.load_web(name_or_path, registry, from_type=from_type,
+                                  store=store,
+                                  sample=sample_spec(sample_n, seed, weight,
+                                                     inverse, strata, hashed),
+                                  **TEMP_SETTINGS)
 
         ctx.obj['dataset'] = ds
 
         # reset the temporary api/metadata dict
         TEMP_SETTINGS = dict()
 
+        commit(journal)
+
     except Exception as e:
-        print_error(e, DEBUG)
-        
         # silently restore the dataset
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
 
 
-@cli.command('restore', help='Restores a dataset from a pickle file. Use '
-                             'the "backup" command to pickle the dataset.')
+@cli.command('restore', help='Restores a dataset from a snapshot (or an older '
+                             'pickle backup). Use the "backup" command to '
+                             'back up the dataset.')
 @argument('filepath', type=Path(exists=True))
+@option('-s', '--store', type=Path(),
+        help='Restores the projects into a sqlite file on disk instead of '
+             'into memory (snapshots only).')
+@option('--no-versions', 'versions', is_flag=True, flag_value=False,
+        default=True,
+        help="Skips the projects' versions (snapshots only).")
+@option('--view', is_flag=True, default=False,
+        help='Reads the projects straight from the (memory-mapped) snapshot '
+             'instead of loading them; the projects are read-only, but sort, '
+             'trim, sample, filter, etc. still work (snapshots only).')
 @click.pass_context
-def restore(ctx, filepath):
-    """Restores a pickled dataset file."""
-    backup_ds = None
+def restore(ctx, filepath, store, versions, view):
+    """Restores a backed up dataset file."""
+    journal = begin(ctx)
 
     try:
-        backup_ds = deepcopy(ctx.obj.get('dataset', None))
-
-        ds = Dataset.restore(filepath)
+        ds = Dataset.restore(filepath, store=store, versions=versions,
+                             view=view)
         ctx.obj['dataset'] = ds
 
         # reset the temporary api/metadata dict
         global TEMP_SETTINGS
         TEMP_SETTINGS = dict()
 
-    except Exception as e:
-        print_error(e, DEBUG)
+        commit(journal)
 
+    except Exception as e:
         # silently restore the dataset
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
 
 
-@cli.command('backup', help='Backs up the full dataset to a pickle file. Use '
-                            'the "restore" command to restore the file.')
+@cli.command('backup', help='Backs up the full dataset to a snapshot file. '
+                            'Use the "restore" command to restore the file.')
 @argument('filepath', type=Path(), default=None)
+@option('-c', '--compress', is_flag=True, default=False,
+        help='Compresses the snapshot (smaller, but slower to read).')
 @click.pass_context
-def backup(ctx, filepath):
-    """Pickles the complete dataset."""
+def backup(ctx, filepath, compress):
+    """Backs up the complete dataset."""
     try:
         ds = get_dataset(ctx)
-        ds.backup(filepath)
+        ds.backup(filepath, compress=compress)
 
     except Exception as e:
-        print_error(e, DEBUG)
+        fail(e)
 
 
-@cli.command('import', help='Imports a dataset from an R2C input set json. '
-                            'Use the "export" command to export an input set.')
+@cli.command('import', help='Imports a dataset from an R2C input set json '
+                            '(or json lines; optionally gzipped). Use the '
+                            '"export" command to export an input set.')
 @argument('registry', type=Choice(list(project_map) + ['noreg']))
 @argument('filepath', type=Path(exists=True))
+@option('-s', '--store', type=Path(),
+        help='Keeps the projects in a sqlite file on disk instead of in '
+             'memory (for datasets too large to fit in RAM).')
+@option('--sample', 'sample_n', type=int,
+        help='Samples N projects while loading, so only the sampled projects '
+             'are built. Gives the same projects as loading everything and '
+             'then running "sample" with the same seed.')
+@option('--seed', type=str, help='Sets the random seed for --sample.')
+@option('--weight', type=str,
+        help='Weights --sample by a key (eg, download_count), as in "sample".')
+@option('--inverse', is_flag=True, default=False,
+        help='Weights --sample by the inverse of --weight (eg, for ranks).')
+@option('--strata', type=str,
+        help='Samples N projects per value of a key (eg, org) for --sample.')
+@option('--hashed', is_flag=True, default=False,
+        help='Samples by a hash of project names for --sample, so the sample '
+             'stays the same as the list grows (see "sample").')
 @click.pass_context
-def import_(ctx, registry, filepath):
+def import_(ctx, registry, filepath, store, sample_n, seed, weight, inverse,
+            strata, hashed):
     """Imports an input set json file."""
-    backup_ds = None
+    journal = begin(ctx)
 
     try:
-        backup_ds = deepcopy(ctx.obj.get('dataset', None))
-
         if registry == 'noreg':
             registry = None
 
         global TEMP_SETTINGS
 
-        ds = Dataset.import_inputset(filepath, registry, **TEMP_SETTINGS)
+        ds = Dataset.import_inputset(filepath, registry, store=store,
+                                     sample=sample_spec(sample_n, seed,
+                                                        weight, inverse,
+                                                        strata, hashed),
+                                     **TEMP_SETTINGS)
         ctx.obj['dataset'] = ds
 
         # reset the temporary api/metadata dict
         TEMP_SETTINGS = dict()
 
-    except Exception as e:
-        print_error(e, DEBUG)
+        commit(journal)
 
+    except Exception as e:
         # silently restore the dataset
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
 
 
 @cli.command('export', help='Exports a dataset to an R2C input set json. '
                             'Use the "import" command to import an input set.')
 @argument('filepath', type=Path(), default=None)
+@option('-c', '--compact', is_flag=True, default=False,
+        help='Writes compact json (no indentation or spaces).')
+@option('-l', '--jsonl', is_flag=True, default=False,
+        help='Writes json lines: the input set metadata on the first line, '
+             'then one input per line.')
+@option('-z', '--gzip', 'compress', is_flag=True, default=False,
+        help="Gzips the file (adding '.gz' to its name). Files whose names "
+             "end in '.gz' are always gzipped.")
+@option('-s', '--shards', type=int, default=1,
+        help='Splits the input set into N files (eg, '
+             'inputset-00000-of-00004.json), dealing projects out to them '
+             'round-robin. Each file is a complete input set.')
 @click.pass_context
-def export(ctx, filepath):
+def export(ctx, filepath, compact, jsonl, compress, shards):
     """Export a dataset to an input set json."""
     try:
         ds = get_dataset(ctx)
-        ds.export_inputset(filepath)
+        ds.export_inputset(filepath, compact, jsonl, compress, shards)
 
     except Exception as e:
-        print_error(e, DEBUG)
+        fail(e)
 
 
 @cli.command('set-meta', help="Sets the dataset's metadata.")
@@ -248,11 +405,10 @@ def export(ctx, filepath):
 @click.pass_context
 def set_meta(ctx, name, version, description, readme, author, email):
     """Sets dataset metadata."""
-    backup_ds = None
+    journal = begin(ctx)
 
     try:
         ds = ctx.obj.get('dataset', None)
-        backup_ds = deepcopy(ds)
 
         if ds:
             # update dataset's metadata
@@ -279,11 +435,11 @@ def set_meta(ctx, name, version, description, readme, author, email):
         set_str = ', '.join([s for s in settings if s])
         print("         Set the dataset's %s." % set_str)
 
-    except Exception as e:
-        print_error(e, DEBUG)
+        commit(journal)
 
+    except Exception as e:
         # silently restore the dataset
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
 
 
 @cli.command('set-api', help='Sets API-specific settings.')
@@ -299,25 +455,35 @@ def set_meta(ctx, name, version, description, readme, author, email):
              'instructions on how to obtain a token, see: https://help.'
              'github.com/en/articles/creating-a-personal-access-token-'
              'for-the-command-line.')
+@option('--npm-mirror', 'npm_mirror', type=Path(),
+        help='Serves npm package documents from a local mirror (see '
+             '"sync-npm") instead of the registry; packages it lacks are '
+             'still got from the registry.')
 @click.pass_context
-def set_api(ctx, cache_dir, cache_timeout, nocache, github_pat):
+def set_api(ctx, cache_dir, cache_timeout, nocache, github_pat, npm_mirror):
     """Sets API settings."""
-    backup_ds = None
+    journal = begin(ctx)
 
     try:
         ds = ctx.obj.get('dataset', None)
-        backup_ds = deepcopy(ds)
 
         # convert cache timeout string to timedelta
         if cache_timeout:
             cache_timeout = timedelta(days=cache_timeout)
 
+        # Note: The mirror is checked here rather than by click, so a script
+        # can create it (with "sync-npm") before using it.
+        if npm_mirror and not os.path.isfile(npm_mirror):
+            raise Exception('There is no npm mirror at "%s"; create one with '
+                            '"sync-npm".' % npm_mirror)
+
         if ds and ds.api:
             # configure the api
             ds.api.configure(cache_dir=cache_dir,
                              cache_timeout=cache_timeout,
                              nocache=nocache,
-                             github_pat=github_pat)
+                             github_pat=github_pat,
+                             npm_mirror=npm_mirror)
 
         else:
             # no ds/api; save the settings for when there is one
@@ -326,6 +492,7 @@ def set_api(ctx, cache_dir, cache_timeout, nocache, github_pat):
             if cache_timeout: TEMP_SETTINGS['cache_timeout'] = cache_timeout
             if nocache: TEMP_SETTINGS['nocache'] = nocache
             if github_pat: TEMP_SETTINGS['github_pat'] = github_pat
+            if npm_mirror: TEMP_SETTINGS['npm_mirror'] = npm_mirror
 
         # print the outcome
         settings = []
@@ -333,14 +500,48 @@ def set_api(ctx, cache_dir, cache_timeout, nocache, github_pat):
         if cache_timeout: settings.append('cache_timeout')
         if nocache: settings.append('nocache')
         if github_pat: settings.append('github_pat')
+        if npm_mirror: settings.append('npm_mirror')
         set_str = ', '.join([s for s in settings if s])
         print("         Set the api's %s." % set_str)
 
-    except Exception as e:
-        print_error(e, DEBUG)
+        commit(journal)
 
+    except Exception as e:
         # silently restore the dataset
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
+
+
+@cli.command('sync-npm', help='Creates or updates a local mirror of npm '
+                              "package documents by following the registry's "
+                              '_changes feed from where the last sync left off '
+                              '(so only what changed since is downloaded). Use '
+                              '"set-api --npm-mirror" to get packages from it.')
+@argument('path', type=Path())
+@option('-u', '--url', default=None,
+        help='The couchdb replica to follow (defaults to '
+             'https://replicate.npmjs.com).')
+@option('-b', '--batch', type=int, default=500,
+        help='How many changes to get per request (defaults to 500).')
+@option('-n', '--max', 'max_changes', type=int,
+        help='The most changes to apply this sync (defaults to all).')
+@click.pass_context
+def sync_npm(ctx, path, url, batch, max_changes):
+    """Syncs a local npm mirror with the registry."""
+    from r2c_isg.apis.npm_mirror import NpmMirror, REPLICATE_URL
+
+    try:
+        mirror = NpmMirror(path)
+        try:
+            updated, deleted = mirror.sync(url or REPLICATE_URL, batch=batch,
+                                           max_changes=max_changes)
+            print('         Synced the npm mirror ({:,} packages updated, {:,} '
+                  'deleted); it has {:,} packages, up to sequence {}.'
+                  .format(updated, deleted, len(mirror), mirror.seq))
+        finally:
+            mirror.close()
+
+    except Exception as e:
+        fail(e)
 
 
 @cli.command('get')
@@ -348,44 +549,113 @@ def set_api(ctx, cache_dir, cache_timeout, nocache, github_pat):
         help='Downloads project metadata.')
 @option('-v', '--versions', type=Choice(['all', 'latest']),
         help='Downloads project versions.')
+@option('--only-missing', is_flag=True, default=False,
+        help='Only gets projects whose metadata/versions were never fetched '
+             '(eg, skipping repos whose metadata came with a github list).')
+@option('--retry-failed', is_flag=True, default=False,
+        help='Only gets projects whose last fetch failed (eg, HTTP 404 or '
+             '429); combines with --only-missing.')
+@option('--max-age', help='Skips projects fetched successfully within this '
+                          'long (eg, "12h" or "7d"); everything else is '
+                          'fetched.')
+@option('--target', type=int,
+        help='Stops once this many projects have succeeded, keeping only '
+             'them (see --where).')
+@option('--where', help='A filter expression (see "filter") that projects '
+                        'must match to succeed, on top of being fetched '
+                        'without errors and having at least one version '
+                        '(with -v); projects that fail are dropped.')
+@option('--order', help='Gets the projects in this order instead of the '
+                        "dataset's (sort keywords; see \"sort\"), eg, "
+                        '"desc downloads".')
+@option('--budget', help='Stops getting projects after this long (eg, '
+                         '"20m"), keeping the ones already got.')
+@option('--workers', type=int, default=1,
+        help='How many projects to get at once (defaults to 1); without '
+             '--target or --where, projects that fail are kept.')
+@option('--dump', type=Path(exists=True),
+        help="Gets projects from a local dump of the registry's api json (a "
+             'file or directory; eg, an npm _all_docs export) first, and '
+             'only gets the projects it lacks from the api.')
+@option('-r', '--resume', is_flag=True, default=False,
+        help="Resumes the last get that didn't finish (eg, after an api "
+             'error or ctrl-c), skipping the projects it finished; takes its '
+             'options from the unfinished get.')
+@option('-c', '--checkpoint', 'checkpoint_dir', type=Path(),
+        default=CHECKPOINT_DIR,
+        help='Where get saves its progress for --resume (defaults to %s).'
+             % CHECKPOINT_DIR)
 @click.pass_context
-def get(ctx, metadata, versions):
+def get(ctx, metadata, versions, only_missing, retry_failed, max_age, target,
+        where, order, budget, workers, dump, resume, checkpoint_dir):
     """Downloads project and version information."""
-    backup_ds = None
-    rolled_back = False
-
-    # load project metadata
-    if metadata:
-        try:
-            ds = get_dataset(ctx)
-            backup_ds = deepcopy(ds)
-
-            ds.get_projects_meta()
+    from r2c_isg.structures.checkpoint import Checkpoint
+
+    journal = begin(ctx)
+
+    # the get's options (saved with its checkpoint)
+    job = {
+        'metadata': metadata,
+        'versions': versions,
+        'only_missing': only_missing,
+        'retry_failed': retry_failed,
+        'max_age': max_age,
+        'target': target,
+        'where': where,
+        'order': order,
+        'budget': budget,
+        'workers': workers,
+        'dump': dump
+    }
+
+    # Note: Every get saves its progress to a checkpoint (see Checkpoint),
+    # which is deleted once the get has finished.
+    try:
+        if resume:
+            checkpoint = resume_get(ctx, journal, job, checkpoint_dir)
+        calls = get_calls(job)
+        if not resume:
+            checkpoint = Checkpoint.start(checkpoint_dir, get_dataset(ctx),
+                                          **job)
 
-        except Exception as e:
-            print_error(e, DEBUG)
+    except Exception as e:
+        fail(e, journal)
+        return
 
-            # roll back the db
-            ctx.obj['dataset'] = backup_ds
-            rolled_back = True
+    except BaseException:
+        # eg, ctrl-c
+        journal.rollback()
+        raise
 
-    # load project versions
-    if versions:
-        try:
-            ds = get_dataset(ctx)
-            backup_ds = deepcopy(ds)
+    finished = False
+    try:
+        ds = get_dataset(ctx)
+        for call in calls:
+            call(ds, checkpoint)
+        finished = True
 
-            ds.get_project_versions(historical=versions)
+    except Exception as e:
+        # roll back the db (the checkpoint keeps the progress)
+        fail(e, journal)
+        print('         The dataset was not modified.')
 
-        except Exception as e:
-            print_error(e, DEBUG)
+    except BaseException:
+        # Note: Ctrl-c (KeyboardInterrupt) isn't an Exception; the get is
+        # still rolled back as a whole (and its checkpoint closed, below)
+        # before it stops the command.
+        journal.rollback()
+        raise
 
-            # roll back the db
-            ctx.obj['dataset'] = backup_ds
-            rolled_back = True
+    finally:
+        # keep the checkpoint unless everything finished (errors, ctrl-c)
+        if finished:
+            checkpoint.remove()
+        elif checkpoint.close():
+            print('         Progress was saved to %s; use "get --resume" to '
+                  'pick up where this get left off.' % checkpoint_dir)
 
-    if rolled_back:
-        print('         The dataset was not modified.')
+    if finished:
+        commit(journal)
 
 
 @cli.command('trim', help='Trims to the first N projects (default) or '
@@ -393,22 +663,24 @@ def get(ctx, metadata, versions):
 @argument('n', type=int)
 @option('-v', '--versions', 'on_versions', is_flag=True, default=False,
         help='Trim to N versions per project.')
+@option('-n', '--newest', is_flag=True, default=False,
+        help='Keeps the N newest versions per project instead of the first N '
+             '(by version number as per PEP 440/semver, or by date for '
+             'commits); use with -v.')
 @click.pass_context
-def trim(ctx, n, on_versions):
+def trim(ctx, n, on_versions, newest):
     """Trims projects or versions from a dataset."""
-    backup_ds = None
+    journal = begin(ctx)
 
     try:
         ds = get_dataset(ctx)
-        backup_ds = deepcopy(ds)
+        ds.trim(n, on_versions, newest)
 
-        ds.trim(n, on_versions)
+        commit(journal)
 
     except Exception as e:
-        print_error(e, DEBUG)
-
         # roll back the db
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
         print('         The dataset was not modified.')
 
 
@@ -423,7 +695,10 @@ def trim(ctx, n, on_versions):
                   '- The words "asc" and "desc"\n\n'
                   'All values are sorted in ascending order by default. The '
                   'first keyword in the string is the primary sort key, the '
-                  'next the secondary, and so on.\n\n'
+                  'next the secondary, and so on. Version strings '
+                  '("v.version") are sorted by their version numbers, as '
+                  'per PEP 440 for pypi and semver for npm (eg, 1.9 comes '
+                  'before 1.10); github commits are sorted by date.\n\n'
                   'Example: The string "uuids.name meta.url downloads desc '
                   'v.version_str v.date" would sort the dataset by ascending '
                   'project name, url, and download count; and descending '
@@ -434,19 +709,121 @@ def trim(ctx, n, on_versions):
 @click.pass_context
 def sort(ctx, keywords_string):
     """Sorts a dataset."""
-    backup_ds = None
+    journal = begin(ctx)
 
     try:
         ds = get_dataset(ctx)
-        backup_ds = deepcopy(ds)
-
         ds.sort(keywords_string.split())
 
+        commit(journal)
+
     except Exception as e:
-        print_error(e, DEBUG)
+        # roll back the db
+        fail(e, journal)
+        print('         The dataset was not modified.')
 
+
+@cli.command('top', help='Keeps the top N projects (default) or the top N '
+                         'versions per project, as ordered by a sort keyword '
+                         'string (see "sort"). Equivalent to a sort followed '
+                         'by a trim, but much faster on large datasets.')
+@argument('n', type=int)
+@argument('keywords_string', type=str)
+@option('-v', '--versions', 'on_versions', is_flag=True, default=False,
+        help='Keep the top N versions per project.')
+@click.pass_context
+def top(ctx, n, keywords_string, on_versions):
+    """Keeps the top projects or versions of a dataset."""
+    journal = begin(ctx)
+
+    try:
+        ds = get_dataset(ctx)
+        ds.top(n, keywords_string.split(), on_versions)
+
+        commit(journal)
+
+    except Exception as e:
+        # roll back the db
+        fail(e, journal)
+        print('         The dataset was not modified.')
+
+
+@cli.command('filter',
+             help='Keeps only the projects and versions matching an '
+                  'expression, eg, "stargazers_count > 1000 and v.date >= '
+                  '2019-01-01". Keys use the same syntax as "sort" and are '
+                  'compared to values using =, !=, <, <=, > and >=; '
+                  'comparisons can be combined with "and", "or", "not" and '
+                  'parentheses. Strings are compared case-insensitively, '
+                  'and comparisons on missing values are false. Project '
+                  'clauses drop projects and version clauses drop versions; '
+                  'clauses joined by "or" must all be on one or the other.')
+@argument('expression', type=str)
+@click.pass_context
+def filter_(ctx, expression):
+    """Filters the projects and versions of a dataset."""
+    journal = begin(ctx)
+
+    try:
+        ds = get_dataset(ctx)
+        ds.filter(expression)
+
+        commit(journal)
+
+    except Exception as e:
+        # roll back the db
+        fail(e, journal)
+        print('         The dataset was not modified.')
+
+
+@cli.command('dedupe', help='Drops projects that duplicate an earlier '
+                            'project, ie, the same project spelled '
+                            'differently (http vs https, letter case, a '
+                            'trailing slash or .git; PEP 503 names for pypi; '
+                            'owner/name for github).')
+@option('-m', '--merge-versions', is_flag=True, default=False,
+        help="Moves duplicates' versions into the project that's kept.")
+@click.pass_context
+def dedupe(ctx, merge_versions):
+    """Drops duplicate projects from a dataset."""
+    journal = begin(ctx)
+
+    try:
+        ds = get_dataset(ctx)
+        ds.dedupe(merge_versions)
+
+        commit(journal)
+
+    except Exception as e:
         # roll back the db
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
+        print('         The dataset was not modified.')
+
+
+@cli.command('expand-deps', help="Adds the projects' dependencies (npm and "
+                                 'pypi only), their dependencies, and so on, '
+                                 "as per the projects' metadata (which is "
+                                 'got as needed, once per project).')
+@option('-d', '--depth', type=int,
+        help='How many levels of dependencies to add (defaults to all).')
+@option('-n', '--max', 'max_projects', type=int,
+        help='The most projects to add.')
+@option('-w', '--workers', type=int, default=4,
+        help='How many projects to get at once (defaults to 4).')
+@click.pass_context
+def expand_deps(ctx, depth, max_projects, workers):
+    """Adds projects' transitive dependencies to a dataset."""
+    journal = begin(ctx)
+
+    try:
+        ds = get_dataset(ctx)
+        ds.expand_deps(depth, max_projects, workers)
+
+        commit(journal)
+
+    except Exception as e:
+        # roll back the db
+        fail(e, journal)
         print('         The dataset was not modified.')
 
 
@@ -456,30 +833,60 @@ def sort(ctx, keywords_string):
 @option('-v', '--versions', 'on_versions', is_flag=True, default=False,
         help='Sample N versions per project.')
 @option('-s', '--seed', type=str, help='Sets the random seed.')
+@option('-w', '--weight', type=str,
+        help='Weights the sample by a numeric key (eg, download_count or '
+             'stargazers_count), so larger values are more likely to be '
+             'sampled. Items without a positive value are never sampled.')
+@option('-i', '--inverse', is_flag=True, default=False,
+        help='Weights the sample by the inverse of --weight, so smaller '
+             'values (eg, dependents_rank) are more likely to be sampled.')
+@option('-t', '--strata', type=str,
+        help='Samples N projects/versions per value of a key (eg, org).')
+@option('-H', '--hashed', is_flag=True, default=False,
+        help='Samples by a (seeded) hash of project/version names instead of '
+             'at random, so projects stay sampled as a dataset grows unless '
+             'a new project displaces them.')
 @click.pass_context
-def sample(ctx, n, on_versions, seed):
+def sample(ctx, n, on_versions, seed, weight, inverse, strata, hashed):
     """Samples projects or versions from a dataset."""
-    backup_ds = None
+    journal = begin(ctx)
 
     try:
         ds = get_dataset(ctx)
-        backup_ds = deepcopy(ds)
+        ds.sample(n, on_versions, seed, weight, inverse, strata, hashed)
 
-        ds.sample(n, on_versions, seed)
+        commit(journal)
 
     except Exception as e:
-        print_error(e, DEBUG)
-
         # roll back the db
-        ctx.obj['dataset'] = backup_ds
+        fail(e, journal)
         print('         The dataset was not modified.')
 
 
+@cli.command('undo', help='Undoes the last command that changed the dataset '
+                          '(up to %d commands back).' % UNDO_LEVELS)
+@click.pass_context
+def undo(ctx):
+    """Rolls back the last change to the dataset."""
+    try:
+        if not HISTORY:
+            raise Exception('There is nothing to undo.')
+
+        HISTORY[-1].rollback()
+        HISTORY.pop()
+        print('         Undid the last change to the dataset.')
+
+    except Exception as e:
+        fail(e)
+
+
 @cli.command('show', help='Jsonifies the dataset and opens it in the '
                           'native json viewer.')
 @click.pass_context
 def show(ctx):
     """Opens the complete dataset as a json for easier review."""
+    import webbrowser
+
     try:
         ds = get_dataset(ctx)
         data_dict = ds.to_json()
@@ -494,7 +901,273 @@ def show(ctx):
         webbrowser.open_new('file://' + fullpath)
 
     except Exception as e:
-        print_error(e, DEBUG)
+        fail(e)
+
+
+@cli.command('run', help='Runs a script of shell commands, one per line '
+                         '(reads from stdin if no script is given). The '
+                         'script stops at the first failed command. Project '
+                         'trims, samples and dedupes are moved ahead of any '
+                         '"get" commands they follow, so only the projects '
+                         'that are kept get downloaded; so are filters and '
+                         'weighted/stratified samples, if the fields they use '
+                         'are already loaded. A json summary '
+                         'of how long each step took is written to stderr.')
+@argument('script', type=click.File('r'), default='-')
+@option('-t', '--timings', type=Path(),
+        help='Writes the json timing summary to a file instead of stderr.')
+@click.pass_context
+def run(ctx, script, timings):
+    """Runs a script of shell commands non-interactively."""
+    from r2c_isg import util
+
+    # parse every line up front, so typos fail before anything is fetched
+    steps = []
+    for line_num, line in enumerate(script, start=1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        args = shlex.split(line)
+        command = cli.get_command(ctx, args[0])
+        if not command or args[0] == 'run':
+            raise click.UsageError('Line %d: Unrecognized command "%s".'
+                                   % (line_num, args[0]))
+        try:
+            sub_ctx = command.make_context(args[0], args[1:], parent=ctx)
+        except click.UsageError as e:
+            raise click.UsageError('Line %d: %s' % (line_num, e.message))
+
+        step = {'line': line_num, 'command': line, 'ctx': sub_ctx}
+        try:
+            step.update(compile_step(args[0], sub_ctx.params))
+        except Exception as e:
+            raise click.UsageError('Line %d: %s' % (line_num, e))
+
+        steps.append(step)
+
+    # run the steps (with progress bars and rollback copies disabled)
+    global BATCH
+    BATCH, util.PROGRESS = True, False
+    summary = []
+    failed = False
+    start = time.perf_counter()
+    try:
+        steps = plan(steps)
+        while steps:
+            step = steps.pop(0)
+
+            # steps written before this one that haven't run yet (it was
+            # moved ahead of them; see "plan")
+            ahead = [s for s in steps if s['line'] < step['line']]
+            if ahead:
+                ds = ctx.obj.get('dataset', None)
+                if 'ready' in step and not (ds and step['ready'](ds)):
+                    # the step needs data that hasn't been fetched yet; run it
+                    # where it was written instead, along with any steps that
+                    # were moved up behind it (they were written after it)
+                    i = steps.index(ahead[-1])
+                    behind = [s for s in steps[:i] if s['line'] > step['line']]
+                    steps = [s for s in steps if s not in behind]
+                    i = steps.index(ahead[-1])
+                    steps[i + 1:i + 1] = [step] + behind
+                    continue
+
+                passed = [s for s in ahead if s['ctx'].info_name == 'get']
+                if passed:
+                    print('         Running "%s" (line %d) before "%s" (line '
+                          '%d).' % (step['command'], step['line'],
+                                    passed[0]['command'], passed[0]['line']))
+
+            step_start = time.perf_counter()
+            try:
+                with step['ctx'] as sub_ctx:
+                    sub_ctx.command.invoke(sub_ctx)
+                status = 'ok'
+
+            except Exception as e:
+                print_error(e, DEBUG)
+                print('         Stopped the script at line %d.' % step['line'])
+                status = 'failed'
+                failed = True
+
+            summary.append({
+                'line': step['line'],
+                'command': step['command'],
+                'status': status,
+                'seconds': round(time.perf_counter() - step_start, 6)
+            })
+            if failed:
+                break
+
+    finally:
+        BATCH, util.PROGRESS = False, True
+
+    # emit the timing summary
+    summary = {
+        'status': 'failed' if failed else 'ok',
+        'seconds': round(time.perf_counter() - start, 6),
+        'steps': summary
+    }
+    if timings:
+        with open(timings, 'w') as file:
+            json.dump(summary, file, indent=4)
+    else:
+        click.echo(json.dumps(summary), err=True)
+
+    if failed:
+        ctx.exit(1)
+
+
+def compile_step(name: str, params: dict) -> dict:
+    """Compiles anything a script step needs up front (eg, filters), and
+    how to tell whether a moved step's fields are loaded (see "plan")."""
+    if name == 'filter':
+        from r2c_isg.functions.filter import Filter
+
+        f = Filter(params['expression'])
+        return {'filter': f, 'ready': f.ready}
+
+    if name == 'sample' and (params['weight'] or params['strata']):
+        from r2c_isg.functions._keys import SortKey, loaded
+
+        # weighted/stratified samples depend on the keys' values
+        keys = [SortKey(k) for k in [params['weight'], params['strata']]
+                if k]
+        return {'ready': lambda ds: loaded(ds, keys)}
+
+    return {}
+
+
+def plan(steps: list) -> list:
+    """Reorders script steps so project-level trims, samples and dedupes run
+    before any "get" commands they follow (they don't depend on fetched
+    data).
+    Filters and weighted/stratified samples are moved the same way, but are
+    only run early if the fields they use turn out to be loaded already;
+    otherwise "run" puts them back where they were written, along with any
+    steps that were moved up behind them."""
+    planned = []
+    for step in steps:
+        i = len(planned)
+
+        name, params = step['ctx'].info_name, step['ctx'].params
+        if name in ['trim', 'sample', 'filter', 'dedupe'] \
+                and not params.get('on_versions', False):
+            # move the step back past any commuting commands...
+            while i > 0 and commutes(step, planned[i - 1]):
+                i -= 1
+
+            # ...but only bother if that saves us a download
+            if not any(s['ctx'].info_name == 'get' for s in planned[i:]):
+                i = len(planned)
+
+        planned.insert(i, step)
+
+    return planned
+
+
+def commutes(step: dict, other: dict) -> bool:
+    """Whether a script step can be moved ahead of another step."""
+    name = other['ctx'].info_name
+    if name not in COMMUTING:
+        return False
+
+    # resuming a get replaces the dataset with the checkpointed one
+    if name == 'get' and other['ctx'].params['resume']:
+        return False
+
+    # gets that stop early (or drop failures) change which projects the
+    # step sees
+    if name == 'get' and stops_early(other['ctx'].params):
+        return False
+
+    # version filters (and version merges) must run after the versions
+    # they use are fetched
+    if name == 'get' and other['ctx'].params['versions'] \
+            and (('filter' in step and step['filter'].on_versions)
+                 or step['ctx'].params.get('merge_versions', False)):
+        return False
+
+    return True
+
+
+def resume_get(ctx, journal: Journal, job: dict,
+               path: str) -> 'Checkpoint':
+    """Reopens the unfinished get's checkpoint: swaps in the dataset as of
+    its last finished project, and takes the get's options."""
+    from r2c_isg.structures.checkpoint import Checkpoint
+
+    checkpoint, ds = Checkpoint.resume(path)
+    ctx.obj['dataset'] = ds
+    if not BATCH and hasattr(ds.projects, 'savepoint'):
+        # hold back the changes to its store too (see begin)
+        journal.record(ds)
+
+    job.update([(k, checkpoint.job[k]) for k in job if k in checkpoint.job])
+    print('         Resuming get (metadata done for {:,} projects, '
+          'versions for {:,}).'.format(len(checkpoint.done['metadata']),
+                                       len(checkpoint.done['versions'])))
+
+    return checkpoint
+
+
+def get_calls(job: dict) -> list:
+    """Works out what a get calls on the dataset (each call takes the dataset
+    and the get's checkpoint), from its options."""
+    metadata, versions = job['metadata'], job['versions']
+
+    # which projects need fetching (see Project.needs_fetch)
+    needs = {
+        'only_missing': job['only_missing'],
+        'retry_failed': job['retry_failed'],
+        'max_age': parse_duration(job['max_age'])
+        if job['max_age'] else None
+    }
+
+    calls = []
+    if job['dump']:
+        # load what the registry dump has first
+        calls.append(lambda ds, _: ds.get_from_dump(
+            job['dump'], metadata=metadata, historical=versions))
+
+        # projects got from the dump are only got from the api if they're
+        # otherwise due (see Project.needs_fetch); the rest are the misses
+        if not any(needs.values()):
+            needs['only_missing'] = True
+
+    if stops_early(job):
+        # gets that stop early (or run concurrently) go project by project,
+        # loading project metadata and versions together; only --target
+        # and --where drop failures (see Dataset.get_until)
+        until = {
+            'target': job['target'],
+            'where': job['where'],
+            'order': job['order'],
+            'budget': parse_duration(job['budget'])
+            if job['budget'] else None,
+            'workers': job['workers']
+        }
+        calls.append(lambda ds, checkpoint: ds.get_until(
+            metadata=metadata, historical=versions, checkpoint=checkpoint,
+            **until, **needs))
+        return calls
+
+    if metadata:
+        calls.append(lambda ds, checkpoint: ds.get_projects_meta(
+            checkpoint=checkpoint, **needs))
+    if versions:
+        calls.append(lambda ds, checkpoint: ds.get_project_versions(
+            historical=versions, checkpoint=checkpoint, **needs))
+
+    return calls
+
+
+def stops_early(params: dict) -> bool:
+    """Whether a get's options make it go project by project (see
+    Dataset.get_until)."""
+    return bool(params['target'] or params['where'] or params['order']
+                or params['budget'] or params['workers'] != 1)
 
 
 def cleanup():
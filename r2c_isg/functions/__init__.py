@@ -1,10 +1,20 @@
 from .trim import trim
 from .sample import sample
 from .sort import sort
+from .top import top
+from .filter import filter
+from .dedupe import dedupe
+from .expand_deps import expand_deps
+from .get_from_dump import get_from_dump
 
 
 function_map = {
     'trim': trim,
     'sample': sample,
-    'sort': sort
+    'sort': sort,
+    'top': top,
+    'filter': filter,
+    'dedupe': dedupe,
+    'expand_deps': expand_deps,
+    'get_from_dump': get_from_dump
 }
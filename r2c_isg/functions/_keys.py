@@ -0,0 +1,219 @@
+from typing import Callable, List, Tuple, Union
+
+# placeholder for attributes that don't exist on a project/version
+_MISSING = object()
+
+
+class _Lowest(object):
+    """Sorts before any other value (and equal only to itself); sort keys
+    use it for missing attributes, so they sort as '' would among strings
+    but can also be compared with numbers."""
+    __slots__ = []
+
+    def __lt__(self, other) -> bool:
+        return other is not self
+
+    def __gt__(self, other) -> bool:
+        return False
+
+    def __eq__(self, other) -> bool:
+        return other is self
+
+    def __hash__(self):
+        return id(self)
+
+    def __repr__(self):
+        return "''"
+
+
+LOWEST = _Lowest()
+
+
+class Desc(object):
+    """Wraps a value so it sorts in reverse (for mixed asc/desc keys)."""
+    __slots__ = ['val']
+
+    def __init__(self, val):
+        self.val = val
+
+    def __lt__(self, other: 'Desc') -> bool:
+        if not isinstance(other, Desc):
+            return NotImplemented
+        return other.val < self.val
+
+    def __eq__(self, other: 'Desc') -> bool:
+        if not isinstance(other, Desc):
+            return NotImplemented
+        return self.val == other.val
+
+
+class SortKey(object):
+    """A single parsed sort keyword (eg, 'desc v.uuids.version')."""
+
+    def __init__(self, keyword: str, desc: bool = False):
+        # Note: Keywords can follow these formats:
+        #   'attr'               project attribute
+        #   'uuids.key'          project uuid
+        #   'meta.key'           project meta
+        #   'v.attr'             version attribute
+        #   'v.uuids.key'        version uuid
+        #   'v.meta.key'         version meta
+        self.keyword = keyword
+        self.desc = desc
+
+        k_list = keyword.split('.')
+
+        # determine if the key is on a project or a version
+        self.on_project = True
+        if k_list[0] == 'v':
+            self.on_project = False
+            k_list.pop(0)
+
+        self.attr = k_list[0]
+        self.key = None
+        if self.attr in ['uuids', 'meta']:
+            if len(k_list) < 2:
+                raise Exception("Invalid key '%s'; must be of the form "
+                                "'%s.key'." % (keyword, self.attr))
+            self.key = k_list[1]
+
+        # whether a project/version was missing this key
+        self.missing = False
+
+    def getter(self, lower: bool = True, missing: object = '') -> Callable:
+        """Builds a function that extracts this key's value from an object.
+        Strings are lowercased and missing attributes are returned as
+        missing ('' by default)."""
+        attr, key = self.attr, self.key
+
+        if key:
+            # uuid/meta value
+            def get_func(o: object):
+                funcs = o.uuids_ if attr == 'uuids' else o.meta_
+                func = funcs.get(key, None)
+                if func is None:
+                    raise Exception('Nonexistent key %s.' % self.keyword)
+                return func()
+
+        elif attr == 'version' and not self.on_project:
+            # parsed version string (cached on the version itself)
+            # Note: Versions used to be compared as strings (so 1.10 came
+            # before 1.9); 'v.uuids.version' still sorts on the raw string.
+            def get_func(o: object):
+                v_key = o.version_key()
+                if v_key is None:
+                    self.missing = True
+                    return ()
+                return v_key
+
+        else:
+            # regular attribute
+            def get_func(o: object):
+                val = getattr(o, attr, _MISSING)
+                if val is _MISSING:
+                    self.missing = True
+                    return missing
+                if lower and isinstance(val, str):
+                    return val.lower()
+                return val
+
+        return get_func
+
+    def __repr__(self):
+        return '%s %s' % ('desc' if self.desc else 'asc', self.keyword)
+
+
+def parse_keys(params: Union[str, List[str]]) -> List[SortKey]:
+    """Parses a list (or string) of sort keywords. Sort orders apply to all
+    of the keywords that follow them; the default is ascending."""
+    if isinstance(params, str):
+        params = params.split()
+
+    keys = []
+    desc = False
+    for param in params:
+        if param in ['asc', 'desc']:
+            desc = (param == 'desc')
+        else:
+            keys.append(SortKey(param, desc))
+
+    if not keys:
+        raise Exception('No sort keys were provided.')
+
+    return keys
+
+
+def sort_passes(keys: List[SortKey]) -> List[Tuple[Callable, bool]]:
+    """Returns the (key function, reverse) pairs of the stable sorts that,
+    applied in order, sort on all of the given keys."""
+    # Note: One stable sort per key (least significant key first) is faster
+    # in CPython than a single sort on a composite tuple key; building and
+    # comparing the tuples costs more than the extra pass over each key.
+    return [(k.getter(missing=LOWEST), k.desc) for k in reversed(keys)]
+
+
+def composite_key(keys: List[SortKey]) -> Tuple[Callable, bool]:
+    """Builds a single key function (and reverse flag) that orders objects
+    on all of the given keys at once, in priority order. Keys whose order
+    differs from the primary key's are inverted."""
+    reverse = keys[0].desc
+
+    # Note: Every inverted value is wrapped (numbers too, rather than
+    # negated), so a missing value (LOWEST) is never compared with a bare
+    # number on one side and a Desc on the other.
+    def inverted(get_func: Callable) -> Callable:
+        return lambda o: Desc(get_func(o))
+
+    getters = [k.getter(missing=LOWEST) for k in keys]
+    getters = [g if k.desc == reverse else inverted(g)
+               for k, g in zip(keys, getters)]
+    if len(getters) == 1:
+        return getters[0], reverse
+
+    return lambda o: tuple([g(o) for g in getters]), reverse
+
+
+def _present(o: object, k: SortKey) -> bool:
+    """Whether an object has a value for a key."""
+    if k.key:
+        func = (o.uuids_ if k.attr == 'uuids' else o.meta_).get(k.key, None)
+        if func is None:
+            return False
+        try:
+            func()
+        except AttributeError:
+            return False
+        return True
+
+    if k.attr == 'version' and not k.on_project:
+        return o.get_version() is not None
+
+    return getattr(o, k.attr, _MISSING) is not _MISSING
+
+
+def loaded(ds, keys: List[SortKey]) -> bool:
+    """Whether every project/version in a dataset has a value for each of
+    the keys (ie, the keys don't depend on data that hasn't been fetched)."""
+    p_keys = [k for k in keys if k.on_project]
+    v_keys = [k for k in keys if not k.on_project]
+
+    projects = ds.projects
+    for p in (projects.scan() if hasattr(projects, 'scan') else projects):
+        for k in p_keys:
+            if not _present(p, k):
+                return False
+        for k in v_keys:
+            for v in p.versions:
+                if not _present(v, k):
+                    return False
+
+    return True
+
+
+def warn_missing(keys: List[SortKey]) -> None:
+    """Warns about any keys that some projects/versions were missing."""
+    for k in keys:
+        if k.missing:
+            print("         Warning: Key '%s' was not found in all "
+                  "projects/versions; assuming '' for those items."
+                  % k.keyword)
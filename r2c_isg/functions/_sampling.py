@@ -0,0 +1,294 @@
+import math
+import heapq
+import random
+from typing import Callable, Iterable, List, Optional
+
+from r2c_isg.functions._keys import SortKey
+
+# largest reservoir threshold that still has a usable log(1 - w)
+_MAX_W = 1.0 - 2 ** -53
+
+
+def _uniform(rng: random.Random) -> float:
+    """Returns a random number in (0, 1)."""
+    u = rng.random()
+    while u == 0.0:
+        u = rng.random()
+    return u
+
+
+class Reservoir(object):
+    """A uniform random sample of k items from a stream of unknown length,
+    kept in O(k) memory.
+
+    Uses Li's "Algorithm L", which draws how many items to skip instead of
+    a random number per item. Every item has the same chance of being
+    kept, and a given seed always keeps the same positions of a stream,
+    whether the stream is a list of projects or the rows of a file.
+    """
+
+    # whether items are kept based on their values (see sample_build)
+    needs_values = False
+
+    def __init__(self, k: int, seed: str = None, rng: random.Random = None):
+        self.k = k
+        self.random = rng or random.Random(seed)
+
+        # number of items offered so far
+        self.count = 0
+
+        # (stream position, item) of the kept items
+        self._slots = []
+
+        # position of the next item to keep, once the reservoir is full
+        self._w = 1.0
+        self._next = k - 1
+        if k > 0:
+            self._skip()
+
+    def _skip(self) -> None:
+        self._w *= math.exp(math.log(_uniform(self.random)) / self.k)
+        self._next += int(math.log(_uniform(self.random))
+                          / math.log1p(-min(self._w, _MAX_W))) + 1
+
+    def offer(self, item) -> bool:
+        """Offers the next item of the stream; returns whether it was kept
+        (for now--it may be replaced by a later item)."""
+        i = self.count
+        self.count += 1
+
+        if i < self.k:
+            self._slots.append((i, item))
+            return True
+
+        if i < self._next:
+            return False
+
+        self._slots[self.random.randrange(self.k)] = (i, item)
+        self._skip()
+        return True
+
+    def extend(self, items: Iterable) -> 'Reservoir':
+        """Offers every item of an iterable."""
+        for item in items:
+            self.offer(item)
+        return self
+
+    def kept(self) -> list:
+        """(stream position, item) of the kept items."""
+        return self._slots
+
+    @property
+    def indices(self) -> List[int]:
+        """Stream positions of the kept items (in stream order)."""
+        return sorted([i for i, _ in self.kept()])
+
+    @property
+    def items(self) -> list:
+        """The kept items (in stream order)."""
+        return [item for _, item in sorted(self.kept(), key=lambda s: s[0])]
+
+
+class WeightedReservoir(Reservoir):
+    """A weighted random sample of k items from a stream, without
+    replacement (Efraimidis & Spirakis' "A-Res"): each item gets the key
+    u ** (1 / weight) for a random u, and the k largest keys are kept in a
+    min-heap. Items without a positive weight are never kept.
+
+    If a uniform function is given, each item's u comes from the item itself
+    (eg, a hash of its name) instead of from the random number generator,
+    so whether an item is kept doesn't depend on the rest of the stream."""
+
+    needs_values = True
+
+    def __init__(self, k: int, weight: Callable = None, seed: str = None,
+                 rng: random.Random = None, uniform: Callable = None):
+        super().__init__(0, seed=seed, rng=rng)
+        self.k = k
+        self.weight = weight or (lambda item: 1.0)
+        self.uniform = uniform or (lambda item: _uniform(self.random))
+
+        # min-heap of (key, stream position, item)
+        self._heap = []
+
+    def offer(self, item) -> bool:
+        i = self.count
+        self.count += 1
+
+        w = self.weight(item)
+        if not w > 0:
+            return False
+
+        # compare log(u) / weight instead of u ** (1 / weight), which
+        # underflows for small weights
+        key = math.log(self.uniform(item)) / w
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, (key, i, item))
+            return True
+
+        if self.k and key > self._heap[0][0]:
+            heapq.heapreplace(self._heap, (key, i, item))
+            return True
+
+        return False
+
+    def kept(self) -> list:
+        return [(i, item) for _, i, item in self._heap]
+
+
+class StratifiedReservoir(Reservoir):
+    """A sample of k items from each stratum of a stream (eg, k projects
+    per license), kept in a separate reservoir per stratum."""
+
+    needs_values = True
+
+    def __init__(self, k: int, stratum: Callable, make: Callable):
+        super().__init__(0)
+        self.k = k
+        self.stratum = stratum
+        self.make = make
+
+        # stratum -> reservoir of (stream position, item)
+        self._strata = {}
+
+    def offer(self, item) -> bool:
+        i = self.count
+        self.count += 1
+
+        s = self.stratum(item)
+        if s not in self._strata:
+            self._strata[s] = self.make()
+
+        return self._strata[s].offer((i, item))
+
+    def kept(self) -> list:
+        return [pair for res in self._strata.values() for _, pair
+                in res.kept()]
+
+
+def _weight_func(weight: str, inverse: bool) -> Callable:
+    """Builds a function that gets a (positive) sampling weight."""
+    get_value = SortKey(weight).getter(lower=False)
+
+    def get_weight(o: object) -> float:
+        try:
+            w = float(get_value(o))
+        except (TypeError, ValueError):
+            return 0.0
+        if inverse:
+            # eg, rankings (where lower is more popular)
+            return 1.0 / w if w > 0 else 0.0
+        return w
+
+    return get_weight
+
+
+def identity(o: object) -> str:
+    """A project's/version's identity (eg, its name), for hashing."""
+    # Note: The first uuid (by key) that has a value is used, so ids
+    # added later (eg, a url from fetched metadata) don't change it.
+    uuids = getattr(o, 'uuids_', {})
+    for key in sorted(uuids):
+        try:
+            val = uuids[key]()
+        except AttributeError:
+            continue
+        if val is not None:
+            return str(val).lower()
+
+    # eg, a group of raw rows (see sample_groups)
+    return str(getattr(o, 'key_', '')).lower()
+
+
+def _hash_func(seed: str) -> Callable:
+    """Builds a function that hashes an item's identity (keyed by the seed)
+    to a number in (0, 1)."""
+    import hashlib
+
+    key = hashlib.blake2b(str(seed).encode(), digest_size=32).digest()
+
+    def get_hash(o: object) -> float:
+        digest = hashlib.blake2b(identity(o).encode(), key=key,
+                                 digest_size=8).digest()
+        return (int.from_bytes(digest, 'big') + 0.5) / 2 ** 64
+
+    return get_hash
+
+
+def reservoir(n: int, seed: str = None, rng: random.Random = None,
+              weight: str = None, inverse: bool = False,
+              strata: str = None, hashed: bool = False) -> Reservoir:
+    """Builds a reservoir from a sampling spec (eg, {'n': 100, 'seed': 1,
+    'weight': 'download_count'})."""
+    rng = rng or random.Random(seed)
+    get_weight = _weight_func(weight, inverse) if weight else None
+
+    # Note: Hashed samples keep the n items with the highest (keyed) hashes.
+    # Whether an item is kept depends only on its own hash and the lowest
+    # hash kept so far, so a sample stays the same as a dataset grows,
+    # except where new items hash above old ones.
+    get_hash = _hash_func(seed) if hashed else None
+
+    if strata:
+        # each stratum's reservoir holds (stream position, item) pairs
+        def on_item(func: Callable) -> Optional[Callable]:
+            return func and (lambda pair: func(pair[1]))
+
+        def make() -> Reservoir:
+            if get_weight or get_hash:
+                return WeightedReservoir(n, on_item(get_weight), rng=rng,
+                                         uniform=on_item(get_hash))
+            return Reservoir(n, rng=rng)
+
+        return StratifiedReservoir(n, SortKey(strata).getter(), make)
+
+    if get_weight or get_hash:
+        return WeightedReservoir(n, get_weight, rng=rng, uniform=get_hash)
+
+    return Reservoir(n, rng=rng)
+
+
+def sample_build(rows: Iterable, spec: dict, build: Callable) -> list:
+    """Builds objects (eg, projects) from a stream of raw rows, sampling them
+    first if there's a sampling spec. Uniform samples are drawn from the raw
+    rows, so only the sampled objects are built; weighted and stratified
+    samples need the objects' values, so each object is built but only the
+    sampled ones are kept."""
+    if not spec:
+        return [build(row) for row in rows]
+
+    res = reservoir(**spec)
+    if res.needs_values:
+        return res.extend(build(row) for row in rows).items
+
+    return [build(row) for row in res.extend(rows).items]
+
+
+class _Group(object):
+    """The values of a group of rows (for weighted/stratified sampling)."""
+
+    def __init__(self, key, values: dict):
+        self.__dict__.update(values)
+        self.key_ = key
+
+
+def sample_groups(rows: Iterable, spec: dict, key: Callable,
+                  values: Callable = None) -> list:
+    """Samples a stream of rows by group (eg, all of a project's rows in a
+    file), keeping every row of the sampled groups. Groups are offered to
+    the reservoir in order of first appearance (weighted/stratified samples
+    use the values of a group's first row); rows are returned grouped, in
+    stream order."""
+    res = reservoir(**spec)
+
+    # group key -> rows (or None if the group wasn't kept when it appeared)
+    groups = {}
+    for row in rows:
+        k = key(row)
+        if k not in groups:
+            group = _Group(k, values(row) if values else {})
+            groups[k] = [] if res.offer(group) else None
+        if groups[k] is not None:
+            groups[k].append(row)
+
+    return [row for group in res.items for row in groups[group.key_]]
@@ -0,0 +1,59 @@
+from r2c_isg.structures import Dataset
+from r2c_isg.structures.journal import record
+
+
+def dedupe(ds: Dataset, merge_versions: bool = False) -> None:
+    """Drops projects that duplicate an earlier project (eg, the same repo
+    spelled differently), optionally moving their versions into the project
+    that's kept."""
+    # Note: Projects are matched on their canonical keys (see
+    # Project.canonical_key) in a single pass; the first spelling of each
+    # project is kept, in its original position.
+    projects = ds.projects
+    on_disk = hasattr(projects, 'scan')
+
+    # canonical key -> new position of the kept project
+    kept = {}
+    indices = []
+
+    # new position -> versions of the kept project's duplicates
+    extra = {}
+
+    for i, p in enumerate(projects.scan() if on_disk else projects):
+        key = p.canonical_key()
+        if key not in kept:
+            kept[key] = len(indices)
+            indices.append(i)
+        elif merge_versions and p.versions:
+            extra.setdefault(kept[key], []).extend(p.versions)
+
+    record(ds)
+    dropped = len(projects) - len(indices)
+    if on_disk:
+        # disk-backed projects are selected on disk by position
+        projects.select(indices)
+    else:
+        ds.projects = [projects[i] for i in indices]
+
+    # merge the duplicates' versions (skipping versions already present)
+    merged = 0
+    for j, versions in extra.items():
+        project = ds.projects[j]
+        record(project)
+        seen = {_version_id(v) for v in project.versions}
+        for v in versions:
+            v_id = _version_id(v)
+            if v_id not in seen:
+                seen.add(v_id)
+                project.versions.append(v)
+                merged += 1
+        if on_disk:
+            ds.projects[j] = project
+
+    print('         Deduped to {:,} projects ({:,} duplicates dropped, {:,} '
+          'versions merged).'.format(len(ds.projects), dropped, merged))
+
+
+def _version_id(v: object) -> tuple:
+    """A version's identifying values (eg, its version string/commit)."""
+    return tuple([str(func()) for _, func in sorted(v.uuids_.items())])
@@ -0,0 +1,105 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from r2c_isg.structures import Dataset, Project, project_map
+from r2c_isg.structures.journal import record
+from r2c_isg.util import progress
+
+# uuids of the dependencies that are added (looked up by name)
+_UUIDS = {
+    'name': lambda p: p.name
+}
+
+
+def expand_deps(ds: Dataset, depth: int = None, max_projects: int = None,
+                workers: int = 4) -> None:
+    """Adds the projects that the dataset's projects depend on (as per their
+    metadata), the projects those depend on, and so on, up to depth levels
+    deep and/or max_projects new projects."""
+    # Note: The dependency graph is walked breadth first, a level at a time,
+    # with each level's metadata fetched by a pool of workers. Projects are
+    # matched on their canonical keys (see Project.canonical_key), so every
+    # project is added, and its metadata fetched, only once (even when
+    # several projects share a dependency, or dependencies are circular).
+    if ds.registry not in ['npm', 'pypi']:
+        raise Exception('Dependencies can only be expanded for npm and pypi '
+                        'datasets.')
+    if not ds.api:
+        raise Exception('No API is associated with this dataset; '
+                        'cannot get project metadata.')
+    if workers < 1:
+        raise Exception('There must be at least 1 worker.')
+
+    projects = ds.projects
+    on_disk = hasattr(projects, 'scan')
+    p_class = project_map[ds.registry]
+
+    # the projects already in the dataset (and those missing metadata)
+    visited = set()
+    missing = []
+    for i, p in enumerate(projects.scan() if on_disk else projects):
+        visited.add(p.canonical_key())
+        if p.dependency_names() is None:
+            missing.append(i)
+
+    added = 0
+    failed = 0
+    levels = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def fetch(level: List[Project], desc: str) -> int:
+            """Fetches the metadata of a level's projects; returns the number
+            of requests that failed."""
+            statuses = pool.map(ds.api.get_project, level)
+            failures = 0
+            for p, status in zip(level, progress(
+                    statuses, total=len(level), unit='project', leave=False,
+                    desc='         %s' % desc)):
+                p.set_fetched('metadata', status)
+                failures += not 200 <= (status or 0) < 300
+            return failures
+
+        # get the metadata of any projects that don't have it yet
+        if missing:
+            level = [projects[i] for i in missing]
+            for p in level:
+                record(p)
+            failed += fetch(level, 'Getting project metadata')
+            if on_disk:
+                # write back the projects (they may have been paged out)
+                for i, p in zip(missing, level):
+                    projects[i] = p
+
+        record(ds)
+        current = projects.scan() if on_disk else list(projects)
+        full = False
+        while (depth is None or levels < depth) and not full:
+            # the next level: dependencies that haven't been seen yet
+            new = []
+            for p in current:
+                for name in p.dependency_names() or []:
+                    dep = p_class(uuids_=_UUIDS, name=name)
+                    key = dep.canonical_key()
+                    if key in visited:
+                        continue
+                    if max_projects is not None and \
+                            added + len(new) >= max_projects:
+                        full = True
+                        break
+                    visited.add(key)
+                    new.append(dep)
+                if full:
+                    break
+
+            if not new:
+                break
+
+            levels += 1
+            failed += fetch(new, 'Getting level %d dependencies' % levels)
+            for dep in new:
+                projects.append(dep)
+            added += len(new)
+            current = new
+
+    print('         Added {:,} dependencies from {:,} levels ({:,} metadata '
+          'requests failed); the dataset now has {:,} projects.'
+          .format(added, levels, failed, len(ds.projects)))
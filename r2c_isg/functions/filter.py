@@ -0,0 +1,302 @@
+import re
+import operator
+from typing import Callable, List, Optional
+
+from r2c_isg.structures import Dataset
+from r2c_isg.structures.journal import record
+from r2c_isg.functions._keys import SortKey, loaded
+
+# placeholder for values that don't exist on a project/version
+_MISSING = object()
+
+_TOKENS = re.compile(r'\s*(?:(==|!=|<=|>=|=|<|>)|(\(|\))|'
+                     r'("[^"]*"|\'[^\']*\')|([^\s()<>=!"\']+))')
+
+_OPERATORS = {
+    '=': operator.eq,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+_LITERALS = {'true': True, 'false': False, 'null': None, 'none': None}
+
+
+class Filter(object):
+    """A filter expression, compiled once into predicates over projects and
+    versions.
+
+    Expressions compare keys (same syntax as sort, eg, 'stargazers_count',
+    'uuids.name' or 'v.date') to values using =, !=, <, <=, > and >=, and
+    can be combined with 'and', 'or', 'not' and parentheses. Strings are
+    compared case-insensitively, and comparisons on missing values are false.
+    Clauses joined by a top-level 'and' can be on projects or on versions;
+    anything joined by 'or' must be on one or the other.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.keys: List[SortKey] = []
+
+        # parse the expression into a tree
+        self._tokens = self._tokenize(expression)
+        tree = self._parse_or()
+        if self._tokens:
+            self._error("unexpected '%s'" % self._tokens[0][1])
+
+        # split the top-level 'and' into project and version clauses
+        terms = tree[1] if tree[0] == 'and' else [tree]
+        p_preds, v_preds = [], []
+        for term in terms:
+            keys = self._keys(term)
+            if all(k.on_project for k in keys):
+                p_preds.append(self._compile(term))
+            elif not any(k.on_project for k in keys):
+                v_preds.append(self._compile(term))
+            else:
+                self._error("clauses joined by 'or' must all be on projects "
+                            'or all be on versions')
+
+        self.on_projects = _all(p_preds) if p_preds else None
+        self.on_versions = _all(v_preds) if v_preds else None
+
+    def _error(self, msg: str) -> None:
+        raise Exception('Invalid filter "%s": %s.' % (self.expression, msg))
+
+    def _tokenize(self, expression: str) -> list:
+        tokens = []
+        pos = 0
+        expression = expression.strip()
+        while pos < len(expression):
+            match = _TOKENS.match(expression, pos)
+            if not match:
+                self._error("unexpected '%s'" % expression[pos:])
+            op, paren, quoted, word = match.groups()
+            if op:
+                tokens.append(('op', op))
+            elif paren:
+                tokens.append((paren, paren))
+            elif quoted:
+                tokens.append(('quoted', quoted[1:-1]))
+            elif word.lower() in ['and', 'or', 'not']:
+                tokens.append((word.lower(), word))
+            else:
+                tokens.append(('word', word))
+            pos = match.end()
+
+        return tokens
+
+    def _peek(self) -> Optional[str]:
+        return self._tokens[0][0] if self._tokens else None
+
+    def _next(self, *kinds: str) -> tuple:
+        if not self._tokens:
+            self._error('unexpected end of expression')
+        if kinds and self._tokens[0][0] not in kinds:
+            self._error("unexpected '%s'" % self._tokens[0][1])
+        return self._tokens.pop(0)
+
+    def _parse_or(self) -> tuple:
+        # or_expr: and_expr ('or' and_expr)*
+        nodes = [self._parse_and()]
+        while self._peek() == 'or':
+            self._next()
+            nodes.append(self._parse_and())
+        return ('or', nodes) if len(nodes) > 1 else nodes[0]
+
+    def _parse_and(self) -> tuple:
+        # and_expr: not_expr ('and' not_expr)*
+        nodes = [self._parse_not()]
+        while self._peek() == 'and':
+            self._next()
+            nodes.append(self._parse_not())
+        return ('and', nodes) if len(nodes) > 1 else nodes[0]
+
+    def _parse_not(self) -> tuple:
+        # not_expr: 'not' not_expr | '(' or_expr ')' | key op value
+        if self._peek() == 'not':
+            self._next()
+            return ('not', self._parse_not())
+
+        if self._peek() == '(':
+            self._next()
+            node = self._parse_or()
+            self._next(')')
+            return node
+
+        k = SortKey(self._next('word')[1])
+        op = self._next('op')[1]
+        kind, text = self._next('word', 'quoted')
+        self.keys.append(k)
+
+        return ('cmp', k, _OPERATORS[op], text, kind == 'quoted')
+
+    def _keys(self, node: tuple) -> List[SortKey]:
+        if node[0] == 'cmp':
+            return [node[1]]
+        if node[0] == 'not':
+            return self._keys(node[1])
+        return [k for child in node[1] for k in self._keys(child)]
+
+    def _compile(self, node: tuple) -> Callable:
+        if node[0] == 'and':
+            return _all([self._compile(child) for child in node[1]])
+        if node[0] == 'or':
+            return _any([self._compile(child) for child in node[1]])
+        if node[0] == 'not':
+            pred = self._compile(node[1])
+            return lambda o: not pred(o)
+
+        _, k, op, text, quoted = node
+        return _compare(k, op, text, quoted)
+
+    def ready(self, ds: Dataset) -> bool:
+        """Whether every key in the filter is already present on every
+        project/version (ie, the filter doesn't depend on fetched data)."""
+        return loaded(ds, self.keys)
+
+    def __repr__(self):
+        return 'Filter(%s)' % self.expression
+
+
+def _all(preds: List[Callable]) -> Callable:
+    if len(preds) == 1:
+        return preds[0]
+    return lambda o: all(pred(o) for pred in preds)
+
+
+def _any(preds: List[Callable]) -> Callable:
+    if len(preds) == 1:
+        return preds[0]
+    return lambda o: any(pred(o) for pred in preds)
+
+
+def _getter(k: SortKey) -> Callable:
+    """Builds a function that gets a key's value (or _MISSING) from an
+    object."""
+    attr, key = k.attr, k.key
+
+    if attr == 'version' and not k.on_project:
+        # parsed version string
+        def get_value(o: object):
+            v_key = o.version_key()
+            return _MISSING if v_key is None else v_key
+
+    elif key:
+        # uuid/meta value
+        def get_value(o: object):
+            funcs = o.uuids_ if attr == 'uuids' else o.meta_
+            func = funcs.get(key, None)
+            if func is None:
+                return _MISSING
+            try:
+                return func()
+            except AttributeError:
+                return _MISSING
+
+    else:
+        # regular attribute
+        def get_value(o: object):
+            return getattr(o, attr, _MISSING)
+
+    return get_value
+
+
+def _literal(text: str, quoted: bool):
+    """Converts a value in an expression to a number, bool, None or str."""
+    if not quoted:
+        if text.lower() in _LITERALS:
+            return _LITERALS[text.lower()]
+        for cast in [int, float]:
+            try:
+                return cast(text)
+            except ValueError:
+                pass
+
+    return text.lower()
+
+
+def _compare(k: SortKey, op: Callable, text: str, quoted: bool) -> Callable:
+    """Compiles a single comparison into a predicate."""
+    get_value = _getter(k)
+
+    if k.attr == 'version' and not k.on_project:
+        # compare parsed versions (parsed as per each version class)
+        literals = {}
+
+        def pred(o: object) -> bool:
+            val = get_value(o)
+            if val is _MISSING:
+                return False
+            cls = type(o)
+            if cls not in literals:
+                literals[cls] = cls.parse_version(text)
+            return op(val, literals[cls])
+
+        return pred
+
+    literal = _literal(text, quoted)
+    numeric = isinstance(literal, (int, float)) \
+        and not isinstance(literal, bool)
+
+    def pred(o: object) -> bool:
+        val = get_value(o)
+        if val is _MISSING:
+            return False
+
+        if isinstance(val, str):
+            if numeric:
+                # eg, numbers returned as strings by an api
+                try:
+                    val = float(val)
+                except ValueError:
+                    return False
+            else:
+                val = val.lower()
+
+        try:
+            return op(val, literal)
+        except TypeError:
+            return False
+
+    return pred
+
+
+def filter(ds: Dataset, expression: str) -> None:
+    """Keeps only the projects/versions matching a filter expression."""
+    f = Filter(expression)
+
+    # filter the projects
+    p_dropped = 0
+    if f.on_projects:
+        projects = ds.projects
+        if hasattr(projects, 'scan'):
+            # disk-backed projects are selected on disk by position
+            indices = [i for i, p in enumerate(projects.scan())
+                       if f.on_projects(p)]
+            record(ds)
+            p_dropped = len(projects) - len(indices)
+            projects.select(indices)
+        else:
+            kept = [p for p in projects if f.on_projects(p)]
+            record(ds)
+            p_dropped = len(projects) - len(kept)
+            ds.projects = kept
+
+    # filter the versions in each project
+    v_dropped = 0
+    if f.on_versions:
+        for project in ds.projects:
+            kept = [v for v in project.versions if f.on_versions(v)]
+            if len(kept) < len(project.versions):
+                record(project)
+                v_dropped += len(project.versions) - len(kept)
+                project.versions = kept
+
+    print('         Filtered to {:,} projects ({:,} dropped) and {:,} '
+          'versions ({:,} dropped).'
+          .format(len(ds.projects), p_dropped,
+                  sum([len(p.versions) for p in ds.projects]), v_dropped))
@@ -0,0 +1,64 @@
+import os
+
+from r2c_isg.structures import Dataset
+from r2c_isg.structures.journal import record
+from r2c_isg.util import progress
+
+
+def get_from_dump(ds: Dataset, path: str, metadata: bool = True,
+                  historical: str = None) -> None:
+    """Gets the metadata and/or versions ('all' or 'latest') of the dataset's
+    projects from a local dump of their registry's api json (see
+    r2c_isg.loaders.dump) instead of the api, in a single pass over the
+    dump. Projects the dump doesn't have are left as they were, for a
+    'get --only-missing' to get from the api."""
+    # Note: The dump is hash joined against the dataset: the projects are
+    # indexed by their canonical keys (see Project.canonical_key), then each
+    # of the dump's records is looked up as it's read, and mapped onto its
+    # projects by the same code as the api's responses.
+    from r2c_isg.loaders.dump import dump_map
+
+    if ds.registry not in dump_map:
+        raise Exception('Registry dumps can only be read for github, npm and '
+                        'pypi datasets.')
+    if not ds.api:
+        raise Exception('No API is associated with this dataset; '
+                        'cannot read its registry dump.')
+
+    dump = dump_map[ds.registry](path)
+    if historical and not dump.has_versions:
+        print('         Warning: %s dumps have no versions; use "get -v" to '
+              'get them from the api.' % ds.registry)
+        historical = None
+
+    projects = ds.projects
+    on_disk = hasattr(projects, 'scan')
+
+    # index the projects (several projects can share a key)
+    index = {}
+    for i, p in enumerate(projects.scan() if on_disk else projects):
+        index.setdefault(p.canonical_key(), []).append(i)
+
+    source = 'dump:%s' % os.path.basename(os.path.normpath(path))
+    got = bytearray(len(projects))
+    records = 0
+    for key, data in progress(dump, unit='record', leave=False,
+                              desc='         Reading dump'):
+        records += 1
+        for i in index.get(key, []):
+            p = projects[i]
+            record(p, versions=bool(historical))
+            if metadata:
+                ds.api.update_project(p, data)
+                p.set_fetched('metadata', 200, source=source)
+            if historical:
+                ds.api.update_versions(p, data, historical)
+                p.set_fetched('versions', 200, source=source)
+
+            if on_disk:
+                # write back the project (it may have been paged out)
+                projects[i] = p
+            got[i] = 1
+
+    print('         Got {:,} of {:,} projects from the dump ({:,} records).'
+          .format(sum(got), len(projects), records))
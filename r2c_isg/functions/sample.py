@@ -1,35 +1,62 @@
 import random
 
 from r2c_isg.structures import Dataset
-
-
-def sample(ds: Dataset, n: int,
-           on_versions: bool = True, seed: str = None) -> None:
-    """Samples n projects in place."""
+from r2c_isg.structures.journal import record
+from r2c_isg.functions._sampling import identity, reservoir
+
+
+def sample(ds: Dataset, n: int, on_versions: bool = True, seed: str = None,
+           weight: str = None, inverse: bool = False, strata: str = None,
+           hashed: bool = False) -> None:
+    """Samples n projects in place (or n versions of each project). Samples
+    can be weighted by a key (eg, 'download_count'; inversely for rankings)
+    and/or drawn separately from each value of a strata key (eg, 'license').
+    Hashed samples pick projects/versions by a keyed hash of their names,
+    so a sample stays (nearly) the same as a dataset grows."""
+    # Note: Samples are drawn with the same (seeded) reservoir sampler the
+    # loaders use, so sampling while loading (eg, 'load --sample') keeps
+    # the same projects as loading everything and then sampling. Sampled
+    # items keep their original order.
 
     # seed random, if a seed was provided
-    if seed:
-        random.seed(seed)
+    rng = random.Random(seed)
+    spec = {'weight': weight, 'inverse': inverse, 'strata': strata,
+            'hashed': hashed}
+    uniform = not (weight or strata)
 
     # select a sample of versions in each project
     if on_versions:
         dropped = 0
         for project in ds.projects:
+            record(project)
             dropped += len(project.versions)
-            if len(project.versions) > n:
-                project.versions = random.sample(project.versions, n)
+            if len(project.versions) > n or not uniform:
+                # hash versions by project too, so each project's versions
+                # are sampled independently
+                v_seed = '%s:%s' % (seed, identity(project)) if hashed \
+                    else seed
+                project.versions = reservoir(n, v_seed, rng, **spec) \
+                    .extend(project.versions).items
             dropped -= len(project.versions)
 
         print('         Sampled {:,} versions from each of {:,} projects ({:,} '
               'total versions dropped).'.format(n, len(ds.projects), dropped))
 
     # select a sample of projects
-    elif len(ds.projects) > n:
+    elif ds.projects:
+        record(ds)
         orig_count = len(ds.projects)
-        ds.projects = random.sample(ds.projects, n)
+        projects = ds.projects
+        if hasattr(projects, 'scan'):
+            # disk-backed projects are selected on disk by position
+            projects.select(reservoir(n, seed, rng, **spec)
+                            .extend(projects.scan()).indices)
+        else:
+            ds.projects = reservoir(n, seed, rng, **spec) \
+                .extend(projects).items
         print('         Sampled {:,} projects from {:,} (dropped {:,}).'
-              .format(n, orig_count, max(orig_count - n, 0)))
+              .format(len(ds.projects), orig_count,
+                      orig_count - len(ds.projects)))
 
     else:
-        # this should never happen...
         raise Exception('Dataset has no projects; cannot sample.')
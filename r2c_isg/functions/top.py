@@ -0,0 +1,59 @@
+import heapq
+from typing import List, Union
+
+from r2c_isg.structures import Dataset
+from r2c_isg.structures.journal import record
+from r2c_isg.functions._keys import parse_keys, composite_key, warn_missing
+
+
+def top(ds: Dataset, n: int, params: Union[str, List[str]],
+        on_versions: bool = False) -> None:
+    """Keeps only the first n projects/versions in sort order (as if sorted,
+    then trimmed) inplace, without sorting everything."""
+    # Note: heapq's nsmallest/nlargest select the top n in O(len * log(n))
+    # and break ties by original position, so the result matches a (stable)
+    # sort followed by a trim.
+
+    keys = parse_keys(params)
+    if on_versions and any(k.on_project for k in keys):
+        raise Exception('The top versions can only be selected on version '
+                        'keys (prepend "v." to the key).')
+    if not on_versions and not all(k.on_project for k in keys):
+        raise Exception('The top projects can only be selected on project '
+                        'keys; use -v to select the top versions.')
+
+    key, reverse = composite_key(keys)
+    select = heapq.nlargest if reverse else heapq.nsmallest
+
+    # select the top versions in each project
+    if on_versions:
+        dropped = 0
+        for project in ds.projects:
+            record(project)
+            dropped += len(project.versions)
+            project.versions = select(n, project.versions, key=key)
+            dropped -= len(project.versions)
+
+        warn_missing(keys)
+        print('         Kept the top {:,} versions in each project by {} '
+              '({:,} total versions dropped).'.format(n, str(keys), dropped))
+
+    # select the top projects
+    else:
+        # Note: Disk-backed projects are scanned (only the top n are held
+        # in memory) and then selected on disk by position.
+        projects = ds.projects
+        scan = projects.scan() if hasattr(projects, 'scan') else projects
+        top_n = select(n, enumerate(scan), key=lambda item: key(item[1]))
+        indices = [i for i, _ in top_n]
+
+        record(ds)
+        orig_count = len(projects)
+        if hasattr(projects, 'select'):
+            projects.select(indices)
+        else:
+            ds.projects = [p for _, p in top_n]
+
+        warn_missing(keys)
+        print('         Kept the top {:,} projects by {} ({:,} dropped).'
+              .format(n, str(keys), orig_count - len(indices)))
@@ -1,24 +1,51 @@
+import heapq
+from typing import List
+
 from r2c_isg.structures import Dataset
+from r2c_isg.structures.journal import record
+from r2c_isg.structures.versions import Version
 
 
-def trim(ds: Dataset, n: int, on_versions: bool = False) -> None:
-    """Keep only the first n projects inplace."""
+def trim(ds: Dataset, n: int, on_versions: bool = False,
+         newest: bool = False) -> None:
+    """Keep only the first n projects inplace (or the first/newest n versions
+    of each project)."""
+    if newest and not on_versions:
+        raise Exception('Only versions can be trimmed to the newest N; '
+                        'trim versions instead (-v).')
 
     # select a sample of versions in each project
     if on_versions:
         dropped = 0
         for project in ds.projects:
+            record(project)
             dropped += len(project.versions)
-            project.versions = project.versions[:n]
+            if newest and len(project.versions) > n:
+                project.versions = newest_versions(project.versions, n)
+            else:
+                project.versions = project.versions[:n]
             dropped -= len(project.versions)
 
-        print('         Trimmed to first {:,} versions in each project '
-              '({:,} total versions dropped).'.format(n, dropped))
+        print('         Trimmed to {} {:,} versions in each project '
+              '({:,} total versions dropped).'
+              .format('newest' if newest else 'first', n, dropped))
 
     # select a sample of projects
     else:
+        record(ds)
         orig_count = len(ds.projects)
-        ds.projects = ds.projects[:n]
+        del ds.projects[n:]
         print('         Trimmed to first {:,} projects ({:,} dropped).'
               .format(n, max(orig_count - n, 0)))
 
+
+def newest_versions(versions: List[Version], n: int) -> List[Version]:
+    """Selects the n newest versions (by their parsed version strings, or
+    dates for commits) without sorting them all; they keep their original
+    order. Versions without a version string count as the oldest."""
+    def newness(item: tuple) -> tuple:
+        key = item[1].version_key()
+        return (0, ()) if key is None else (1, key)
+
+    newest = heapq.nlargest(n, enumerate(versions), key=newness)
+    return [v for _, v in sorted(newest, key=lambda item: item[0])]
@@ -1,20 +1,32 @@
-import dill as pickle
-
 from r2c_isg.loaders import Loader
 from r2c_isg.structures import Dataset
 
 
 class DatasetLoader(Loader):
     @classmethod
-    def load(cls, filepath: str, **_) -> Dataset:
-        """Loads a complete dataset from a pickle file."""
+    def load(cls, filepath: str, store: str = None, versions: bool = True,
+             view: bool = False, **_) -> Dataset:
+        """Loads a complete dataset from a snapshot (or pickle) file."""
+        from r2c_isg.structures.snapshot import Snapshot, is_snapshot
+
+        if is_snapshot(filepath):
+            with Snapshot(filepath) as snapshot:
+                return snapshot.restore(store=store, versions=versions,
+                                        view=view)
+
+        # Note: Backups made before snapshots were pickled datasets. These
+        # may fail to load or produce unexpected behavior if the dataset/
+        # project/version models have been altered after the backup was
+        # made; restore them and back them up again to convert them to
+        # snapshots.
+        if store or not versions or view:
+            raise Exception('Only snapshots can be partially restored, viewed '
+                            'or restored into a store. Restore the dataset '
+                            'and back it up again to convert it to a '
+                            'snapshot.')
 
-        # Note: This may fail to load or produce unexpected behavior if
-        # dataset/project/version models have been altered after the
-        # backup was made. For now, this scenario has been left
-        # unaddressed, as the backup functionality is intended to be
-        # used more for quick and easy checkpointing than a full-
-        # featured archiving system.
+        import dill as pickle
 
         # load the file
-        return pickle.load(open(filepath, 'rb'))
+        with open(filepath, 'rb') as file:
+            return pickle.load(file)
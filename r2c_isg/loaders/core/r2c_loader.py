@@ -1,54 +1,71 @@
-import json
-from tqdm import tqdm
+from typing import Iterable, Iterator, Tuple
 
 from r2c_isg.loaders import Loader
 from r2c_isg.structures import Dataset, DefaultProject, DefaultVersion
+from r2c_isg.structures.inputset import InputsetReader
 from r2c_isg.structures.projects import project_map
 from r2c_isg.structures.versions import version_map
+from r2c_isg.util import progress
 
 
 class R2cLoader(Loader):
     @classmethod
     def load(cls, filepath: str, **kwargs) -> Dataset:
-        """Loads an r2c input set json file."""
+        """Loads an r2c input set (json or json lines, optionally gzipped)."""
+
+        # get the sampling spec (if any)
+        sample = kwargs.pop('sample', None)
 
         # initialize the dataset
         ds = Dataset(**kwargs)
 
-        # load the file
-        data = json.load(open(filepath))
-
         # remove any existing projects
         ds.projects = []
 
-        # don't overwrite previously set metadata
-        ds.name = ds.name or data['name']
-        ds.version = ds.version or data['version']
-
-        # grab any optional metadata
-        ds.description = ds.description or data.get('description', None)
-        ds.readme = ds.readme or data.get('readme', None)
-        ds.author = ds.author or data.get('author', None)
-        ds.email = ds.email or data.get('email', None)
+        # stream the inputs from the file (json or json lines, optionally
+        # gzipped); the input set's metadata is read along the way
+        reader = InputsetReader(filepath)
+
+        # split out project- vs. version-level information
+        rows = cls._rows(progress(reader, desc='         Importing',
+                                  unit=' inputs', leave=False))
+
+        # sample the projects before building them, if requested
+        # Note: Inputs are grouped into projects by name (or url); weights
+        # and strata are read from a project's first input.
+        if sample:
+            from r2c_isg.functions._sampling import sample_groups
+
+            rows = sample_groups(
+                rows, sample,
+                key=lambda r: r[0].get('package_name', None)
+                or r[0].get('repo_url', None) or r[0].get('url'),
+                values=lambda r: r[0]
+            )
+
+        # Note: Inputs are matched to projects (and versions) by looking up
+        # their uuids in a dict rather than with find_project's linear
+        # search, so importing takes linear time. Only the uuids of the
+        # projects and of the current project's versions are indexed (an
+        # exported input set lists each project's inputs together).
+        projects = ds.projects
+        on_disk = not isinstance(projects, list)
+
+        # (uuid key, value) -> project position
+        p_index = {}
+
+        # position of the current project and its versions' uuids
+        current, v_index = None, {}
 
         # generate the projects and versions
-        for input_ in tqdm(data['inputs'], desc='         Importing',
-                           unit=' inputs', leave=False):
-            # split out project- vs. version-level information
-            p_data, v_data = {}, {}
-            p_keys = ['repo_url', 'url', 'package_name']
-            v_keys = ['commit_hash', 'version']
-            for k, val in input_.items():
-                # add the attribute to the project or version
-                if k in v_keys:
-                    v_data[k] = val
-                elif k in p_keys:
-                    p_data[k] = val
-
+        for p_data, v_data in rows:
             # get or create the new project
-            project = ds.find_project(**p_data)
-            if project:
+            p_keys = cls._project_keys(p_data)
+            i = min([p_index[k] for k in p_keys if k in p_index],
+                    default=None)
+            if i is not None:
                 # update the existing project
+                project = projects[i]
                 project.update(**p_data)
 
             else:
@@ -64,14 +81,27 @@ class R2cLoader(Loader):
                 # create the new project & add it to the dataset
                 p_class = project_map.get(ds.registry, DefaultProject)
                 project = p_class(uuids_=uuids, **p_data)
-                ds.projects.append(project)
+                i = len(projects)
+                projects.append(project)
+
+            for k in p_keys:
+                p_index.setdefault(k, i)
 
             # create the new version, if it doesn't already exist
             if v_data:
-                version = project.find_version(**v_data)
-                if version:
+                if i != current:
+                    # index the project's existing versions
+                    current, v_index = i, {}
+                    for j, version in enumerate(project.versions):
+                        for k in cls._uuid_keys(version):
+                            v_index.setdefault(k, j)
+
+                v_keys = cls._version_keys(v_data)
+                j = min([v_index[k] for k in v_keys if k in v_index],
+                        default=None)
+                if j is not None:
                     # update the existing version
-                    version.update(**v_data)
+                    project.versions[j].update(**v_data)
 
                 else:
                     # map csv headers to version keywords, as applicable
@@ -83,6 +113,76 @@ class R2cLoader(Loader):
 
                     # create the new version & add it to the project
                     v_class = version_map.get(ds.registry, DefaultVersion)
+                    j = len(project.versions)
                     project.versions.append(v_class(uuids_=uuids, **v_data))
 
+                for k in v_keys:
+                    v_index.setdefault(k, j)
+
+            if on_disk:
+                # save the changes to disk-backed projects
+                projects[i] = project
+
+        # don't overwrite previously set metadata
+        data = reader.header
+        ds.name = ds.name or data.get('name', None)
+        ds.version = ds.version or data.get('version', None)
+
+        # grab any optional metadata
+        ds.description = ds.description or data.get('description', None)
+        ds.readme = ds.readme or data.get('readme', None)
+        ds.author = ds.author or data.get('author', None)
+        ds.email = ds.email or data.get('email', None)
+
         return ds
+
+    @staticmethod
+    def _project_keys(p_data: dict) -> list:
+        """The (uuid key, value) pairs that identify an input's project."""
+        keys = []
+        if p_data.get('package_name', None) is not None:
+            keys.append(('name', p_data['package_name']))
+        url = p_data.get('url', p_data.get('repo_url', None))
+        if url is not None:
+            keys.append(('url', url))
+        return keys
+
+    @staticmethod
+    def _version_keys(v_data: dict) -> list:
+        """The (uuid key, value) pairs that identify an input's version."""
+        keys = []
+        if v_data.get('version', None) is not None:
+            keys.append(('version', v_data['version']))
+        if v_data.get('commit_hash', None) is not None:
+            keys.append(('commit', v_data['commit_hash']))
+        return keys
+
+    @staticmethod
+    def _uuid_keys(obj: object) -> list:
+        """The (uuid key, value) pairs of an existing project/version."""
+        keys = []
+        for k, func in obj.uuids_.items():
+            try:
+                val = func()
+            except AttributeError:
+                continue
+            if val is not None:
+                keys.append((k, val))
+        return keys
+
+    @staticmethod
+    def _rows(inputs: Iterable[dict]) -> Iterator[Tuple[dict, dict]]:
+        """Splits input set inputs into (project data, version data)
+        dictionaries."""
+        p_keys = ['repo_url', 'url', 'package_name']
+        v_keys = ['commit_hash', 'version']
+        for input_ in inputs:
+            p_data, v_data = {}, {}
+            for k, val in input_.items():
+                # add the attribute to the project or version
+                if k in v_keys:
+                    v_data[k] = val
+                elif k in p_keys:
+                    p_data[k] = val
+
+            yield p_data, v_data
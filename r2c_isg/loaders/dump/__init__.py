@@ -0,0 +1,11 @@
+from ._dump import Dump, DumpReader
+from .github_dump import GithubDump
+from .npm_dump import NpmDump
+from .pypi_dump import PypiDump
+
+
+dump_map = {
+    'github': GithubDump,
+    'npm': NpmDump,
+    'pypi': PypiDump
+}
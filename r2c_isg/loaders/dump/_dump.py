@@ -0,0 +1,102 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Iterator, Optional, Tuple
+
+from r2c_isg.structures.inputset import _Buffer, _open_read
+
+# the lists that hold a dump's records when they come wrapped in an object
+# (couchdb's _all_docs and _changes, and github's search results)
+_LISTS = ['rows', 'results', 'items']
+
+
+class Dump(ABC):
+    """A local dump of a registry's api json--a file, or a directory of
+    files--read one record at a time (see DumpReader)."""
+
+    # whether the dump's records include the projects' versions
+    has_versions = True
+
+    def __init__(self, path: str):
+        if not os.path.exists(path):
+            raise Exception('No dump file or directory at "%s".' % path)
+
+        self.path = path
+
+    def __iter__(self) -> Iterator[Tuple[str, dict]]:
+        """Yields the canonical key (see Project.canonical_key) and api json
+        of each project in the dump."""
+        for record in DumpReader(self.path):
+            parsed = self.parse(record)
+            if parsed:
+                yield parsed
+
+    @abstractmethod
+    def parse(self, record: dict) -> Optional[Tuple[str, dict]]:
+        """Returns a record's canonical key and api json, or None if the
+        record isn't a project (eg, a deleted document)."""
+        pass
+
+
+class DumpReader(object):
+    """Reads the records of a dump file (or of every file in a directory,
+    in name order) one at a time, so the dump never has to be held in
+    memory. Files can be json lines (one record per line), a json list of
+    records, or an object with the records in a "rows", "results" or "items"
+    list (eg, an npm registry _all_docs export); any of them gzipped."""
+
+    def __init__(self, path: str, chunk_size: int = 1 << 20):
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def __iter__(self) -> Iterator[dict]:
+        for filepath in self.files():
+            with _open_read(filepath) as file:
+                buf = _Buffer(file, self.chunk_size, 'dump')
+                while buf.peek():
+                    if buf.peek() == '[':
+                        for record in buf.items():
+                            yield record
+                    else:
+                        for record in self._records(buf):
+                            yield record
+
+    def files(self) -> list:
+        """The dump's files (skipping hidden ones)."""
+        if not os.path.isdir(self.path):
+            return [self.path]
+
+        files = []
+        for root, dirs, names in os.walk(self.path):
+            dirs[:] = sorted([d for d in dirs if not d.startswith('.')])
+            files.extend([os.path.join(root, name) for name in sorted(names)
+                          if not name.startswith('.')])
+
+        return files
+
+    @staticmethod
+    def _records(buf: _Buffer) -> Iterator[dict]:
+        """Reads an object: either a record, or a wrapper around a list of
+        them (which is streamed)."""
+        # Note: Objects are read a key at a time, so a wrapper's list never
+        # has to be decoded all at once.
+        obj = {}
+        wrapper = False
+        buf.expect('{')
+        if buf.peek() != '}':
+            while True:
+                key = buf.value()
+                buf.expect(':')
+                if key in _LISTS and buf.peek() == '[':
+                    wrapper = True
+                    for record in buf.items():
+                        yield record
+                else:
+                    obj[key] = buf.value()
+
+                if buf.peek() == '}':
+                    break
+                buf.expect(',')
+        buf.expect('}')
+
+        if not wrapper:
+            yield obj
@@ -0,0 +1,21 @@
+from typing import Optional, Tuple
+
+from r2c_isg.loaders.dump import Dump
+from r2c_isg.structures.projects import GithubRepo
+
+
+class GithubDump(Dump):
+    """A dump of github repo json (as returned by the api, eg, in search
+    results), one per record."""
+
+    # repo json doesn't include commits
+    has_versions = False
+
+    def parse(self, record: dict) -> Optional[Tuple[str, dict]]:
+        url = record.get('html_url', None)
+        if not url:
+            return None
+
+        key = GithubRepo(uuids_={'url': lambda p: p.html_url},
+                         html_url=url).canonical_key()
+        return key, record
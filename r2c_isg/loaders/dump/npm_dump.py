@@ -0,0 +1,25 @@
+from typing import Optional, Tuple
+
+from r2c_isg.loaders.dump import Dump
+from r2c_isg.structures.projects import NpmPackage
+
+
+class NpmDump(Dump):
+    """A dump of npm registry documents (packuments, as returned by the
+    api), one per record or in the rows of an _all_docs?include_docs=true
+    (or _changes?include_docs=true) export."""
+
+    def parse(self, record: dict) -> Optional[Tuple[str, dict]]:
+        # unwrap _all_docs rows and _changes results
+        doc = record.get('doc', record)
+        if not doc or doc.get('_deleted', False):
+            return None
+
+        # skip design documents and rows without their document
+        name = doc.get('name', None)
+        if not name:
+            return None
+
+        key = NpmPackage(uuids_={'name': lambda p: p.name},
+                         name=name).canonical_key()
+        return key, doc
@@ -0,0 +1,18 @@
+from typing import Optional, Tuple
+
+from r2c_isg.loaders.dump import Dump
+from r2c_isg.structures.projects import PypiProject
+
+
+class PypiDump(Dump):
+    """A dump of pypi project json (as returned by the api; ie, with "info"
+    and "releases"), one per record."""
+
+    def parse(self, record: dict) -> Optional[Tuple[str, dict]]:
+        name = (record.get('info', None) or {}).get('name', None)
+        if not name:
+            return None
+
+        key = PypiProject(uuids_={'name': lambda p: p.name},
+                          name=name).canonical_key()
+        return key, record
@@ -1,4 +1,5 @@
 import csv
+from typing import Iterable, Iterator, List, Tuple
 
 from r2c_isg.loaders import Loader
 from r2c_isg.structures import Dataset, DefaultProject, DefaultVersion
@@ -21,74 +22,99 @@ class CsvLoader(Loader):
             # default headers are name and version string
             headers = ['name', 'v.version']
 
+        # get the sampling spec (if any)
+        sample = kwargs.pop('sample', None)
+
         # initialize a dataset
         ds = Dataset(**kwargs)
 
         # load the file
         with open(filepath, mode='r', encoding='utf-8-sig') as file:
-            csv_file = csv.reader(file, delimiter=',')
-            for row in csv_file:
-                if row[0].startswith('!'):
-                    # read in a header row
-                    if not user_defined:
-                        # in-file headers override defaults
-                        # (but not user-defined headers from the cli)
-                        headers = [h[1:] for h in row]
+            rows = cls._rows(csv.reader(file, delimiter=','),
+                             headers, user_defined)
+
+            # sample the projects before building them, if requested
+            # Note: Rows are grouped into projects by name (or url); weights
+            # and strata are read from a project's first row.
+            if sample:
+                from r2c_isg.functions._sampling import sample_groups
+
+                rows = sample_groups(
+                    rows, sample,
+                    key=lambda r: r[0].get('name', None) or r[0].get('url'),
+                    values=lambda r: r[0]
+                )
+
+            for p_data, v_data in rows:
+                # get or create the new project
+                project = ds.find_project(**p_data)
+                if project:
+                    # update the existing project
+                    project.update(**p_data)
+
                 else:
-                    # ensure we have as many headers as cells in the row
-                    if len(row) > len(headers):
-                        raise Exception('A column is missing a header. Review '
-                                        "the input file's column headers.")
-
-                    # read in a data row
-                    p_data, v_data = {}, {}
-                    for i, val in enumerate(row):
-                        attr = headers[i]
-
-                        # add the data to the project or version
-                        if attr.startswith('v.'):
-                            v_data[attr[2:]] = val
-                        else:
-                            p_data[attr] = val
-
-                    # get or create the new project
-                    project = ds.find_project(**p_data)
-                    if project:
-                        # update the existing project
-                        project.update(**p_data)
+                    # map csv headers to project keywords, as applicable
+                    uuids, meta = {}, {}
+                    if 'name' in p_data:
+                        uuids['name'] = lambda p: p.name
+                    if 'org' in p_data:
+                        meta['org'] = lambda p: p.org
+                    if 'url' in p_data:
+                        uuids['url'] = lambda p: p.url
+
+                    # create the new project & add it to the dataset
+                    p_class = project_map.get(ds.registry, DefaultProject)
+                    project = p_class(uuids_=uuids, meta_=meta, **p_data)
+                    ds.projects.append(project)
+
+                # create the new version, if it doesn't already exist
+                if v_data:
+                    version = project.find_version(**v_data)
+                    if version:
+                        # update the existing version
+                        version.update(**v_data)
 
                     else:
-                        # map csv headers to project keywords, as applicable
-                        uuids, meta = {}, {}
-                        if 'name' in p_data:
-                            uuids['name'] = lambda p: p.name
-                        if 'org' in p_data:
-                            meta['org'] = lambda p: p.org
-                        if 'url' in p_data:
-                            uuids['url'] = lambda p: p.url
-
-                        # create the new project & add it to the dataset
-                        p_class = project_map.get(ds.registry, DefaultProject)
-                        project = p_class(uuids_=uuids, meta_=meta, **p_data)
-                        ds.projects.append(project)
-
-                    # create the new version, if it doesn't already exist
-                    if v_data:
-                        version = project.find_version(**v_data)
-                        if version:
-                            # update the existing version
-                            version.update(**v_data)
-
-                        else:
-                            # map csv headers to version keywords, as applicable
-                            uuids = {}
-                            if 'version' in v_data:
-                                uuids['version'] = lambda v: v.version
-                            if 'commit' in v_data:
-                                uuids['commit'] = lambda v: v.commit
-
-                            # create the new version & add it to the project
-                            v_class = version_map.get(ds.registry, DefaultVersion)
-                            project.versions.append(v_class(uuids_=uuids, **v_data))
+                        # map csv headers to version keywords, as applicable
+                        uuids = {}
+                        if 'version' in v_data:
+                            uuids['version'] = lambda v: v.version
+                        if 'commit' in v_data:
+                            uuids['commit'] = lambda v: v.commit
+
+                        # create the new version & add it to the project
+                        v_class = version_map.get(ds.registry, DefaultVersion)
+                        project.versions.append(v_class(uuids_=uuids, **v_data))
 
         return ds
+
+    @staticmethod
+    def _rows(csv_file: Iterable, headers: List[str],
+              user_defined: bool) -> Iterator[Tuple[dict, dict]]:
+        """Reads the data rows of a csv file as (project data, version data)
+        dictionaries."""
+        for row in csv_file:
+            if row[0].startswith('!'):
+                # read in a header row
+                if not user_defined:
+                    # in-file headers override defaults
+                    # (but not user-defined headers from the cli)
+                    headers = [h[1:] for h in row]
+            else:
+                # ensure we have as many headers as cells in the row
+                if len(row) > len(headers):
+                    raise Exception('A column is missing a header. Review '
+                                    "the input file's column headers.")
+
+                # read in a data row
+                p_data, v_data = {}, {}
+                for i, val in enumerate(row):
+                    attr = headers[i]
+
+                    # add the data to the project or version
+                    if attr.startswith('v.'):
+                        v_data[attr[2:]] = val
+                    else:
+                        p_data[attr] = val
+
+                yield p_data, v_data
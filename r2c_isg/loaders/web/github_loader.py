@@ -1,7 +1,6 @@
-from tqdm import tqdm
-
 from r2c_isg.loaders import Loader
 from r2c_isg.structures import Dataset
+from r2c_isg.util import progress
 
 
 class GithubLoader(Loader):
@@ -23,6 +22,9 @@ class GithubLoader(Loader):
         # get the request type (weblist vs. organization)
         from_type = kwargs.pop('from_type')
 
+        # get the sampling spec (if any)
+        sample = kwargs.pop('sample', None)
+
         # initialize a registry
         ds = Dataset(**kwargs)
 
@@ -37,14 +39,20 @@ class GithubLoader(Loader):
             data = weblists[name]['getter'](api=ds.api, **kwargs)
 
             # parse the data
-            weblists[name]['parser'](ds, data)
+            weblists[name]['parser'](ds, data, sample)
 
         elif from_type in ['user', 'org']:
             # load the data
             data = GithubLoader._get_org_or_user_repos(ds.api, name, from_type, **kwargs)
 
             # parse the data
-            GithubLoader._parse_github(ds, data)
+            GithubLoader._parse_github(ds, data, sample)
+
+        # the repos' metadata came along with the list, so a later
+        # 'get --only-missing' can skip them (see Project.needs_fetch)
+        source = '%s:%s' % (from_type, name)
+        for p in ds.projects:
+            p.set_fetched('metadata', 200, source=source)
 
         return ds
 
@@ -79,9 +87,9 @@ class GithubLoader(Loader):
 
         # github limits results to the top 1k at 100 per page
         projects = []
-        for url in [(url_format % d) for d in tqdm(range(1, 11), unit=' pages',
-                                                   desc='         Downloading',
-                                                   leave=False)]:
+        urls = [(url_format % d) for d in range(1, 11)]
+        for url in progress(urls, unit=' pages', desc='         Downloading',
+                            leave=False):
             # request the data via the github api
             status, data = api.request(url, **kwargs)
             if status != 200:
@@ -102,8 +110,8 @@ class GithubLoader(Loader):
         # github limits results to the top 1k at 100 per page
         projects = []
         urls = [(url_format % d) for d in range(1, 11)]
-        for url in tqdm(urls, unit=' pages', desc='         Downloading',
-                        leave=False):
+        for url in progress(urls, unit=' pages', desc='         Downloading',
+                            leave=False):
             # request the data via the github api
             status, data = api.request(url, **kwargs)
             if status != 200:
@@ -115,8 +123,9 @@ class GithubLoader(Loader):
         return projects
 
     @staticmethod
-    def _parse_github(ds: Dataset, data: list) -> None:
+    def _parse_github(ds: Dataset, data: list, sample: dict = None) -> None:
         from r2c_isg.structures.projects import GithubRepo
+        from r2c_isg.functions._sampling import sample_build
 
         # map data keys to project keywords
         uuids = {
@@ -127,7 +136,8 @@ class GithubLoader(Loader):
             'org': lambda p: p.url.split('/')[-2],
         }
 
-        # create the projects
-        ds.projects = [GithubRepo(uuids_=uuids, meta_=meta, **d)
-                       for d in tqdm(data, desc='         Loading',
-                                     unit='project', leave=False)]
+        # create the projects (sampling the raw data first, if requested)
+        ds.projects = sample_build(
+            progress(data, desc='         Loading', unit='project',
+                     leave=False),
+            sample, lambda d: GithubRepo(uuids_=uuids, meta_=meta, raw_=d))
@@ -1,5 +1,3 @@
-from tqdm import tqdm
-
 from r2c_isg.loaders import Loader
 from r2c_isg.structures import Dataset
 
@@ -40,6 +38,9 @@ class NpmLoader(Loader):
         if from_type in ['user', 'org']:
             raise Exception('NPM does not support loading package lists from user/org names.')
 
+        # get the sampling spec (if any)
+        sample = kwargs.pop('sample', None)
+
         # initialize a registry
         ds = Dataset(**kwargs)
 
@@ -53,7 +54,7 @@ class NpmLoader(Loader):
         data = weblists[name]['getter'](api=ds.api, **kwargs)
 
         # parse the data
-        weblists[name]['parser'](ds, data)
+        weblists[name]['parser'](ds, data, sample)
 
         return ds
 
@@ -69,26 +70,25 @@ class NpmLoader(Loader):
         return data
 
     @staticmethod
-    def _parse_niceregistry(ds: Dataset, data: list):
+    def _parse_niceregistry(ds: Dataset, data: list, sample: dict = None):
         from r2c_isg.structures.projects import NpmPackage
+        from r2c_isg.functions._sampling import sample_build
 
         # map data keys to package keywords
         uuids = {
             'name': lambda p: p.name
         }
 
-        # create the projects
+        # create the projects (sampling the names first, if requested)
         # Note: data list is ordered from most dependents to fewest
-        ds.projects = []
-        i = 1
-        for name in data:
-            package = NpmPackage(
+        ds.projects = sample_build(
+            enumerate(data, start=1), sample,
+            lambda row: NpmPackage(
                 uuids_=uuids,
-                name=name,
-                dependents_rank=i
+                name=row[1],
+                dependents_rank=row[0]
             )
-            ds.projects.append(package)
-            i += 1
+        )
 
     '''
     @staticmethod
@@ -1,7 +1,6 @@
-from tqdm import tqdm
-
 from r2c_isg.loaders import Loader
 from r2c_isg.structures import Dataset
+from r2c_isg.util import progress
 
 
 class PypiLoader(Loader):
@@ -25,6 +24,9 @@ class PypiLoader(Loader):
         if from_type in ['user', 'org']:
             raise Exception('Pypi does not support loading project lists from user/org names.')
 
+        # get the sampling spec (if any)
+        sample = kwargs.pop('sample', None)
+
         # initialize a registry
         ds = Dataset(**kwargs)
 
@@ -38,7 +40,7 @@ class PypiLoader(Loader):
         data = weblists[name]['getter'](api=ds.api, **kwargs)
 
         # parse the data
-        weblists[name]['parser'](ds, data)
+        weblists[name]['parser'](ds, data, sample)
 
         return ds
 
@@ -66,17 +68,19 @@ class PypiLoader(Loader):
         return data['rows']
 
     @staticmethod
-    def _parse_hugovk(ds: Dataset, data: list) -> None:
+    def _parse_hugovk(ds: Dataset, data: list, sample: dict = None) -> None:
         from r2c_isg.structures.projects import PypiProject
+        from r2c_isg.functions._sampling import sample_build
 
         # map data keys to project keywords
         uuids = {
             'name': lambda p: p.project
         }
 
-        # create the projects
-        ds.projects = [PypiProject(uuids_=uuids, **d)
-                       for d in tqdm(data, desc='         Loading',
-                                     unit='project', leave=False)]
+        # create the projects (sampling the raw data first, if requested)
+        ds.projects = sample_build(
+            progress(data, desc='         Loading', unit='project',
+                     leave=False),
+            sample, lambda d: PypiProject(uuids_=uuids, **d))
 
 
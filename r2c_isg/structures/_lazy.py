@@ -0,0 +1,71 @@
+import json
+
+# recently decoded raw responses: id(raw) -> (raw, data)
+# Note: Reading several attributes of an object (eg, sorting or filtering on
+# a few fields, or probing for ones it doesn't have) decodes its response
+# once rather than once per attribute. The cache is small, and is emptied
+# whenever it fills up.
+_decoded = {}
+DECODED_SIZE = 256
+
+
+def _decode(raw: bytes) -> dict:
+    """Decodes a raw response (via the cache; don't change the result)."""
+    entry = _decoded.get(id(raw), None)
+    if entry is None or entry[0] is not raw:
+        if len(_decoded) >= DECODED_SIZE:
+            _decoded.clear()
+        entry = (raw, json.loads(raw))
+        _decoded[id(raw)] = entry
+
+    return entry[1]
+
+
+class LazyAttrs(object):
+    """Keeps raw api responses as compact json bytes and only decodes an
+    attribute the first time it's requested."""
+
+    def update_raw(self, data: dict) -> None:
+        """Stores a raw api response; attributes are decoded on first use."""
+
+        # merge with any previously stored response (newest values win)
+        raw = self.__dict__.get('raw_', None)
+        if raw:
+            merged = json.loads(raw)
+            merged.update(data)
+            data = merged
+
+        # drop any values (eager or memoized) that the new response replaces
+        for k in data:
+            if not k.endswith('_') and k != 'versions':
+                self.__dict__.pop(k, None)
+
+        self.raw_ = json.dumps(data, separators=(',', ':'),
+                               default=str).encode()
+
+        # make sure all guarantees are met
+        self.check_guarantees()
+
+    def raw(self) -> dict:
+        """Decodes the stored raw response (without memoizing anything)."""
+        raw = self.__dict__.get('raw_', None)
+        return json.loads(raw) if raw else {}
+
+    def __getattr__(self, attr):
+        # Note: __getattr__ is only called if regular attribute lookup has
+        # failed, so eagerly set and memoized attributes never get here.
+        raw = self.__dict__.get('raw_', None)
+        if raw is None or attr.startswith('__'):
+            raise AttributeError("'%s' object has no attribute '%s'"
+                                 % (type(self).__name__, attr))
+
+        data = _decode(raw)
+        if attr not in data:
+            raise AttributeError("'%s' object has no attribute '%s'"
+                                 % (type(self).__name__, attr))
+
+        # memoize the value (bypassing any setattr hooks)
+        val = data[attr]
+        self.__dict__[attr] = val
+
+        return val
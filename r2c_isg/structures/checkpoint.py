@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import shutil
+from typing import TYPE_CHECKING
+
+from r2c_isg.structures.snapshot import Builder, Records, Snapshot, \
+    SnapshotWriter
+
+if TYPE_CHECKING:
+    from r2c_isg.structures import Dataset, Project
+
+# how often (at most) the progress log is synced to disk
+SYNC_SECONDS = 5.0
+
+
+class Checkpoint(object):
+    """Saves the progress of a long-running get (eg, 'get -mv all' over
+    thousands of repos), so it can be resumed after a crash, an api error or
+    ctrl-c.
+
+    A checkpoint is a directory holding the get's options, a log of the
+    projects the get has finished (one line per project and step, synced to
+    disk every few seconds; each resumed run starts a new log file) and a
+    snapshot of the dataset to replay the logs onto. Resuming rebuilds the
+    dataset from the snapshot and the logs and skips the finished projects,
+    so none of their requests are repeated (or even read back from the
+    request cache).
+
+    The snapshot is only written once a get stops without finishing (see
+    close), so gets that finish never pay for it. Disk-backed datasets are
+    replayed onto their store instead (it's already on disk), so only
+    their metadata is saved, up front; they can be resumed even after a
+    get is killed outright.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        # the get's options (eg, {'metadata': True, 'versions': 'all'})
+        self.job = {}
+
+        # step ('metadata' or 'versions') -> positions of finished projects
+        self.done = {'metadata': set(), 'versions': set()}
+
+        self._records = Records()
+        self._log = None
+        self._synced = 0.0
+
+        # the dataset to save if the get stops without finishing
+        self._ds = None
+
+    @classmethod
+    def start(cls, path: str, ds: 'Dataset', **job) -> 'Checkpoint':
+        """Starts a new checkpoint (replacing any old one at the path)."""
+        checkpoint = cls(path)
+        checkpoint.job = job
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.makedirs(path)
+
+        checkpoint.job['store'] = getattr(ds.projects, 'path', None)
+        if checkpoint.job['store']:
+            SnapshotWriter(checkpoint._file('dataset.snap')).write(ds, [])
+        else:
+            checkpoint._ds = ds
+        with open(checkpoint._file('job.json'), 'w') as file:
+            json.dump(checkpoint.job, file, indent=4)
+
+        checkpoint._open_log(1)
+        return checkpoint
+
+    @classmethod
+    def resume(cls, path: str) -> ('Checkpoint', 'Dataset'):
+        """Reopens a checkpoint; returns it and the dataset as of its last
+        finished project."""
+        checkpoint = cls(path)
+        if not os.path.isfile(checkpoint._file('job.json')):
+            raise Exception('There is no unfinished get to resume (no '
+                            'checkpoint at %s).' % path)
+
+        with open(checkpoint._file('job.json')) as file:
+            checkpoint.job = json.load(file)
+
+        if not os.path.isfile(checkpoint._file('dataset.snap')):
+            raise Exception('The unfinished get was stopped before it could '
+                            'save its progress (eg, it was killed); load the '
+                            'dataset again and use "get --only-missing" '
+                            'instead.')
+
+        with Snapshot(checkpoint._file('dataset.snap')) as snapshot:
+            ds = snapshot.restore()
+
+        store = checkpoint.job.get('store', None)
+        if store:
+            # pick up the store as it is (see start)
+            from r2c_isg.structures.store import ProjectStore
+
+            if not os.path.isfile(store):
+                raise Exception('The unfinished get\'s store (%s) no longer '
+                                'exists.' % store)
+            ds._projects = ProjectStore(store)
+
+        # replay the logs in order
+        i = 1
+        while os.path.isfile(checkpoint._file('progress-%03d.jsonl' % i)):
+            builder = Builder()
+            with open(checkpoint._file('progress-%03d.jsonl' % i),
+                      'rb') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        # the last line was cut off mid-write
+                        break
+
+                    builder.extend(entry['tables'])
+                    project = builder.build(entry['project'])
+                    project.versions = [builder.build(r)
+                                        for r in entry['versions']]
+                    ds.projects[entry['pos']] = project
+                    checkpoint.done[entry['step']].add(entry['pos'])
+            i += 1
+
+        checkpoint._open_log(i)
+        return checkpoint, ds
+
+    def _open_log(self, i: int) -> None:
+        # each log has its own tables (see Records)
+        self._log = open(self._file('progress-%03d.jsonl' % i), 'w',
+                         encoding='utf-8')
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def is_done(self, step: str, pos: int) -> bool:
+        """Whether a project finished a step before the get was resumed."""
+        return pos in self.done[step]
+
+    def save(self, step: str, pos: int, project: 'Project') -> None:
+        """Logs a project that just finished a step."""
+        marks = self._records.marks()
+        entry = {
+            'step': step,
+            'pos': pos,
+            'project': self._records.record(project),
+            'versions': [self._records.record(v) for v in project.versions]
+        }
+        entry['tables'] = self._records.tables(since=marks)
+
+        self._log.write(json.dumps(entry, separators=(',', ':'),
+                                   default=str) + '\n')
+        self.done[step].add(pos)
+
+        if time.time() - self._synced > SYNC_SECONDS:
+            self.sync()
+
+    def sync(self) -> None:
+        """Makes sure the logged progress is on disk."""
+        self._log.flush()
+        os.fsync(self._log.fileno())
+        self._synced = time.time()
+
+    def close(self) -> bool:
+        """Syncs and closes the log, keeping the checkpoint so the get can be
+        resumed (first saving the dataset to resume from, if it hasn't been
+        yet). Returns whether there's anything to resume; if not, the
+        checkpoint is deleted."""
+        self._close_log()
+        if not any(self.done.values()):
+            self.remove()
+            return False
+
+        if self._ds is not None:
+            SnapshotWriter(self._file('dataset.snap')).write(self._ds)
+            self._ds = None
+
+        return True
+
+    def remove(self) -> None:
+        """Deletes the checkpoint (once the get has finished)."""
+        self._close_log()
+        self._ds = None
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _close_log(self) -> None:
+        if self._log:
+            self.sync()
+            self._log.close()
+            self._log = None
+
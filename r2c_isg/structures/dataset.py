@@ -1,12 +1,15 @@
-import json
-import dill as pickle
-from dill.source import getsource
-from tqdm import tqdm
-from typing import List, Optional
+import time
+from datetime import timedelta
+from typing import TYPE_CHECKING, Iterable, List, Optional
 from types import MethodType
 from pathlib import Path
 
+from r2c_isg.structures.journal import record
 from r2c_isg.structures.projects import Project
+from r2c_isg.util import progress
+
+if TYPE_CHECKING:
+    from r2c_isg.structures.checkpoint import Checkpoint
 
 
 class Dataset(object):
@@ -17,8 +20,17 @@ class Dataset(object):
         from r2c_isg.functions import function_map
         from r2c_isg.util import get_name, get_email
 
-        # a dataset contains projects
-        self.projects: List[Project] = []
+        # a dataset contains projects (optionally stored on disk)
+        store = kwargs.pop('store', None)
+        if store:
+            from r2c_isg.structures.store import ProjectStore
+
+            self._projects = ProjectStore(store)
+            if len(self._projects):
+                raise Exception('%s already contains projects; choose a new '
+                                'file for the store.' % store)
+        else:
+            self._projects: List[Project] = []
 
         # set project metadata
         self.name = None
@@ -45,8 +57,26 @@ class Dataset(object):
         for name, function in function_map.items():
             setattr(self, name, MethodType(function, self))
 
+    @property
+    def projects(self) -> List[Project]:
+        return self._projects
+
+    @projects.setter
+    def projects(self, projects: Iterable[Project]) -> None:
+        if not isinstance(self._projects, list):
+            # keep disk-backed datasets on disk
+            if projects is not self._projects:
+                self._projects.replace(projects)
+
+        elif isinstance(projects, list):
+            self._projects = projects
+
+        else:
+            self._projects = list(projects)
+
     def update(self, **kwargs):
         """Updates a dataset's metadata."""
+        record(self)
 
         # set default dataset metadata
         self.name = kwargs.pop('name', self.name)
@@ -104,16 +134,20 @@ class Dataset(object):
         return ds
 
     @classmethod
-    def restore(cls, filepath: str) -> 'Dataset':
-        """Factory method that restores a pickled dataset."""
+    def restore(cls, filepath: str, store: str = None,
+                versions: bool = True, view: bool = False) -> 'Dataset':
+        """Factory method that restores a backed up dataset (optionally into
+        a disk-backed store, optionally without its versions, or as a
+        read-only view of a snapshot file)."""
         from r2c_isg.loaders.core import DatasetLoader
 
         # check if the path is valid
         if not Path(filepath).is_file():
             raise Exception('Invalid path; file does not exist.')
 
-        # load the pickled dataset
-        ds = DatasetLoader.load(filepath)
+        # load the snapshot (or pickled dataset)
+        ds = DatasetLoader.load(filepath, store=store, versions=versions,
+                                view=view)
 
         print('         Restored {:,} projects containing {:,} total versions.'
               .format(len(ds.projects),
@@ -121,15 +155,18 @@ class Dataset(object):
 
         return ds
 
-    def backup(self, filepath: str = None) -> None:
-        """Pickles a dataset."""
+    def backup(self, filepath: str = None, compress: bool = False) -> None:
+        """Backs up a dataset to a snapshot file."""
+        # Note: Snapshots store the dataset's data (not its python objects),
+        # so they survive changes to the models; see structures/snapshot.py.
+        # Disk-backed datasets are streamed from their store.
+        from r2c_isg.structures.snapshot import SnapshotWriter
 
         # file name is dataset name, if not provided by user
-        filepath = filepath or (self.name + '.p')
+        filepath = filepath or (self.name + '.snap')
 
         # save to disk
-        with open(filepath, 'wb') as file:
-            pickle.dump(self, file)
+        SnapshotWriter(filepath, compress=compress).write(self)
 
         print('         Backed up dataset to %s.' % filepath)
 
@@ -151,22 +188,34 @@ class Dataset(object):
         ))
         return ds
 
-    def export_inputset(self, filepath: str = None) -> None:
-        """Exports a dataset to an r2c input set json file."""
+    def export_inputset(self, filepath: str = None, compact: bool = False,
+                        jsonl: bool = False, compress: bool = False,
+                        shards: int = 1) -> None:
+        """Exports a dataset to an r2c input set json file (or json lines,
+        gzipped and/or split into shards), one project at a time."""
+        from r2c_isg.structures.inputset import InputsetWriter
 
         # file name is dataset name, if not provided by user
-        filepath = filepath or (self.name + '.json')
-
-        # convert the dataset to an input set json
-        inputset = self.to_inputset()
-
-        # save to disk
-        with open(filepath, 'w') as file:
-            json.dump(inputset, file, indent=4)
-        print('         Exported input set to %s.' % filepath)
-
-    def to_inputset(self) -> dict:
-        """Converts a dataset to an input set json."""
+        filepath = filepath or (self.name + ('.jsonl' if jsonl else '.json'))
+        if compress and not filepath.endswith('.gz'):
+            filepath += '.gz'
+
+        # stream the projects' inputs to disk
+        writer = InputsetWriter(filepath, self.inputset_header(),
+                                compact=compact, jsonl=jsonl, shards=shards)
+        projects = self.projects
+        with writer:
+            for p in progress(projects.scan() if hasattr(projects, 'scan')
+                              else projects, total=len(projects),
+                              desc='         Exporting', unit='project',
+                              leave=False):
+                writer.write(p.to_inputset())
+
+        print('         Exported {:,} inputs to {}.'
+              .format(sum(writer.counts), ', '.join(writer.paths)))
+
+    def inputset_header(self) -> dict:
+        """Gets an input set's metadata (everything but the inputs)."""
 
         # name and version are mandatory
         if not (self.name and self.version):
@@ -183,22 +232,41 @@ class Dataset(object):
         if self.author: d['author'] = self.author
         if self.email: d['email'] = self.email
 
+        return d
+
+    def to_inputset(self) -> dict:
+        """Converts a dataset to an input set json."""
+        d = self.inputset_header()
+
         # jsonify the projects & versions
         d['inputs'] = []
-        for p in tqdm(self.projects, desc='         Exporting',
-                      unit='project', leave=False):
+        for p in progress(self.projects, desc='         Exporting',
+                          unit='project', leave=False):
             d['inputs'].extend(p.to_inputset())
 
         return d
 
     def to_json(self) -> dict:
         """Converts a dataset into json and saves to disk."""
+        from dill.source import getsource
 
         def extract_vars(obj: object) -> dict:
             """Extracts attributes from a dataset/project/version."""
             vars_dict = {}
-            for attr, val in vars(obj).items():
-                if callable(val):
+
+            # decode any lazily stored raw attributes (without memoizing
+            # them); eagerly set and memoized attributes take precedence
+            attrs = vars(obj)
+            if 'raw_' in attrs:
+                attrs = {**obj.raw(), **attrs}
+
+            for attr, val in attrs.items():
+                if attr in ['raw_', 'version_key_']:
+                    # raw response bytes (already decoded above) or cached
+                    # sort keys; skip
+                    pass
+
+                elif callable(val):
                     # function; skip
                     pass
 
@@ -209,7 +277,7 @@ class Dataset(object):
                         for key, func in val.items()
                     }
 
-                elif attr not in ['api', 'projects', 'versions']:
+                elif attr not in ['api', '_projects', 'projects', 'versions']:
                     # regular attr, add to dict
                     vars_dict[attr] = val
 
@@ -220,8 +288,8 @@ class Dataset(object):
         data_dict['projects'] = []
 
         # convert all projects to vars dicts
-        for project in tqdm(self.projects, desc='         Jsonifying',
-                            unit='project', leave=False):
+        for project in progress(self.projects, desc='         Jsonifying',
+                                unit='project', leave=False):
             p_dict = extract_vars(project)
             p_dict['versions'] = []
             data_dict['projects'].append(p_dict)
@@ -233,36 +301,360 @@ class Dataset(object):
 
         return data_dict
 
-    def get_projects_meta(self, **kwargs) -> None:
-        """Gets the metadata for all projects."""
+    def get_projects_meta(self, checkpoint: 'Checkpoint' = None,
+                          only_missing: bool = False,
+                          retry_failed: bool = False,
+                          max_age: timedelta = None, **kwargs) -> None:
+        """Gets the metadata for all projects, or only those that need it
+        (see Project.needs_fetch), logging each finished project to a
+        checkpoint, if given, and skipping those it already has."""
 
         if not self.api:
             raise Exception('No API is associated with this dataset; '
                             'cannot get project metadata.')
 
-        for p in tqdm(self.projects, unit='project', leave=False,
-                      desc='         Getting project metadata',):
-
-            self.api.get_project(p, **kwargs)
-
-        print('         Retrieved metadata for {:,} projects.'
-              .format(len(self.projects)))
-
-    def get_project_versions(self, **kwargs) -> None:
-        """Gets the historical versions for all projects."""
+        skipped = 0
+        resumed = 0
+        for i, p in enumerate(progress(
+                self.projects, unit='project', leave=False,
+                desc='         Getting project metadata')):
+            if checkpoint and checkpoint.is_done('metadata', i):
+                resumed += 1
+                continue
+            if not p.needs_fetch('metadata', only_missing, retry_failed,
+                                 max_age):
+                skipped += 1
+                continue
+            record(p)
+            status = self.api.get_project(p, **kwargs)
+            p.set_fetched('metadata', status)
+            if checkpoint:
+                checkpoint.save('metadata', i, p)
+
+        print('         Retrieved metadata for {:,} projects{}.'
+              .format(len(self.projects) - skipped - resumed,
+                      _skipped(skipped, resumed)))
+
+    def get_project_versions(self, checkpoint: 'Checkpoint' = None,
+                             only_missing: bool = False,
+                             retry_failed: bool = False,
+                             max_age: timedelta = None, **kwargs) -> None:
+        """Gets the historical versions for all projects, or only those that
+        need them (see Project.needs_fetch), logging each finished project
+        to a checkpoint, if given, and skipping those it already has."""
 
         if not self.api:
             raise Exception('No API is associated with this dataset; '
                             'cannot get project versions.')
 
-        for p in tqdm(self.projects, unit='project', leave=False,
-                      desc='         Getting %s version'
-                           % kwargs.get('historical', 'all')):
-            self.api.get_versions(p, **kwargs)
+        skipped = 0
+        resumed = 0
+        got = 0
+        for i, p in enumerate(progress(
+                self.projects, unit='project', leave=False,
+                desc='         Getting %s version'
+                     % kwargs.get('historical', 'all'))):
+            if checkpoint and checkpoint.is_done('versions', i):
+                resumed += 1
+                continue
+            if not p.needs_fetch('versions', only_missing, retry_failed,
+                                 max_age):
+                skipped += 1
+                continue
+            record(p, versions=True)
+            status = self.api.get_versions(p, **kwargs)
+            p.set_fetched('versions', status)
+            got += len(p.versions)
+            if checkpoint:
+                checkpoint.save('versions', i, p)
+
+        print('         Retrieved {:,} total versions of {:,} projects{}.'
+              .format(got, len(self.projects) - skipped - resumed,
+                      _skipped(skipped, resumed)))
+
+    def get_until(self, metadata: bool = True, historical: str = None,
+                  target: int = None, where: str = None, order: str = None,
+                  budget: timedelta = None, workers: int = 1,
+                  checkpoint: 'Checkpoint' = None, only_missing: bool = False,
+                  retry_failed: bool = False, max_age: timedelta = None,
+                  **kwargs) -> None:
+        """Gets the metadata and/or versions of projects one project at a
+        time (in dataset order, or by the sort keywords in order), with up
+        to workers projects in flight at once, until target projects have
+        succeeded or the time budget runs out. With a target or a where
+        filter, projects that fail are dropped (and with a target, so are
+        any projects beyond it); otherwise they're kept, as with
+        get_projects_meta.
+
+        A project succeeds if each of its fetches returned HTTP 2xx, it has
+        at least one version (when getting versions) and it matches the
+        filter expression where (with version clauses matching any one of
+        its versions). Projects that don't need fetching (see
+        Project.needs_fetch) or that a checkpoint already has are judged
+        without fetching them again."""
+        from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, \
+            wait
+        from r2c_isg.apis import CriticalApiError
+        from r2c_isg.functions._keys import composite_key, parse_keys, \
+            warn_missing
+        from r2c_isg.functions.filter import Filter
 
-        print('         Retrieved {:,} total versions of {:,} projects.'
-              .format(sum([len(p.versions) for p in self.projects]),
-                      len(self.projects)))
+        if not self.api:
+            raise Exception('No API is associated with this dataset; '
+                            'cannot get projects.')
+        if not (metadata or historical):
+            raise Exception('Nothing to get; get metadata and/or versions.')
+        if target is not None and target < 1:
+            raise Exception('The target must be at least 1 project.')
+        if workers < 1:
+            raise Exception('There must be at least 1 worker.')
+
+        f = Filter(where) if where else None
+        steps = (['metadata'] if metadata else []) + \
+            (['versions'] if historical else [])
+
+        projects = self.projects
+        on_disk = hasattr(projects, 'scan')
+
+        # the order to get the projects in (positions)
+        queue = range(len(projects))
+        if order:
+            keys = parse_keys(order)
+            if not all(k.on_project for k in keys):
+                raise Exception('Projects can only be got in order of '
+                                'project keys.')
+            key, reverse = composite_key(keys)
+            ranks = [key(p) for p in
+                     (projects.scan() if on_disk else projects)]
+            queue = sorted(queue, key=ranks.__getitem__, reverse=reverse)
+            warn_missing(keys)
+
+        def fetch(p: Project, needed: List[str]) -> dict:
+            """Fetches a project (in a worker thread); returns the status of
+            each step."""
+            statuses = {}
+            if 'metadata' in needed:
+                statuses['metadata'] = self.api.get_project(p, **kwargs)
+            if 'versions' in needed:
+                statuses['versions'] = self.api.get_versions(
+                    p, historical=historical, **kwargs)
+            return statuses
+
+        def succeeded(p: Project) -> bool:
+            for step in steps:
+                state = p.fetched(step)
+                if not state or not 200 <= (state['status'] or 0) < 300:
+                    return False
+            if historical and not p.versions:
+                return False
+            if f and f.on_projects and not f.on_projects(p):
+                return False
+            if f and f.on_versions and \
+                    not any(f.on_versions(v) for v in p.versions):
+                return False
+            return True
+
+        # positions of the projects that succeeded (by rank) and failed
+        successes = []
+        failures = set()
+        judged = 0
+        out_of_time = False
+
+        start = time.time()
+        bar = progress(total=target or len(projects), unit='project',
+                       leave=False, desc='         Getting projects')
+
+        def judge(rank: int, i: int, p: Project) -> None:
+            if succeeded(p):
+                successes.append((rank, i))
+                bar.update(1)
+            else:
+                failures.add(i)
+                if not target:
+                    bar.update(1)
+
+        # Note: Only workers projects are in flight at a time (a sliding
+        # window over the queue), so stopping never leaves a backlog of
+        # requests to wait for.
+        in_flight = {}
+        ranked = enumerate(queue)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            while True:
+                # top up the frontier
+                while len(in_flight) < workers:
+                    if target and len(successes) >= target:
+                        break
+                    if budget is not None and time.time() - start >= \
+                            budget.total_seconds():
+                        out_of_time = True
+                        break
+                    rank, i = next(ranked, (None, None))
+                    if rank is None:
+                        break
+
+                    p = projects[i]
+                    judged += 1
+                    needed = [step for step in steps
+                              if not (checkpoint and
+                                      checkpoint.is_done(step, i))
+                              and p.needs_fetch(step, only_missing,
+                                                retry_failed, max_age)]
+                    if not needed:
+                        judge(rank, i, p)
+                        continue
+
+                    record(p, versions='versions' in needed)
+                    future = pool.submit(fetch, p, needed)
+                    in_flight[future] = (rank, i, p, needed)
+
+                if not in_flight:
+                    break
+
+                # wait for a project to finish (or the budget to run out)
+                timeout = None
+                if budget is not None and not out_of_time:
+                    timeout = max(0.0, start + budget.total_seconds() -
+                                  time.time())
+                done, _ = wait(list(in_flight), timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    rank, i, p, needed = in_flight.pop(future)
+                    try:
+                        statuses = future.result()
+                    except CriticalApiError:
+                        # eg, a bad token or a rate limit (the whole get
+                        # stops; see "get --resume")
+                        raise
+                    except Exception as e:
+                        # Note: One project's error (eg, a bad response)
+                        # fails that project, not the whole get.
+                        print('         Warning: Error getting project '
+                              '{:,} ({}); counting it as failed.'
+                              .format(i + 1, e))
+                        statuses = {step: 0 for step in needed}
+                    for step in needed:
+                        p.set_fetched(step, statuses[step])
+                        if checkpoint:
+                            checkpoint.save(step, i, p)
+                    if on_disk:
+                        # write back the project (it may have been paged
+                        # out while it was being fetched)
+                        projects[i] = p
+                    judge(rank, i, p)
+
+        bar.close()
+
+        # keep the successes (up to the target) and anything not yet got
+        # Note: Failures are only dropped when the get has something to
+        # select on; a plain (eg, concurrent) get keeps them like a serial
+        # one does.
+        drop = bool(target or where)
+        if target:
+            kept = sorted([i for _, i in sorted(successes)[:target]])
+        elif drop:
+            kept = [i for i in range(len(projects)) if i not in failures]
+        else:
+            kept = range(len(projects))
+
+        if len(kept) < len(projects):
+            record(self)
+            if on_disk:
+                # disk-backed projects are selected on disk by position
+                projects.select(kept)
+            else:
+                self.projects = [projects[i] for i in kept]
+
+        print('         Got {:,} projects ({:,} failed{}).'
+              .format(len(successes), len(failures),
+                      ' and dropped' if drop else ''))
+        if target and len(successes) < target:
+            print('         Warning: Only {:,} of the {:,} projects wanted '
+                  'succeeded{}.'.format(len(successes), target,
+                                        ' before the time budget ran out'
+                                        if out_of_time else ''))
+        elif out_of_time:
+            print('         The time budget ran out with {:,} projects left '
+                  'to get (see "get --only-missing").'
+                  .format(len(projects) - judged))
+
+    def refresh(self, other: 'Dataset', flag_removed: bool = False) -> None:
+        """Refreshes the dataset from a newer load of the list it came from
+        (other), keeping what's been fetched for the projects still on the
+        list: their list values (eg, ranks or download counts) are updated,
+        projects new to the list are added and projects no longer on it are
+        dropped (or flagged as delisted and moved to the end). Projects end
+        up in the list's order."""
+        # Note: Projects are matched on their canonical keys (see
+        # Project.canonical_key) via a hash index of the dataset, so even a
+        # million-project list is diffed in a single pass over each side.
+        if other.registry != self.registry:
+            raise Exception("Can't refresh a %s dataset from a %s list."
+                            % (self.registry, other.registry))
+
+        projects = self.projects
+        on_disk = hasattr(projects, 'scan')
+        n = len(projects)
+
+        # canonical key -> position of the dataset's projects
+        index = {}
+        for i, p in enumerate(projects.scan() if on_disk else projects):
+            index.setdefault(p.canonical_key(), i)
+
+        # positions (in the dataset, then the new projects) in list order
+        order = []
+        kept = bytearray(n)
+        new = []
+        updated = 0
+
+        record(self)
+        for q in progress(other.projects, unit='project', leave=False,
+                          desc='         Refreshing'):
+            key = q.canonical_key()
+            i = index.get(key, None)
+            if i is None:
+                index[key] = n + len(new)
+                order.append(n + len(new))
+                new.append(q)
+                continue
+            if i >= n or kept[i]:
+                # listed twice
+                continue
+
+            order.append(i)
+            kept[i] = 1
+            p = projects[i]
+            if _relist(p, q):
+                updated += 1
+                if on_disk:
+                    projects[i] = p
+
+        # projects that are no longer listed
+        removed = [i for i in range(n) if not kept[i]]
+        if flag_removed:
+            for i in removed:
+                p = projects[i]
+                if not p.__dict__.get('delisted', False):
+                    record(p)
+                    p.delisted = True
+                    if on_disk:
+                        projects[i] = p
+            order.extend(removed)
+
+        if on_disk:
+            # disk-backed projects are reordered on disk by position
+            projects.extend(new)
+            projects.select(order)
+        else:
+            self.projects = [projects[i] if i < n else new[i - n]
+                             for i in order]
+
+        print('         Refreshed to {:,} projects: {:,} kept ({:,} updated), '
+              '{:,} added and {:,} {}. Use "get --only-missing" to get the '
+              'new projects.'
+              .format(len(self.projects), n - len(removed), updated, len(new),
+                      len(removed),
+                      'flagged as delisted' if flag_removed else 'dropped'))
 
     def find_project(self, **kwargs) -> Optional[Project]:
         """Gets the first project with attributes matching all kwargs."""
@@ -283,12 +675,69 @@ class Dataset(object):
 
         return None
 
+    def __setstate__(self, state: dict) -> None:
+        # backups made before the projects property existed
+        if 'projects' in state:
+            state['_projects'] = state.pop('projects')
+        self.__dict__.update(state)
+
     def __repr__(self):
         return 'Dataset(%s' % ', '.join([
             '%s=%s' % (a, repr(getattr(self, a)))
             for a in dir(self)
             if getattr(self, a, None)
-               and a is not 'projects'                  # ignore projects list
+               and a not in ['projects', '_projects']   # ignore projects list
                and not a.startswith('__')          # ignore dunders
                and not callable(getattr(self, a))  # ignore functions
         ]) + ', projects=[%s])' % ('...' if self.projects else '')
+
+
+def _skipped(n: int, resumed: int = 0) -> str:
+    """Notes how many projects a get skipped and how many a resumed get's
+    checkpoint already had (if any)."""
+    notes = []
+    if n:
+        notes.append('{:,} skipped'.format(n))
+    if resumed:
+        notes.append('{:,} already got before resuming'.format(resumed))
+    return ' (%s)' % ', '.join(notes) if notes else ''
+
+
+# project attributes that don't come from a list
+_UNLISTED = frozenset(['versions', 'uuids_', 'meta_', 'raw_', 'fetch_',
+                       'readonly_'])
+
+# placeholder for attributes that don't exist on a project
+_MISSING = object()
+
+
+def _relist(p: Project, q: Project) -> bool:
+    """Updates a project with its values in a newer load of a list (q);
+    returns whether anything changed."""
+    # Note: Values are compared with the project's decoded values (getattr
+    # decodes any that are still only in its raw response), so values that
+    # haven't changed (eg, every field of a github list entry) don't count.
+    changes = {k: val for k, val in q.__dict__.items()
+               if k not in _UNLISTED and getattr(p, k, _MISSING) != val}
+    raw = {k: val for k, val in q.raw().items()
+           if getattr(p, k, _MISSING) != val}
+    attrs = p.__dict__
+    if not (changes or raw or 'delisted' in attrs):
+        return False
+
+    record(p)
+    attrs.pop('delisted', None)
+
+    # Note: List values are plain data (never uuids), so they're set
+    # directly rather than through Project.update.
+    attrs.update(changes)
+
+    # metadata that came with the list (eg, github search results); the
+    # list's fetch state only replaces the project's if the metadata changed
+    if raw:
+        p.update_raw(raw)
+        state = q.fetched('metadata')
+        if state:
+            p.set_fetched('metadata', **state)
+
+    return True
@@ -0,0 +1,285 @@
+import io
+import os
+import re
+import json
+from typing import Iterator, List
+
+# Note: Encoders are built once; json.dumps builds a new one per call
+# whenever it's given any options.
+_PRETTY = json.JSONEncoder(indent=4)
+_COMPACT = json.JSONEncoder(separators=(',', ':'))
+_DECODER = json.JSONDecoder()
+
+# json whitespace (between values)
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class InputsetWriter(object):
+    """Writes an r2c input set one project's inputs at a time, so the whole
+    input set never has to be held in memory.
+
+    Formats:
+      - pretty json (default), byte-for-byte what json.dump(inputset,
+        indent=4) writes
+      - compact json (no whitespace)
+      - json lines: the header (everything but the inputs) on the first
+        line, then one input per line
+
+    Files ending in '.gz' are gzipped. With more than one shard, projects
+    are dealt round-robin into that many files (eg, 'set-00000-of-00004.json'
+    and so on), each of which is a complete input set with the same header.
+    Files are written under a temporary name and only moved into place once
+    everything has been written.
+    """
+
+    def __init__(self, filepath: str, header: dict, compact: bool = False,
+                 jsonl: bool = False, shards: int = 1):
+        if shards < 1:
+            raise Exception('The number of shards must be at least 1.')
+
+        self.header = header
+        self.compact = compact or jsonl
+        self.jsonl = jsonl
+        self.shards = shards
+
+        self.paths = [filepath] if shards == 1 else \
+            [shard_path(filepath, i, shards) for i in range(shards)]
+        self._files = []
+
+        # number of inputs written to each shard
+        self.counts = [0] * shards
+
+        # number of projects written (for dealing them out to the shards)
+        self._projects = 0
+
+    def open(self) -> 'InputsetWriter':
+        for path in self.paths:
+            file = _open(path + '.tmp')
+            self._files.append(file)
+            file.write(self._begin())
+
+        return self
+
+    def write(self, inputs: List[dict]) -> None:
+        """Writes a project's inputs (to the next shard)."""
+        i = self._projects % self.shards
+        self._projects += 1
+
+        if not inputs:
+            return
+
+        if self.jsonl:
+            text = ''.join([_COMPACT.encode(inp) + '\n' for inp in inputs])
+        elif self.compact:
+            text = (',' if self.counts[i] else '') + \
+                ','.join([_COMPACT.encode(inp) for inp in inputs])
+        else:
+            # encode the project's inputs as a list (one encoder call), then
+            # drop the brackets and indent the inputs one level deeper, the
+            # way json.dump would at this depth
+            text = _PRETTY.encode(inputs)[2:-2].replace('\n', '\n    ')
+            text = (',\n    ' if self.counts[i] else '\n    ') + text
+
+        self._files[i].write(text)
+        self.counts[i] += len(inputs)
+
+    def close(self) -> None:
+        """Finishes the files and moves them into place."""
+        for i, (file, path) in enumerate(zip(self._files, self.paths)):
+            if not self.jsonl:
+                if self.compact:
+                    file.write(']}')
+                else:
+                    file.write('\n    ]\n}' if self.counts[i] else ']\n}')
+            file.close()
+            os.replace(path + '.tmp', path)
+
+        self._files = []
+
+    def abort(self) -> None:
+        """Closes and deletes any partially written files."""
+        for file, path in zip(self._files, self.paths):
+            file.close()
+            os.remove(path + '.tmp')
+
+        self._files = []
+
+    def _begin(self) -> str:
+        """The start of a file (up to the first input)."""
+        if self.jsonl:
+            return json.dumps(self.header, separators=(',', ':')) + '\n'
+
+        if self.compact:
+            text = json.dumps({**self.header, 'inputs': []},
+                              separators=(',', ':'))
+        else:
+            text = json.dumps({**self.header, 'inputs': []}, indent=4)
+
+        # cut the json off right after the inputs list's opening bracket
+        return text[:text.rindex('[') + 1]
+
+    def __enter__(self) -> 'InputsetWriter':
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+
+class InputsetReader(object):
+    """Reads an r2c input set one input at a time, so the whole file never
+    has to be held in memory. Reads anything InputsetWriter writes: pretty
+    or compact json, or json lines (with or without a header line), any of
+    them gzipped (detected from the file's contents).
+
+    Iterating over the reader yields the inputs; the rest of the input set
+    (name, version, etc.) is in the header once they've all been read.
+    """
+
+    def __init__(self, filepath: str, chunk_size: int = 1 << 20):
+        self.filepath = filepath
+        self.chunk_size = chunk_size
+        self.header = {}
+
+    def __iter__(self) -> Iterator[dict]:
+        with _open_read(self.filepath) as file:
+            buf = _Buffer(file, self.chunk_size)
+
+            # the input set object (or, in json lines, the header line)
+            buf.expect('{')
+            if buf.peek() != '}':
+                while True:
+                    key = buf.value()
+                    buf.expect(':')
+                    if key == 'inputs':
+                        for input_ in buf.items():
+                            yield input_
+                    else:
+                        self.header[key] = buf.value()
+
+                    if buf.peek() == '}':
+                        break
+                    buf.expect(',')
+            buf.expect('}')
+
+            # json lines without a header start right in on the inputs
+            if 'input_type' in self.header:
+                input_, self.header = self.header, {}
+                yield input_
+
+            # any further values are json lines inputs
+            while buf.peek():
+                yield buf.value()
+
+
+class _Buffer(object):
+    """A window onto a text file, for decoding json values one at a time
+    (kind names what's being read, for errors)."""
+
+    def __init__(self, file: io.TextIOBase, chunk_size: int,
+                 kind: str = 'input set'):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.kind = kind
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+
+    def _more(self) -> bool:
+        """Reads the next chunk of the file (dropping what's been read)."""
+        chunk = self.file.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+
+        self.text = self.text[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skips whitespace; returns the next character ('' at the end)."""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text):
+                return self.text[self.pos]
+            if not self._more():
+                return ''
+
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise Exception('Invalid %s; expected "%s" but found "%s".'
+                            % (self.kind, char,
+                               self.peek()[:1] or 'the end'))
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next json value."""
+        self.peek()
+        while True:
+            try:
+                val, end = _DECODER.raw_decode(self.text, self.pos)
+
+                # a value that runs to the end of the text may be cut off
+                # (eg, a number), unless it's the end of the file
+                if end < len(self.text) or self.eof:
+                    self.pos = end
+                    return val
+
+            except json.JSONDecodeError as e:
+                if self.eof:
+                    raise Exception('Invalid %s json: %s' % (self.kind, e))
+
+            self._more()
+
+    def items(self) -> Iterator:
+        """Decodes the values of the next json list one at a time."""
+        self.expect('[')
+        if self.peek() != ']':
+            while True:
+                yield self.value()
+
+                if self.peek() == ']':
+                    break
+                self.expect(',')
+        self.expect(']')
+
+
+def shard_path(filepath: str, i: int, shards: int) -> str:
+    """Numbers a shard's file path, eg, 'set.json.gz' ->
+    'set-00001-of-00004.json.gz'."""
+    gz = '.gz' if filepath.endswith('.gz') else ''
+    base, ext = os.path.splitext(filepath[:len(filepath) - len(gz)])
+
+    return '%s-%05d-of-%05d%s%s' % (base, i, shards, ext, gz)
+
+
+def _open(path: str) -> io.TextIOBase:
+    """Opens a file for writing text, gzipping it if it's a temporary
+    '.gz.tmp' file."""
+    if path.endswith('.gz.tmp'):
+        import gzip
+
+        # Note: The gzip header's timestamp is zeroed so that exporting the
+        # same dataset twice gives identical files; level 6 (zlib's default)
+        # is much faster than gzip's default of 9, for slightly larger files.
+        return io.TextIOWrapper(gzip.GzipFile(path, mode='wb', mtime=0,
+                                              compresslevel=6),
+                                encoding='utf-8')
+
+    return open(path, 'w', encoding='utf-8')
+
+
+def _open_read(path: str) -> io.TextIOBase:
+    """Opens a file for reading text, ungzipping it if it's gzipped."""
+    with open(path, 'rb') as file:
+        magic = file.read(2)
+
+    if magic == b'\x1f\x8b':
+        import gzip
+
+        return io.TextIOWrapper(gzip.GzipFile(path, mode='rb'),
+                                encoding='utf-8')
+
+    return open(path, 'r', encoding='utf-8')
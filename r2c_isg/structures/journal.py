@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from typing import Optional
+
+
+# the journal currently recording changes (if any)
+_active: Optional['Journal'] = None
+
+
+class Journal(object):
+    """Records the state of datasets, projects and versions right before
+    they're first changed, so a command can be rolled back (or undone) in
+    O(changes) instead of deep-copying the whole dataset beforehand.
+
+    Only an object's attribute dict is recorded (with any list attributes
+    shallow-copied), so objects must be recorded before being mutated;
+    record() is a no-op when no journal is active. Disk-backed project
+    stores (and snapshot views) are rolled back by the stores themselves:
+    whatever their savepoint() returns is handed back to their rollback().
+    """
+
+    def __init__(self):
+        # id(obj) -> (obj, state); in the order they were recorded
+        self._states = OrderedDict()
+        # [(store, savepoint)]
+        self._stores = []
+        self.committed = False
+
+    def start(self) -> 'Journal':
+        """Makes this the active journal."""
+        global _active
+        _active = self
+        return self
+
+    def record(self, obj: object, versions: bool = False) -> None:
+        """Records an object's state (only the first time it's recorded)."""
+        if id(obj) not in self._states:
+            if isinstance(obj, dict):
+                state = obj.copy()
+            else:
+                state = {k: (list(val) if isinstance(val, list) else val)
+                         for k, val in vars(obj).items()}
+
+                # disk-backed projects are rolled back by the store itself
+                for val in state.values():
+                    if hasattr(val, 'savepoint') and \
+                            all(val is not s for s, _ in self._stores):
+                        self._stores.append((val, val.savepoint()))
+
+            self._states[id(obj)] = (obj, state)
+
+        if versions:
+            # also record the project's versions
+            for v in obj.versions:
+                self.record(v)
+
+    def commit(self) -> None:
+        """Stops recording; the journal can still be used to undo."""
+        global _active
+        if _active is self:
+            _active = None
+
+        for store, _ in self._stores:
+            store.release()
+        self.committed = True
+
+    def rollback(self) -> None:
+        """Restores every recorded object to its recorded state."""
+        global _active
+        if _active is self:
+            _active = None
+
+        if self.committed and [s for s, _ in self._stores
+                               if not getattr(s, 'undoable', False)]:
+            raise Exception('Changes to disk-backed datasets are written to '
+                            'disk as soon as they succeed; they cannot be '
+                            'undone.')
+
+        for store, saved in self._stores:
+            store.rollback(saved)
+
+        for obj, state in reversed(list(self._states.values())):
+            attrs = obj if isinstance(obj, dict) else vars(obj)
+            attrs.clear()
+            attrs.update(state)
+
+        self._states.clear()
+        self._stores = []
+
+
+def record(obj: object, versions: bool = False) -> None:
+    """Records an object's state in the active journal (if there is one)."""
+    # objects are always recorded right before they're changed, so this is
+    # where read-only projects/versions (see SnapshotView) are caught
+    if getattr(obj, '__dict__', {}).get('readonly_', False):
+        raise Exception('Projects in a snapshot view are read-only; restore '
+                        'the snapshot without --view to change them.')
+
+    if _active:
+        _active.record(obj, versions=versions)
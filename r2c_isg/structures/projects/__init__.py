@@ -1,4 +1,4 @@
-from ._project import Project
+from ._project import Project, normalize_url
 from .default_project import DefaultProject
 from .github_repo import GithubRepo
 from .npm_package import NpmPackage
@@ -1,11 +1,18 @@
+import re
+from datetime import datetime, timedelta
 from typing import List, Optional
 from types import MethodType
 
+from r2c_isg.structures._lazy import LazyAttrs
 from r2c_isg.structures.versions import Version
 
+# how fetch times are recorded (utc)
+FETCHED_AT_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
 
-class Project(object):
-    def __init__(self, uuids_: dict = {}, meta_: dict = {}, **kwargs):
+
+class Project(LazyAttrs):
+    def __init__(self, uuids_: dict = {}, meta_: dict = {},
+                 raw_: dict = None, **kwargs):
         # a project contains versions
         self.versions: List[Version] = []
 
@@ -20,6 +27,10 @@ class Project(object):
         # load all attributes into the project
         self.update(**kwargs)
 
+        # keep any raw api response undecoded until it's needed
+        if raw_:
+            self.update_raw(raw_)
+
     def update(self, **kwargs) -> None:
         """Populates the project with data from a dictionary."""
         for k, val in kwargs.items():
@@ -39,6 +50,16 @@ class Project(object):
         # eg, extracting it from a url
         return self.uuids_.get('name', '')
 
+    def canonical_key(self) -> str:
+        """Returns a key that's the same for every spelling of the project
+        (eg, http vs https urls, letter case or a trailing slash), so
+        duplicates can be found in a single pass."""
+        # child functions can override this with registry-specific rules
+        if 'url' in self.uuids_:
+            return normalize_url(self.uuids_['url']())
+
+        return str(self.uuids_['name']()).strip().lower()
+
     def find_version(self, **kwargs) -> Optional[Version]:
         """Gets a version matching all kwargs or returns None."""
 
@@ -58,6 +79,53 @@ class Project(object):
 
         return None
 
+    def dependency_names(self) -> Optional[List[str]]:
+        """Returns the names of the projects this project depends on (from
+        its metadata), or None if they aren't known."""
+        # child functions can override this with registry-specific rules
+        return None
+
+    def fetched(self, step: str) -> Optional[dict]:
+        """How the project's metadata or versions (step) were last fetched
+        (fetched_at, status and source), or None if they never were."""
+        return self.__dict__.get('fetch_', {}).get(step, None)
+
+    def set_fetched(self, step: str, status: int, source: str = 'api',
+                    fetched_at: str = None) -> None:
+        """Records a fetch of the project's metadata or versions (step)."""
+        # Note: The fetch state is replaced rather than changed in place, so
+        # the journal's shallow copy of the project can roll it back.
+        fetch = dict(self.__dict__.get('fetch_', {}))
+        fetch[step] = {
+            'fetched_at': fetched_at or
+            datetime.utcnow().strftime(FETCHED_AT_FORMAT),
+            'status': status,
+            'source': source
+        }
+        self.fetch_ = fetch
+
+    def needs_fetch(self, step: str, only_missing: bool = False,
+                    retry_failed: bool = False,
+                    max_age: timedelta = None) -> bool:
+        """Whether a get should fetch the project's metadata or versions
+        (step). With no options, everything is fetched; otherwise only
+        projects that were never fetched (only_missing), whose last fetch
+        failed (retry_failed) or that aren't fresh (max_age; ie, never
+        fetched, failed or fetched longer ago than max_age) are."""
+        if not (only_missing or retry_failed or max_age):
+            return True
+
+        state = self.fetched(step)
+        if state is None:
+            return only_missing or bool(max_age)
+
+        if not 200 <= (state['status'] or 0) < 300:
+            return retry_failed or bool(max_age)
+
+        fetched_at = datetime.strptime(state['fetched_at'],
+                                       FETCHED_AT_FORMAT)
+        return bool(max_age) and datetime.utcnow() - fetched_at > max_age
+
     def to_inputset(self) -> list:
         """Vanilla project can't be converted to an r2c input set."""
         # Note: The only time a vanilla Project is used is in the function
@@ -81,3 +149,19 @@ class Project(object):
         return '%s(%s, versions=[%s])' % (cls,
                                           ', '.join(uuids),
                                           ', '.join(versions))
+
+
+def normalize_url(url: str) -> str:
+    """Strips the parts of a url that don't identify a project (scheme,
+    'www.', '.git', trailing slashes, queries) and lowercases it; eg,
+    'https://www.GitHub.com/Org/Repo.git/' -> 'github.com/org/repo'."""
+    url = url.strip().lower()
+    url = re.sub(r'^[a-z0-9+.-]+://', '', url)
+    url = re.sub(r'^git@([^:/]+):', r'\1/', url)
+    url = re.split(r'[?#]', url)[0].rstrip('/')
+    if url.startswith('www.'):
+        url = url[4:]
+    if url.endswith('.git'):
+        url = url[:-4]
+
+    return url
@@ -1,4 +1,4 @@
-from r2c_isg.structures.projects import Project
+from r2c_isg.structures.projects import Project, normalize_url
 
 
 class GithubRepo(Project):
@@ -17,6 +17,19 @@ class GithubRepo(Project):
         # pull the name from the url
         return self.uuids_['url']().strip('/').split('/')[-1]
 
+    def canonical_key(self) -> str:
+        """Returns the repo's lowercased owner/name (eg, 'org/repo')."""
+        if 'name' in self.uuids_ and 'org' in self.meta_:
+            return ('%s/%s' % (self.meta_['org'](),
+                               self.uuids_['name']())).lower()
+
+        # pull the owner/name from the url (eg, github.com/org/repo/tree/x,
+        # or api.github.com/repos/org/repo)
+        parts = normalize_url(self.uuids_['url']()).split('/')
+        if parts[0].startswith('api.') and parts[1:2] == ['repos']:
+            parts = parts[1:]
+        return '/'.join(parts[1:3])
+
     def to_inputset(self) -> list:
         """Converts github repos/commits to GitRepo/GitRepoCommit dict."""
         self.check_guarantees()
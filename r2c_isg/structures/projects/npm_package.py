@@ -1,4 +1,7 @@
-from r2c_isg.structures.projects import Project
+from typing import List, Optional
+from urllib.parse import unquote
+
+from r2c_isg.structures.projects import Project, normalize_url
 
 
 class NpmPackage(Project):
@@ -16,6 +19,46 @@ class NpmPackage(Project):
         # pull the name from the url
         return self.uuids_['url']().strip('/').split('/')[-1]
 
+    def canonical_key(self) -> str:
+        """Returns the package's (possibly scoped) name, eg, '@scope/name'."""
+        # Note: Names keep their case; the npm registry is case-sensitive,
+        # and some older packages have uppercase names.
+        if 'name' in self.uuids_:
+            name = self.uuids_['name']()
+            return (unquote(name) if '%' in name else name).strip()
+
+        # pull the name from the url (eg, npmjs.com/package/@scope/name/v/1)
+        url = self.uuids_['url']().strip().rstrip('/')
+        parts = unquote(url).split('/')
+        if 'package' in parts:
+            parts = parts[parts.index('package') + 1:]
+            if parts[0].startswith('@') and len(parts) > 1:
+                return '/'.join(parts[:2])
+            return parts[0]
+
+        return normalize_url(url).split('/')[-1]
+
+    def dependency_names(self) -> Optional[List[str]]:
+        """Returns the names of the packages the latest release depends on,
+        or None if the package's metadata hasn't been fetched."""
+        deps = getattr(self, 'dependencies', None)
+        if deps is None:
+            return None
+
+        names = []
+        for name, spec in deps.items():
+            spec = str(spec)
+            if spec.startswith('npm:'):
+                # an alias, eg, 'npm:@scope/name@^1.0'
+                alias = spec[4:]
+                at = alias.rfind('@')
+                names.append(alias[:at] if at > 0 else alias)
+            elif ':' not in spec:
+                # skip git, url and file dependencies
+                names.append(name)
+
+        return names
+
     def to_inputset(self) -> list:
         """Converts npm packages/versions to PackageVersion dict."""
         self.check_guarantees()
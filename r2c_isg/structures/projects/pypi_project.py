@@ -1,4 +1,14 @@
-from r2c_isg.structures.projects import Project
+import re
+from typing import List, Optional
+
+from r2c_isg.structures.projects import Project, normalize_url
+
+# placeholder for metadata that hasn't been fetched
+_MISSING = object()
+
+# a requirement's project name (see PEP 508), and an extra's marker
+_NAME = re.compile(r'\s*[A-Za-z0-9][A-Za-z0-9._-]*')
+_EXTRA = re.compile(r';.*\bextra\s*==')
 
 
 class PypiProject(Project):
@@ -16,6 +26,38 @@ class PypiProject(Project):
         # pull the name from the url
         return self.uuids_['url']().strip('/').split('/')[-1]
 
+    def canonical_key(self) -> str:
+        """Returns the project's normalized name (see PEP 503), eg,
+        'Zope.Interface' -> 'zope-interface'."""
+        if 'name' in self.uuids_:
+            name = self.uuids_['name']()
+        else:
+            # pull the name from the url (eg, pypi.org/project/name/1.0)
+            parts = normalize_url(self.uuids_['url']()).split('/')
+            name = parts[parts.index('project') + 1] \
+                if 'project' in parts[:-1] else parts[-1]
+
+        return re.sub(r'[-_.]+', '-', name.strip()).lower()
+
+    def dependency_names(self) -> Optional[List[str]]:
+        """Returns the names of the projects the latest release requires
+        (skipping extras), or None if the project's metadata hasn't been
+        fetched."""
+        requires = getattr(self, 'requires_dist', _MISSING)
+        if requires is _MISSING:
+            return None
+
+        names = []
+        for req in requires or []:
+            # skip optional requirements, eg, 'pytest; extra == "test"'
+            if _EXTRA.search(req):
+                continue
+            match = _NAME.match(req)
+            if match:
+                names.append(match.group(0).strip())
+
+        return names
+
     def to_inputset(self) -> list:
         """Converts pypi projects/releases to PackageVersion dict."""
         self.check_guarantees()
@@ -0,0 +1,604 @@
+import os
+import sys
+import json
+import mmap
+import base64
+import struct
+import zipfile
+import tempfile
+import shutil
+from array import array
+from collections.abc import Sequence
+from datetime import timedelta
+from types import FunctionType, MethodType
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, \
+    Optional
+
+if TYPE_CHECKING:
+    from r2c_isg.structures import Dataset, Project
+
+# Note: Snapshots are zip files of json lines, so they only need the
+# standard library. The layout is recorded in the manifest and versioned by
+# SCHEMA; bump it (and teach Snapshot to read the old layout) whenever the
+# layout changes.
+FORMAT = 'r2c-isg-snapshot'
+SCHEMA = 1
+
+# column groups (one line per project in each); restoring can skip any but
+# the projects group
+GROUPS = ['projects', 'versions', 'identities']
+
+_ENCODER = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False,
+                            default=str)
+
+# attributes that are stored in their own columns (or not at all)
+_SPECIAL = ('versions', 'uuids_', 'meta_', 'raw_', 'readonly_')
+
+
+def _classes() -> dict:
+    """Project/version classes by name."""
+    from r2c_isg.structures.projects import Project, DefaultProject, \
+        project_map
+    from r2c_isg.structures.versions import Version, version_map
+
+    classes = [Project, DefaultProject, Version] + \
+        list(project_map.values()) + list(version_map.values())
+    return {c.__name__: c for c in classes}
+
+
+class _Probe(object):
+    """Records the attributes a uuid/meta function reads."""
+
+    def __init__(self):
+        self.attrs_ = []
+
+    def __getattr__(self, attr):
+        self.attrs_.append(attr)
+        return _Value()
+
+
+class _Value(object):
+    """An attribute read from a probe; using it in any way fails."""
+
+    def __bool__(self):
+        raise TypeError('probe value')
+
+
+def _getter_attr(func: FunctionType) -> Optional[str]:
+    """The attribute a function returns, if it does nothing but return an
+    attribute (eg, lambda p: p.url)."""
+    probe = _Probe()
+    try:
+        val = func(probe)
+    except Exception:
+        return None
+
+    if isinstance(val, _Value) and len(probe.attrs_) == 1:
+        return probe.attrs_[0]
+    return None
+
+
+def _getter(attr: str) -> FunctionType:
+    return lambda o: getattr(o, attr)
+
+
+class Records(object):
+    """Turns projects/versions into json records ([class, uuids, meta,
+    attributes, raw]); the classes and uuid/meta functions they refer to are
+    collected into tables (see tables())."""
+
+    def __init__(self):
+        # class name/function (or its code or spec)/function set -> id
+        self._classes = {}
+        self._functions = {}
+        self._sets = {}
+
+        # the tables (by id)
+        self._class_list = []
+        self._specs = []
+        self._set_list = []
+
+    def record(self, obj: object) -> list:
+        """A project's/version's record."""
+        attrs = {k: v for k, v in vars(obj).items() if k not in _SPECIAL}
+        raw = vars(obj).get('raw_', None)
+
+        return [self._class_id(type(obj)),
+                self._set_id(obj.uuids_), self._set_id(obj.meta_),
+                attrs, raw.decode('utf-8') if raw else None]
+
+    def tables(self, since: dict = None) -> dict:
+        """The tables (or just the entries added after the sizes given by
+        a previous marks())."""
+        since = since or {}
+        return {
+            'classes': self._class_list[since.get('classes', 0):],
+            'functions': self._specs[since.get('functions', 0):],
+            'function_sets': self._set_list[since.get('function_sets', 0):]
+        }
+
+    def marks(self) -> dict:
+        """The sizes of the tables (see tables())."""
+        return {k: len(v) for k, v in self.tables().items()}
+
+    def _class_id(self, cls: type) -> int:
+        cid = self._classes.get(cls.__name__, None)
+        if cid is None:
+            cid = self._classes[cls.__name__] = len(self._class_list)
+            self._class_list.append(cls.__name__)
+        return cid
+
+    def _set_id(self, funcs: dict) -> int:
+        """Id of a set of uuid/meta functions (shared by most projects)."""
+        key = tuple([(k, self._function_id(m.__func__))
+                     for k, m in sorted(funcs.items())])
+        sid = self._sets.get(key, None)
+        if sid is None:
+            sid = self._sets[key] = len(self._set_list)
+            self._set_list.append([list(pair) for pair in key])
+        return sid
+
+    def _function_id(self, func: FunctionType) -> int:
+        fid = self._functions.get(func, None)
+        if fid is not None:
+            return fid
+
+        # loaders often make a new (but identical) lambda for each project,
+        # so plain functions are also looked up by their code
+        plain = not (func.__closure__ or func.__defaults__)
+        fid = self._functions.get(func.__code__, None) if plain else None
+        if fid is None:
+            # Note: Functions that just return an attribute (the vast
+            # majority) are stored by name, so they survive python upgrades;
+            # anything else is pickled.
+            attr = _getter_attr(func)
+            if attr:
+                spec = {'getter': attr}
+            else:
+                import dill
+
+                spec = {'dill': base64.b64encode(dill.dumps(func))
+                        .decode('ascii')}
+
+            key = json.dumps(spec)
+            fid = self._functions.get(key, None)
+            if fid is None:
+                fid = len(self._specs)
+                self._specs.append(spec)
+                self._functions[key] = fid
+
+        self._functions[func] = fid
+        if plain:
+            self._functions[func.__code__] = fid
+
+        return fid
+
+
+class Builder(object):
+    """Builds projects/versions from json records (see Records), given the
+    tables the records refer to."""
+
+    def __init__(self, tables: dict = None):
+        self._classes = []
+        self._functions = []
+        self._sets = []
+        if tables:
+            self.extend(tables)
+
+    def extend(self, tables: dict) -> None:
+        """Adds table entries (see Records.tables)."""
+        classes = _classes()
+        try:
+            self._classes.extend([classes[name]
+                                  for name in tables['classes']])
+        except KeyError as e:
+            raise Exception('Snapshot contains an unknown project/version '
+                            'type: %s.' % e)
+
+        for spec in tables['functions']:
+            if 'getter' in spec:
+                self._functions.append(_getter(spec['getter']))
+            else:
+                import dill
+
+                self._functions.append(
+                    dill.loads(base64.b64decode(spec['dill'])))
+
+        self._sets.extend([[(k, self._functions[fid]) for k, fid in pairs]
+                           for pairs in tables['function_sets']])
+
+    def build(self, record: list) -> object:
+        """Builds a project/version from its record."""
+        cls_id, uuids, meta, attrs, raw = record
+        obj = self._classes[cls_id].__new__(self._classes[cls_id])
+
+        # restore the object's state as it was (guarantees were checked
+        # when it was built)
+        state = obj.__dict__
+        state.update(attrs)
+        state['uuids_'] = {k: MethodType(f, obj) for k, f in self._sets[uuids]}
+        state['meta_'] = {k: MethodType(f, obj) for k, f in self._sets[meta]}
+        if raw is not None:
+            state['raw_'] = raw.encode('utf-8')
+
+        return obj
+
+
+class SnapshotWriter(object):
+    """Writes a dataset snapshot one project at a time."""
+
+    def __init__(self, filepath: str, compress: bool = False):
+        self.filepath = filepath
+        self.compression = zipfile.ZIP_DEFLATED if compress \
+            else zipfile.ZIP_STORED
+
+        # project/version records (and the tables they refer to)
+        self._records = Records()
+
+        # line offsets of each column group (n + 1 each)
+        self._offsets = {g: array('Q', [0]) for g in GROUPS}
+
+        self.versions = 0
+
+    def write(self, ds: 'Dataset', projects: Sequence = None) -> None:
+        """Writes the dataset to the snapshot file (with other projects than
+        its own, if given; eg, none)."""
+        from r2c_isg.util import progress
+
+        projects = ds.projects if projects is None else projects
+        tmp = self.filepath + '.tmp'
+        try:
+            with zipfile.ZipFile(tmp, 'w', self.compression) as zf, \
+                    tempfile.TemporaryFile() as versions, \
+                    tempfile.TemporaryFile() as identities:
+                files = {'versions': versions, 'identities': identities}
+                with zf.open('projects.jsonl', 'w', force_zip64=True) as f:
+                    files['projects'] = f
+                    for p in progress(projects.scan()
+                                      if hasattr(projects, 'scan')
+                                      else projects, total=len(projects),
+                                      desc='         Backing up',
+                                      unit='project', leave=False):
+                        self._write_project(p, files)
+
+                # copy over the other column groups
+                for group in ['versions', 'identities']:
+                    files[group].seek(0)
+                    with zf.open(group + '.jsonl', 'w',
+                                 force_zip64=True) as f:
+                        shutil.copyfileobj(files[group], f)
+
+                # the offsets are stored little-endian
+                index = b''
+                for group in GROUPS:
+                    offsets = self._offsets[group]
+                    if sys.byteorder != 'little':
+                        offsets.byteswap()
+                    index += offsets.tobytes()
+                zf.writestr('index.bin', index)
+
+                zf.writestr('manifest.json', json.dumps(
+                    self._manifest(ds, len(projects)), indent=4,
+                    default=str))
+
+            os.replace(tmp, self.filepath)
+
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _write_project(self, p: 'Project', files: dict) -> None:
+        """Writes a project's line in each column group."""
+        identity = {}
+        for k, func in p.uuids_.items():
+            try:
+                identity[k] = func()
+            except AttributeError:
+                pass
+
+        lines = {
+            'projects': self._records.record(p),
+            'versions': [self._records.record(v) for v in p.versions],
+            'identities': identity
+        }
+        self.versions += len(p.versions)
+
+        for group in GROUPS:
+            line = (_ENCODER.encode(lines[group]) + '\n').encode('utf-8')
+            files[group].write(line)
+            self._offsets[group].append(self._offsets[group][-1]
+                                        + len(line))
+
+    def _manifest(self, ds: 'Dataset', count: int) -> dict:
+        # dataset metadata (the transformation functions are rebuilt)
+        dataset = {k: v for k, v in vars(ds).items()
+                   if not k.startswith('_') and k != 'api'
+                   and not isinstance(v, MethodType)}
+
+        api = None
+        if ds.api:
+            api = {k: v for k, v in vars(ds.api).items()
+                   if not k.startswith('_')}
+            if isinstance(api.get('cache_timeout', None), timedelta):
+                api['cache_timeout'] = api['cache_timeout'].total_seconds()
+
+        return {
+            'format': FORMAT,
+            'schema': SCHEMA,
+            'dataset': dataset,
+            'api': api,
+            'projects': count,
+            'versions': self.versions,
+            'groups': GROUPS,
+            **self._records.tables()
+        }
+
+
+class Snapshot(object):
+    """A dataset snapshot file. Only the manifest is read up front; projects
+    are read (and built) one at a time."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self._zip = zipfile.ZipFile(filepath)
+
+        try:
+            self.manifest = json.loads(self._zip.read('manifest.json')
+                                       .decode('utf-8'))
+        except KeyError:
+            raise Exception('Invalid snapshot; it has no manifest.')
+
+        if self.manifest.get('format', None) != FORMAT:
+            raise Exception('Invalid snapshot; unrecognized format.')
+        if self.manifest['schema'] > SCHEMA:
+            raise Exception('Snapshot schema %s is newer than this version of '
+                            'r2c-isg supports (%s); please upgrade.'
+                            % (self.manifest['schema'], SCHEMA))
+
+        self._builder = Builder(self.manifest)
+
+    def __len__(self) -> int:
+        return self.manifest['projects']
+
+    def _lines(self, group: str) -> Iterator:
+        with self._zip.open(group + '.jsonl') as file:
+            for line in file:
+                yield json.loads(line.decode('utf-8'))
+
+    def identities(self) -> Iterator[dict]:
+        """Iterates over the projects' uuids (eg, {'url': ...}) without
+        building the projects."""
+        return self._lines('identities')
+
+    def projects(self, versions: bool = True) -> Iterator['Project']:
+        """Iterates over the projects (with or without their versions)."""
+        lines = self._lines('versions') if versions else None
+        for record in self._lines('projects'):
+            p = self.build(record)
+            p.versions = [self.build(r) for r in next(lines)] \
+                if versions else []
+            yield p
+
+    def build(self, record: list) -> object:
+        """Builds a project/version from its record."""
+        return self._builder.build(record)
+
+    def restore(self, store: str = None, versions: bool = True,
+                view: bool = False) -> 'Dataset':
+        """Builds the dataset (optionally into a disk-backed store, and
+        optionally without versions), or a read-only view of it."""
+        from r2c_isg.structures import Dataset
+        from r2c_isg.util import progress
+
+        if view and store:
+            raise Exception('Snapshot views are read straight from the '
+                            'snapshot; they cannot be put in a store.')
+
+        meta = dict(self.manifest['dataset'])
+        registry = meta.pop('registry', None)
+        ds = Dataset(registry, store=store)
+        for k, val in meta.items():
+            setattr(ds, k, val)
+
+        api = self.manifest.get('api', None)
+        if ds.api and api:
+            if api.get('cache_timeout', None) is not None:
+                api['cache_timeout'] = timedelta(
+                    seconds=api['cache_timeout'])
+            vars(ds.api).update(api)
+
+        if view:
+            ds._projects = SnapshotView(self.filepath, versions=versions)
+            return ds
+
+        projects = progress(self.projects(versions=versions),
+                            total=len(self), desc='         Restoring',
+                            unit='project', leave=False)
+        if store:
+            ds.projects.extend(projects)
+            ds.projects.flush()
+        else:
+            ds.projects = list(projects)
+
+        return ds
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+
+class SnapshotView(Sequence):
+    """A read-only list of a snapshot's projects, read straight from the
+    memory-mapped snapshot file.
+
+    The file is mapped rather than read, so any number of processes viewing
+    the same snapshot share one copy of it in the os page cache. Projects
+    are built each time they're accessed (and never cached), so changes to
+    them are lost; changing them (or their versions) raises an exception.
+    Transformations that only reorder or drop projects (eg, sort, trim,
+    sample, filter and dedupe) just replace the view's overlay: the list of
+    the snapshot positions it shows.
+    """
+
+    # changes to the overlay can be undone, even after they're committed
+    undoable = True
+
+    def __init__(self, filepath: str, versions: bool = True):
+        self.filepath = filepath
+        self.versions = versions
+
+        self._snapshot = Snapshot(filepath)
+        count = len(self._snapshot)
+
+        # map the file (read-only) and find the column groups in it
+        with open(filepath, 'rb') as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._starts = {group: self._member(group + '.jsonl')
+                        for group in GROUPS}
+
+        # line offsets of each column group (n + 1 each)
+        start = self._member('index.bin')
+        size = 8 * (count + 1)
+        self._offsets = {}
+        for i, group in enumerate(GROUPS):
+            view = memoryview(self._mm)[start + i * size:
+                                        start + (i + 1) * size]
+            if sys.byteorder == 'little':
+                self._offsets[group] = view.cast('Q')
+            else:
+                offsets = array('Q', view.tobytes())
+                offsets.byteswap()
+                self._offsets[group] = offsets
+                view.release()
+
+        # snapshot positions of the projects in the view
+        self._order = range(count)
+
+    def _member(self, name: str) -> int:
+        """Position of a member's data in the file."""
+        info = self._snapshot._zip.getinfo(name)
+        if info.compress_type != zipfile.ZIP_STORED:
+            raise Exception('Compressed snapshots cannot be viewed; back up '
+                            'the dataset without compression.')
+
+        # skip the member's local header (and its variable-length fields)
+        offset = info.header_offset
+        name_len, extra_len = struct.unpack(
+            '<2H', self._mm[offset + 26:offset + 30])
+        return offset + 30 + name_len + extra_len
+
+    def _line(self, group: str, pos: int):
+        offsets = self._offsets[group]
+        start = self._starts[group]
+        return json.loads(self._mm[start + offsets[pos]:
+                                   start + offsets[pos + 1]])
+
+    def _build(self, pos: int) -> 'Project':
+        """Builds the project at a snapshot position."""
+        p = self._readonly(self._snapshot.build(self._line('projects', pos)))
+        p.__dict__['versions'] = \
+            [self._readonly(self._snapshot.build(r))
+             for r in self._line('versions', pos)] if self.versions else []
+        return p
+
+    @staticmethod
+    def _readonly(obj: object) -> object:
+        # see journal.record
+        obj.__dict__['readonly_'] = True
+        return obj
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            # Note: Slices are materialized as regular lists.
+            return [self._build(pos) for pos in self._order[i]]
+        return self._build(self._order[i])
+
+    def __iter__(self) -> Iterator['Project']:
+        return self.scan()
+
+    def scan(self) -> Iterator['Project']:
+        """Iterates over the projects."""
+        for pos in self._order:
+            yield self._build(pos)
+
+    def identities(self) -> Iterator[dict]:
+        """Iterates over the projects' uuids (without building them)."""
+        for pos in self._order:
+            yield self._line('identities', pos)
+
+    def select(self, indices: List[int]) -> None:
+        """Keeps only the projects at the given indices (in that order)."""
+        order = self._order
+        self._order = array('Q', [order[i] for i in indices])
+
+    def sort(self, key: Callable = None, reverse: bool = False) -> None:
+        """Sorts the view in place; only the sort keys are held in memory."""
+        keys = [key(p) if key else p for p in self.scan()]
+        self.select(sorted(range(len(keys)), key=keys.__getitem__,
+                           reverse=reverse))
+
+    def __delitem__(self, i) -> None:
+        drop = range(len(self))[i]
+        if isinstance(drop, int):
+            drop = [drop]
+        drop = set(drop)
+        self.select([j for j in range(len(self)) if j not in drop])
+
+    def replace(self, projects: Iterable) -> None:
+        raise Exception('Snapshot views are read-only; restore the snapshot '
+                        'to change its projects.')
+
+    def __setitem__(self, i, project) -> None:
+        self.replace([project])
+
+    def append(self, project) -> None:
+        self.replace([project])
+
+    def savepoint(self) -> Sequence:
+        # Note: Overlays are replaced rather than changed, so the current one
+        # is all a journal needs to keep to undo changes (it's cheap).
+        return self._order
+
+    def release(self) -> None:
+        pass
+
+    def rollback(self, saved: Sequence) -> None:
+        self._order = saved
+
+    def close(self) -> None:
+        for offsets in self._offsets.values():
+            if isinstance(offsets, memoryview):
+                offsets.release()
+        self._offsets = {}
+        self._mm.close()
+        self._snapshot.close()
+
+    def __getstate__(self) -> dict:
+        # the snapshot file is the state; just save its location (and the
+        # overlay), so views are cheap to send to other processes
+        return {
+            'filepath': self.filepath,
+            'versions': self.versions,
+            'order': self._order
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['filepath'], versions=state['versions'])
+        self._order = state['order']
+
+    def __repr__(self):
+        return 'SnapshotView(%s, %d projects)' % (self.filepath, len(self))
+
+
+def is_snapshot(filepath: str) -> bool:
+    """Whether a file is a snapshot (rather than a pickled dataset)."""
+    return zipfile.is_zipfile(filepath)
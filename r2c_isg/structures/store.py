@@ -0,0 +1,376 @@
+import io
+import pickle
+import sqlite3
+import copyreg
+import weakref
+import dill
+from collections import OrderedDict
+from collections.abc import MutableSequence
+from types import FunctionType, MethodType
+from typing import Callable, Iterable, Iterator, List
+
+
+def _bind(func: FunctionType, obj: object) -> MethodType:
+    return MethodType(func, obj)
+
+
+def _reduce_method(method: MethodType) -> tuple:
+    # bound uuid/meta lambdas are rebuilt from the function and its project
+    return _bind, (method.__func__, method.__self__)
+
+
+class _Pickler(pickle.Pickler):
+    def __init__(self, file, store: 'ProjectStore'):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.store = store
+        self.dispatch_table = copyreg.dispatch_table.copy()
+        self.dispatch_table[MethodType] = _reduce_method
+
+    def persistent_id(self, obj):
+        # the uuid/meta lambdas are shared by every project, so they're
+        # stored once in the functions table instead of in every blob
+        if isinstance(obj, FunctionType):
+            return self.store._function_id(obj)
+        return None
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, store: 'ProjectStore'):
+        super().__init__(file)
+        self.store = store
+
+    def persistent_load(self, fid):
+        return self.store._function(fid)
+
+
+class ProjectStore(MutableSequence):
+    """A list of projects (and their versions) kept in a sqlite database.
+
+    Projects are paged in on demand and held in a bounded write-back cache,
+    so only a few pages of projects are ever in memory. Projects handed out
+    by the store are written back when they're paged out. The store keeps
+    weak references to the ones still in use after that, so changes made to
+    them later are written back when the store is flushed (and paging them
+    in again returns the same objects). Projects from scan() are copies;
+    changes to them are not saved.
+    """
+
+    def __init__(self, path: str, cache_size: int = 1000,
+                 page_size: int = 100):
+        self.path = path
+        self.cache_size = cache_size
+        self.page_size = page_size
+        self._connect()
+
+    def _connect(self) -> None:
+        self._db = sqlite3.connect(self.path)
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.execute('CREATE TABLE IF NOT EXISTS projects '
+                         '(pos INTEGER PRIMARY KEY, blob BLOB NOT NULL)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS functions '
+                         '(fid INTEGER PRIMARY KEY, blob BLOB NOT NULL)')
+        self._len = self._db.execute(
+            'SELECT COUNT(*) FROM projects').fetchone()[0]
+
+        # pos -> (project, blob as last read/written); oldest entries first
+        self._cache = OrderedDict()
+
+        # pos -> project, for every project handed out that's still in use;
+        # and pos -> blob as last written, for those that were paged out
+        self._live = weakref.WeakValueDictionary()
+        self._written = {}
+
+        # fid <-> function lookups for the functions table
+        self._fids = {}
+        self._functions = {}
+
+        # whether changes are being held back by a savepoint
+        self._saved = False
+
+    def _commit(self) -> None:
+        if not self._saved:
+            self._db.commit()
+
+    def savepoint(self) -> None:
+        """Holds back all further changes until release() or rollback()."""
+        self.flush()
+        self._db.execute('SAVEPOINT journal')
+        self._saved = True
+
+    def release(self) -> None:
+        """Commits all changes made since savepoint()."""
+        self.flush()
+        self._db.execute('RELEASE SAVEPOINT journal')
+        self._saved = False
+        self._db.commit()
+
+    def rollback(self, saved=None) -> None:
+        """Discards all changes made since savepoint()."""
+        self._saved = False
+        self._cache.clear()
+        self._move([])
+        self._db.execute('ROLLBACK TO SAVEPOINT journal')
+        self._db.execute('RELEASE SAVEPOINT journal')
+        self._db.commit()
+
+        # functions written since the savepoint are gone too
+        self._fids = {}
+        self._functions = {}
+        self._len = self._db.execute(
+            'SELECT COUNT(*) FROM projects').fetchone()[0]
+
+    def _function_id(self, func: FunctionType) -> int:
+        fid = self._fids.get(id(func), None)
+        if fid is None:
+            fid = self._db.execute(
+                'SELECT COALESCE(MAX(fid) + 1, 0) FROM functions'
+            ).fetchone()[0]
+            self._db.execute('INSERT INTO functions VALUES (?, ?)',
+                             (fid, dill.dumps(func)))
+            self._fids[id(func)] = fid
+            self._functions[fid] = func
+
+        return fid
+
+    def _function(self, fid: int) -> FunctionType:
+        func = self._functions.get(fid, None)
+        if func is None:
+            blob = self._db.execute('SELECT blob FROM functions WHERE fid = ?',
+                                    (fid,)).fetchone()[0]
+            func = dill.loads(blob)
+            self._fids[id(func)] = fid
+            self._functions[fid] = func
+
+        return func
+
+    def _dumps(self, project) -> bytes:
+        file = io.BytesIO()
+        _Pickler(file, self).dump(project)
+        return file.getvalue()
+
+    def _loads(self, blob: bytes):
+        return _Unpickler(io.BytesIO(blob), self).load()
+
+    def _index(self, i: int) -> int:
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('project store index out of range')
+        return i
+
+    def _load_page(self, i: int) -> None:
+        """Pages in the projects surrounding position i."""
+        start = i - i % self.page_size
+        rows = self._db.execute(
+            'SELECT pos, blob FROM projects WHERE pos >= ? AND pos < ? '
+            'ORDER BY pos', (start, start + self.page_size)
+        ).fetchall()
+        for pos, blob in rows:
+            if pos not in self._cache:
+                project = self._live.get(pos, None)
+                if project is None:
+                    project = self._loads(blob)
+                    self._live[pos] = project
+                self._written.pop(pos, None)
+                self._cache[pos] = (project, blob)
+
+        self._cache.move_to_end(i)
+        self._evict()
+
+    def _evict(self, keep: int = None) -> None:
+        """Writes back (changed) projects until the cache is small enough."""
+        keep = self.cache_size if keep is None else keep
+
+        rows = []
+        evicted = set()
+        while len(self._cache) > keep:
+            pos, (project, blob) = self._cache.popitem(last=False)
+            new_blob = self._dumps(project)
+            if new_blob != blob:
+                rows.append((pos, new_blob))
+
+            # keep track of paged-out projects that are still in use
+            project = None
+            evicted.add(pos)
+            if pos in self._live:
+                self._written[pos] = new_blob
+
+        if keep == 0:
+            # write back any changes made to them since
+            for pos, blob in list(self._written.items()):
+                project = self._live.get(pos, None)
+                if project is None:
+                    del self._written[pos]
+                    continue
+                if pos in evicted:
+                    continue
+                new_blob = self._dumps(project)
+                if new_blob != blob:
+                    rows.append((pos, new_blob))
+                    self._written[pos] = new_blob
+
+        if rows:
+            self._db.executemany('INSERT OR REPLACE INTO projects '
+                                 'VALUES (?, ?)', rows)
+
+    def flush(self) -> None:
+        """Writes all cached projects back to disk and commits."""
+        self._evict(keep=0)
+        self._commit()
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            # Note: Slices are materialized as regular lists.
+            return [self[j] for j in range(*i.indices(self._len))]
+
+        i = self._index(i)
+        if i not in self._cache:
+            self._load_page(i)
+        else:
+            self._cache.move_to_end(i)
+
+        return self._cache[i][0]
+
+    def __setitem__(self, i, project) -> None:
+        if isinstance(i, slice):
+            raise TypeError('Project stores do not support slice assignment.')
+
+        i = self._index(i)
+        self._cache[i] = (project, None)
+        self._cache.move_to_end(i)
+        self._live[i] = project
+        self._written.pop(i, None)
+        self._evict()
+
+    def __delitem__(self, i) -> None:
+        if isinstance(i, slice):
+            drop = set(range(*i.indices(self._len)))
+        else:
+            drop = {self._index(i)}
+
+        if not drop:
+            return
+
+        if min(drop) == self._len - len(drop):
+            # fast path: truncate the tail of the store
+            self.flush()
+            self._db.execute('DELETE FROM projects WHERE pos >= ?',
+                             (min(drop),))
+            self._commit()
+            self._len -= len(drop)
+            self._move(range(self._len))
+        else:
+            self.select([j for j in range(self._len) if j not in drop])
+
+    def insert(self, i: int, project) -> None:
+        if i < 0:
+            i = max(i + self._len, 0)
+
+        if i >= self._len:
+            # fast path: append to the end of the store
+            self._len += 1
+            self._cache[self._len - 1] = (project, None)
+            self._live[self._len - 1] = project
+            self._evict()
+            return
+
+        # shift the tail of the store back by one (via negative positions,
+        # to avoid primary key collisions)
+        self.flush()
+        self._db.execute('UPDATE projects SET pos = -(pos + 1) '
+                         'WHERE pos >= ?', (i,))
+        self._db.execute('UPDATE projects SET pos = -pos WHERE pos < 0')
+        self._db.execute('INSERT INTO projects VALUES (?, ?)',
+                         (i, self._dumps(project)))
+        self._commit()
+        self._len += 1
+        self._move(list(range(i)) + [None] + list(range(i, self._len - 1)))
+        self._live[i] = project
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._move([])
+        self._db.execute('DELETE FROM projects')
+        self._commit()
+        self._len = 0
+
+    def replace(self, projects: Iterable) -> None:
+        """Replaces the contents of the store with the given projects."""
+        self.clear()
+        self.extend(projects)
+        self.flush()
+
+    def scan(self) -> Iterator:
+        """Iterates over the projects without caching them (read-only;
+        changes to the projects are not saved)."""
+        self.flush()
+        for start in range(0, self._len, self.page_size):
+            rows = self._db.execute(
+                'SELECT blob FROM projects WHERE pos >= ? AND pos < ? '
+                'ORDER BY pos', (start, start + self.page_size)
+            ).fetchall()
+            for blob, in rows:
+                yield self._loads(blob)
+
+    def select(self, indices: List[int]) -> None:
+        """Keeps only the projects at the given indices (in that order)."""
+        self.flush()
+        self._db.execute('DROP TABLE IF EXISTS selection')
+        self._db.execute('DROP TABLE IF EXISTS selected')
+        self._db.execute('CREATE TEMP TABLE selection '
+                         '(pos INTEGER PRIMARY KEY, old_pos INTEGER)')
+        self._db.executemany('INSERT INTO selection VALUES (?, ?)',
+                             enumerate(indices))
+        self._db.execute('CREATE TABLE selected '
+                         '(pos INTEGER PRIMARY KEY, blob BLOB NOT NULL)')
+        self._db.execute('INSERT INTO selected SELECT s.pos, p.blob '
+                         'FROM selection s JOIN projects p '
+                         'ON p.pos = s.old_pos')
+        self._db.execute('DROP TABLE projects')
+        self._db.execute('ALTER TABLE selected RENAME TO projects')
+        self._db.execute('DROP TABLE selection')
+        self._commit()
+        self._len = len(indices)
+        self._move(indices)
+
+    def _move(self, indices: Iterable) -> None:
+        """Moves the projects in use to their new positions (after the store
+        is flushed and rearranged; indices are their old positions)."""
+        live = weakref.WeakValueDictionary()
+        written = {}
+        if self._live:
+            for pos, old_pos in enumerate(indices):
+                project = self._live.get(old_pos, None)
+                if project is not None:
+                    live[pos] = project
+                    if old_pos in self._written:
+                        written[pos] = self._written[old_pos]
+
+        self._live = live
+        self._written = written
+
+    def sort(self, key: Callable = None, reverse: bool = False) -> None:
+        """Sorts the store in place; only the sort keys are held in memory."""
+        keys = [key(p) if key else p for p in self.scan()]
+        order = sorted(range(len(keys)), key=keys.__getitem__,
+                       reverse=reverse)
+        self.select(order)
+
+    def __getstate__(self) -> dict:
+        # the database file is the state; just save its location
+        self.flush()
+        return {
+            'path': self.path,
+            'cache_size': self.cache_size,
+            'page_size': self.page_size
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._connect()
+
+    def __repr__(self):
+        return 'ProjectStore(%s, %d projects)' % (self.path, self._len)
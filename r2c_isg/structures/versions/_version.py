@@ -1,8 +1,13 @@
+import re
+from typing import Optional
 from types import MethodType
 
+from r2c_isg.structures._lazy import LazyAttrs
 
-class Version(object):
-    def __init__(self, uuids_: dict = {}, meta_: dict = {}, **kwargs):
+
+class Version(LazyAttrs):
+    def __init__(self, uuids_: dict = {}, meta_: dict = {},
+                 raw_: dict = None, **kwargs):
         # set the uuid/meta functions as method types (to autopass self)
         self.uuids_ = {}
         for attr, func in uuids_.items():
@@ -14,6 +19,10 @@ class Version(object):
         # load all attributes into the version
         self.update(**kwargs)
 
+        # keep any raw api response undecoded until it's needed
+        if raw_:
+            self.update_raw(raw_)
+
     def update(self, **kwargs) -> None:
         """Populates the version with data from a dictionary."""
         for k, val in kwargs.items():
@@ -27,6 +36,38 @@ class Version(object):
         contents)."""
         pass
 
+    def get_version(self) -> Optional[str]:
+        """Returns the version string (or None, if there isn't one)."""
+        # child functions can override this to order versions by something
+        # else--eg, a commit's date
+        return getattr(self, 'version', None)
+
+    def version_key(self) -> Optional[tuple]:
+        """Returns a sortable key for the version string (parsed once and
+        cached until the version string changes), or None if there's no
+        version string."""
+        version = self.get_version()
+        if version is None:
+            return None
+
+        cached = self.__dict__.get('version_key_', None)
+        if cached and cached[0] == version:
+            return cached[1]
+
+        key = self.parse_version(version)
+        self.__dict__['version_key_'] = (version, key)
+
+        return key
+
+    @staticmethod
+    def parse_version(version: str) -> tuple:
+        """Parses a version string into a key that sorts numeric parts as
+        numbers (eg, 1.9 < 1.10). Child classes can override this to follow
+        their registry's versioning scheme."""
+        parts = re.findall(r'\d+|[a-z]+', str(version).lower())
+        return tuple((0, int(part), '') if part.isdigit() else (1, 0, part)
+                     for part in parts)
+
     def to_inputset(self) -> dict:
         """Extracts input set relevant attributes from the version."""
         # Note: The vanilla project is never used, even as a DefaultVersion.
@@ -1,3 +1,6 @@
+import re
+from typing import Optional
+
 from r2c_isg.structures.versions import Version
 
 
@@ -8,6 +11,23 @@ class GithubCommit(Version):
             'Github commit guarantees not met; ' \
             'commit hash must be provided.'
 
+    def get_version(self) -> Optional[str]:
+        """Returns the commit's date (commits are ordered by date)."""
+        date = getattr(self, 'date', None)
+        if date is None:
+            # the date from a github api response
+            commit = getattr(self, 'commit', None)
+            if isinstance(commit, dict):
+                signature = commit.get('committer') or commit.get('author')
+                date = (signature or {}).get('date', None)
+
+        return date
+
+    @staticmethod
+    def parse_version(version: str) -> tuple:
+        """Parses an (ISO 8601) date, eg, '2019-01-01T12:00:00Z'."""
+        return tuple(int(part) for part in re.findall(r'\d+', str(version)))
+
     def to_inputset(self) -> dict:
         """Extracts input set relevant attributes from the commit."""
         self.check_guarantees()
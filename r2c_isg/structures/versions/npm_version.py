@@ -1,5 +1,13 @@
+import re
+
 from r2c_isg.structures.versions import Version
 
+# semantic version (see https://semver.org); leading 'v's/'='s and missing
+# minor/patch numbers are tolerated (eg, in filter expressions)
+_SEMVER = re.compile(r'^\s*[v=]*(\d+)(?:\.(\d+))?(?:\.(\d+))?'
+                     r'(?:-([0-9a-z-]+(?:\.[0-9a-z-]+)*))?'
+                     r'(?:\+[0-9a-z-]+(?:\.[0-9a-z-]+)*)?\s*$', re.IGNORECASE)
+
 
 class NpmVersion(Version):
     def check_guarantees(self) -> None:
@@ -8,6 +16,28 @@ class NpmVersion(Version):
             'Npm version guarantees not met; ' \
             'version string must be provided.'
 
+    @staticmethod
+    def parse_version(version: str) -> tuple:
+        """Parses a version string as per semver (eg, 1.0.0-alpha <
+        1.0.0-alpha.1 < 1.0.0-beta < 1.0.0 < 1.0.1; build metadata is
+        ignored). Versions that don't follow semver sort before all versions
+        that do."""
+        match = _SEMVER.match(str(version))
+        if not match:
+            return (0, Version.parse_version(version))
+
+        major, minor, patch, pre = match.groups()
+
+        # pre-releases sort before their release; numeric identifiers sort
+        # numerically, and before alphanumeric ones
+        if pre:
+            pre = (0, tuple((0, int(part), '') if part.isdigit() else
+                            (1, 0, part.lower()) for part in pre.split('.')))
+        else:
+            pre = (1, ())
+
+        return (1, int(major), int(minor or 0), int(patch or 0), pre)
+
     def to_inputset(self) -> dict:
         """Extracts input set relevant attributes from the version."""
         self.check_guarantees()
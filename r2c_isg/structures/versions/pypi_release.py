@@ -1,5 +1,23 @@
+import re
+
 from r2c_isg.structures.versions import Version
 
+# version scheme from PEP 440 (see its appendix)
+_PEP440 = re.compile(
+    r'^\s*v?(?:(?P<epoch>\d+)!)?(?P<release>\d+(?:\.\d+)*)'
+    r'(?:[-_.]?(?P<pre_l>a|b|c|rc|alpha|beta|pre|preview)[-_.]?'
+    r'(?P<pre_n>\d+)?)?'
+    r'(?:-(?P<post_n1>\d+)|[-_.]?(?P<post_l>post|rev|r)[-_.]?'
+    r'(?P<post_n2>\d+)?)?'
+    r'(?:[-_.]?(?P<dev_l>dev)[-_.]?(?P<dev_n>\d+)?)?'
+    r'(?:\+(?P<local>[a-z0-9]+(?:[-_.][a-z0-9]+)*))?\s*$',
+    re.IGNORECASE
+)
+
+# pre-release labels, in order (alpha < beta < release candidate)
+_PRE_LABELS = {'a': 0, 'alpha': 0, 'b': 1, 'beta': 1,
+               'c': 2, 'rc': 2, 'pre': 2, 'preview': 2}
+
 
 class PypiRelease(Version):
     def check_guarantees(self) -> None:
@@ -8,6 +26,51 @@ class PypiRelease(Version):
             'Pypi release guarantees not met; ' \
             'version string must be provided.'
 
+    @staticmethod
+    def parse_version(version: str) -> tuple:
+        """Parses a version string as per PEP 440 (eg, 1.0.dev1 < 1.0a1 <
+        1.0 == 1.0.0 < 1.0.post1). Versions that don't follow PEP 440 sort
+        before all versions that do."""
+        match = _PEP440.match(str(version))
+        if not match:
+            return (0, Version.parse_version(version))
+
+        # drop trailing zeros from the release (eg, 1.0.0 -> 1)
+        release = [int(part) for part in match.group('release').split('.')]
+        while len(release) > 1 and release[-1] == 0:
+            release.pop()
+
+        # pre-releases sort before the release (and dev-only releases
+        # before pre-releases)
+        pre_l, dev_l = match.group('pre_l'), match.group('dev_l')
+        post_l = match.group('post_l') or match.group('post_n1')
+        if pre_l:
+            pre = (_PRE_LABELS[pre_l.lower()], int(match.group('pre_n') or 0))
+        elif dev_l and not post_l:
+            pre = (-1, 0)
+        else:
+            pre = (3, 0)
+
+        # post-releases sort after the release
+        post = -1
+        if post_l:
+            post = int(match.group('post_n1') or match.group('post_n2') or 0)
+
+        # dev releases sort before everything else of their release
+        dev = int(match.group('dev_n') or 0) if dev_l else float('inf')
+
+        # local versions sort after their public version (numeric segments
+        # after alphanumeric ones)
+        local = ()
+        if match.group('local'):
+            local = tuple((1, int(part), '') if part.isdigit() else
+                          (0, 0, part.lower())
+                          for part in re.split(r'[-_.]',
+                                               match.group('local')))
+
+        return (1, int(match.group('epoch') or 0), tuple(release), pre, post,
+                dev, local)
+
     def to_inputset(self) -> dict:
         """Extracts input set relevant attributes from the release."""
         self.check_guarantees()
@@ -1,11 +1,19 @@
-import subprocess
-import traceback
+from functools import lru_cache
+from typing import TYPE_CHECKING
 
-from r2c_isg.structures import Dataset
+if TYPE_CHECKING:
+    from datetime import timedelta
+    from r2c_isg.structures import Dataset
 
 
+# set to False to hide all progress bars (eg, when running a script)
+PROGRESS = True
+
+
+@lru_cache(maxsize=None)
 def get_name():
-    """Loads the default user name."""
+    """Loads the default user name (once per process)."""
+    import subprocess
 
     # only check git user.name for now
     try:
@@ -16,8 +24,10 @@ def get_name():
         return None
 
 
+@lru_cache(maxsize=None)
 def get_email():
-    """Loads the default user email."""
+    """Loads the default user email (once per process)."""
+    import subprocess
 
     # only check git user.email for now
     try:
@@ -28,7 +38,14 @@ def get_email():
         return None
 
 
-def get_dataset(ctx) -> Dataset:
+def progress(iterable=None, **kwargs):
+    """Wraps an iterable in a tqdm progress bar (unless they're hidden)."""
+    from tqdm import tqdm
+
+    return tqdm(iterable, disable=not PROGRESS, **kwargs)
+
+
+def get_dataset(ctx) -> 'Dataset':
     """Gets the dataset from the CLI context."""
     ds = ctx.obj.get('dataset', None)
 
@@ -41,6 +58,7 @@ def get_dataset(ctx) -> Dataset:
 
 def print_error(err: Exception, debug: bool = False) -> None:
     """Prints all CLI errors."""
+    import traceback
 
     # print the exception stack trace & error message
     if debug:
@@ -48,3 +66,20 @@ def print_error(err: Exception, debug: bool = False) -> None:
 
     # print the error message
     print('         %s: %s' % (type(err).__name__, err))
+
+
+def parse_duration(text: str) -> 'timedelta':
+    """Parses a duration like '90s', '20m', '12h', '7d', '2w' or '1h30m'."""
+    import re
+    from datetime import timedelta
+
+    units = {'s': 'seconds', 'm': 'minutes', 'h': 'hours', 'd': 'days',
+             'w': 'weeks'}
+    text = text.strip().lower()
+    if not re.fullmatch(r'(\d+(\.\d+)?[smhdw])+', text):
+        raise Exception('Invalid duration "%s"; use a number and a unit (s, '
+                        'm, h, d or w), eg, "20m" or "7d".' % text)
+
+    return sum([timedelta(**{units[unit]: float(num)})
+                for num, _, unit in re.findall(r'(\d+(\.\d+)?)([smhdw])',
+                                               text)], timedelta())
@@ -0,0 +1,44 @@
+import os
+import json
+import importlib.util
+
+from click.testing import CliRunner
+
+BENCH = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'benchmarks', 'bench.py')
+
+
+def load_bench():
+    spec = importlib.util.spec_from_file_location('bench', BENCH)
+    bench = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bench)
+    return bench
+
+
+def test_benchmarks(tmp_path):
+    # every benchmark runs (on tiny datasets) and lands in the history
+    bench = load_bench()
+    history = str(tmp_path / 'history.json')
+    args = ['--scales', '20', '--repeat', '1', '--history', history]
+    result = CliRunner().invoke(bench.main, args)
+    assert result.exit_code == 0, result.output
+
+    with open(history) as file:
+        runs = json.load(file)['runs']
+    assert sorted(runs[0]['results']) == sorted([
+        '%s/%s/20' % (name, registry) for name in bench.BENCHMARKS
+        for registry in bench.REGISTRIES])
+
+    # the next run is compared with it
+    result = CliRunner().invoke(bench.main, args + ['--only', 'sort',
+                                                    '--check'])
+    assert result.exit_code == 0, result.output
+    assert 'vs. last run' in result.output and '% time' in result.output
+    with open(history) as file:
+        assert len(json.load(file)['runs']) == 2
+
+    assert bench.parse_scale('10k') == 10000
+    assert bench.parse_scale('1m') == 1000000
+    assert bench.regressed({'seconds': 2.0, 'peak_bytes': 1},
+                           {'seconds': 1.0, 'peak_bytes': 1}, 0.2) == \
+        ['seconds']
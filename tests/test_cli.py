@@ -0,0 +1,188 @@
+import json
+
+from click.testing import CliRunner
+
+from r2c_isg import cli as cli_module
+from r2c_isg.cli import cli
+from r2c_isg.functions import function_map
+from r2c_isg.structures import journal
+
+
+DUMP = [
+    {'name': 'a', 'description': 'no', 'dist-tags': {'latest': '1.0.0'},
+     'versions': {'1.0.0': {'name': 'a', 'version': '1.0.0'}}},
+    {'name': 'b', 'description': 'yes', 'dist-tags': {'latest': '1.0.0'},
+     'versions': {'1.0.0': {'name': 'b', 'version': '1.0.0'}}},
+]
+
+
+def write_files(tmp_path) -> None:
+    """Writes an npm list and a registry dump (of "a" and "b" only)."""
+    (tmp_path / 'list.csv').write_text('a\nb\nc\nd\n')
+    (tmp_path / 'd.jsonl').write_text(
+        '\n'.join(json.dumps(doc) for doc in DUMP) + '\n')
+
+
+def run_script(tmp_path, monkeypatch, lines: list):
+    """Runs a script in tmp_path (the cli keeps its caches in the working
+    directory), with the files from write_files to use."""
+    monkeypatch.chdir(tmp_path)
+    write_files(tmp_path)
+    (tmp_path / 's.txt').write_text('\n'.join(lines) + '\n')
+
+    return CliRunner().invoke(cli, ['run', 's.txt'])
+
+
+def exported(tmp_path) -> list:
+    with open(str(tmp_path / 'out.json')) as file:
+        return [i['package_name'] for i in json.load(file)['inputs']]
+
+
+def test_run_hoists_trim(tmp_path, monkeypatch):
+    result = run_script(tmp_path, monkeypatch, [
+        'load -c name npm file list.csv',
+        'get -m -v all --dump d.jsonl',
+        'trim 1',
+        'set-meta -n x -v 1',
+        'export out.json',
+    ])
+    assert result.exit_code == 0, result.output
+    assert 'Running "trim 1" (line 3) before "get -m -v all --dump ' \
+           'd.jsonl" (line 2).' in result.output
+    assert 'Got 1 of 1 projects' in result.output
+    assert exported(tmp_path) == ['a']
+
+
+def test_run_deferred_filter(tmp_path, monkeypatch):
+    # the filter needs fetched data, so it runs where it was written; the
+    # trim (moved up behind it) must still run after it
+    result = run_script(tmp_path, monkeypatch, [
+        'load -c name npm file list.csv',
+        'get -m -v all --dump d.jsonl',
+        'filter "description = yes"',
+        'trim 1',
+        'set-meta -n x -v 1',
+        'export out.json',
+    ])
+    assert result.exit_code == 0, result.output
+    assert 'Running' not in result.output
+    assert exported(tmp_path) == ['b']
+
+    # the same filter, with its field already loaded, runs early
+    result = run_script(tmp_path, monkeypatch, [
+        'load -c name npm file list.csv',
+        'get -m -v all --dump d.jsonl',
+        'filter "name = b"',
+        'trim 1',
+        'get -m -v all --dump d.jsonl',
+        'set-meta -n x -v 1',
+        'export out.json',
+    ])
+    assert result.exit_code == 0, result.output
+    assert 'Running "filter "name = b"" (line 3) before' in result.output
+    assert exported(tmp_path) == ['b']
+
+
+class Shell(object):
+    """Runs commands one at a time, as the interactive shell does (sharing
+    the dataset and the undo history between them)."""
+
+    def __init__(self, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr(cli_module, 'HISTORY', [])
+        write_files(tmp_path)
+        self.obj = {}
+
+    def __call__(self, *args) -> str:
+        result = CliRunner().invoke(cli, ['-q'] + list(args), obj=self.obj)
+        assert result.exit_code == 0, result.output
+        return result.output
+
+    def state(self) -> tuple:
+        ds = self.obj['dataset']
+        return ds.name, [(p.name, getattr(p, 'description', None),
+                          [v.version for v in p.versions])
+                         for p in ds.projects]
+
+
+def test_undo(tmp_path, monkeypatch):
+    shell = Shell(tmp_path, monkeypatch)
+    shell('load', '-c', 'name', 'npm', 'file', 'list.csv')
+
+    # every command that changes the dataset can be undone
+    for args in [['get', '-m', '-v', 'all', '--dump', 'd.jsonl'],
+                 ['sort', 'desc name'],
+                 ['trim', '3'],
+                 ['trim', '-v', '0'],
+                 ['sample', '--seed', 'x', '2'],
+                 ['filter', 'description = yes'],
+                 ['set-meta', '-n', 'x', '-v', '1']]:
+        before = shell.state()
+        shell(*args)
+        assert shell.state() != before, args
+        shell('undo')
+        assert shell.state() == before, args
+
+        # (keep the change for the next command)
+        shell(*args)
+
+    # ...several commands back
+    assert shell.state() == ('x', [('b', 'yes', [])])
+    for _ in range(7):
+        assert 'Undid' in shell('undo')
+    assert shell.state() == (None, [(name, None, []) for name in 'abcd'])
+    shell('undo')
+    assert 'dataset' not in shell.obj
+    assert 'There is nothing to undo' in shell('undo')
+
+
+def test_rollback(tmp_path, monkeypatch):
+    shell = Shell(tmp_path, monkeypatch)
+    shell('load', '-c', 'name', 'npm', 'file', 'list.csv')
+
+    # a command that fails partway leaves the dataset as it was
+    (tmp_path / 'bad.jsonl').write_text(
+        json.dumps(DUMP[0]) + '\n{"name": "b", "desc\n')
+    before = shell.state()
+    out = shell('get', '-m', '-v', 'all', '--dump', 'bad.jsonl')
+    assert 'Exception' in out and 'not modified' in out
+    assert shell.state() == before
+
+    # (dumps are read in one go, so there's no progress to resume)
+    assert 'get --resume' not in out
+    assert not (tmp_path / '.get_checkpoint').exists()
+
+    # (and isn't in the undo history)
+    shell('undo')
+    assert 'dataset' not in shell.obj
+
+    # disk-backed datasets roll back failed commands, but refuse to undo
+    shell('load', '-c', 'name', '-s', 'set.db', 'npm', 'file', 'list.csv')
+    shell('get', '-m', '-v', 'all', '--dump', 'bad.jsonl')
+    assert shell.state() == before
+    shell('get', '-m', '-v', 'all', '--dump', 'd.jsonl')
+    after = shell.state()
+    assert 'cannot be undone' in shell('undo')
+    assert shell.state() == after
+
+
+def test_interrupted_get(tmp_path, monkeypatch):
+    shell = Shell(tmp_path, monkeypatch)
+
+    # ctrl-c partway through a get (once the dump has been loaded)
+    get_from_dump = function_map['get_from_dump']
+
+    def interrupted(ds, *args, **kwargs):
+        get_from_dump(ds, *args, **kwargs)
+        raise KeyboardInterrupt()
+
+    monkeypatch.setitem(function_map, 'get_from_dump', interrupted)
+    shell('load', '-c', 'name', 'npm', 'file', 'list.csv')
+    before = shell.state()
+    result = CliRunner().invoke(cli, ['-q', 'get', '-m', '-v', 'all',
+                                      '--dump', 'd.jsonl'], obj=shell.obj)
+    assert 'Aborted' in result.output
+
+    # the get is rolled back as a whole, and nothing is left recording
+    assert shell.state() == before
+    assert journal._active is None
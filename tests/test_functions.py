@@ -0,0 +1,1145 @@
+import gzip
+import json
+from pathlib import Path
+
+from r2c_isg.apis import CriticalApiError
+from r2c_isg.structures import Dataset
+from r2c_isg.functions.filter import Filter
+from r2c_isg.functions._sampling import Reservoir, reservoir
+from r2c_isg.structures.projects import (DefaultProject, GithubRepo,
+                                         NpmPackage, PypiProject)
+from r2c_isg.structures.versions import GithubCommit, NpmVersion, PypiRelease
+
+FILES = Path(__file__).parent / 'files'
+
+
+def make_dataset() -> Dataset:
+    """Builds a small npm dataset (no web access needed)."""
+    ds = Dataset('npm')
+    p_uuids = {'name': lambda p: p.name}
+    v_uuids = {'version': lambda v: v.version}
+
+    data = [
+        ('b', 10, ['1.9.0', '1.10.0', '0.1.0']),
+        ('A', 30, ['2.0.0']),
+        ('c', 10, ['1.0.0', '1.0.1']),
+        ('d', 20, []),
+    ]
+    for name, downloads, versions in data:
+        p = NpmPackage(uuids_=p_uuids, name=name, downloads=downloads)
+        p.versions = [NpmVersion(uuids_=v_uuids, version=v)
+                      for v in versions]
+        ds.projects.append(p)
+
+    return ds
+
+
+def names(ds: Dataset) -> list:
+    return [p.name for p in ds.projects]
+
+
+class Item(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def test_lazy_attrs(monkeypatch):
+    from r2c_isg.structures import _lazy
+
+    decoded = []
+    loads = _lazy.json.loads
+    monkeypatch.setattr(_lazy.json, 'loads',
+                        lambda raw: decoded.append(raw) or loads(raw))
+
+    # a response is decoded once, however many attributes are looked up
+    p = NpmPackage(uuids_={'name': lambda p: p.name},
+                   raw_={'name': 'a', 'description': 'x', 'keywords': []})
+    assert not hasattr(p, 'homepage') and not hasattr(p, 'license')
+    assert p.description == 'x' and p.keywords == [] and p.name == 'a'
+    assert len(decoded) == 1
+
+    # ...and again once it's updated
+    p.update_raw({'description': 'y'})
+    assert p.description == 'y' and not hasattr(p, 'homepage')
+    assert p.keywords == [] and 'description' in p.raw()
+
+
+def test_sort():
+    ds = make_dataset()
+
+    # strings are sorted case-insensitively
+    ds.sort(['name'])
+    assert names(ds) == ['A', 'b', 'c', 'd']
+
+    # sort orders apply to all of the keywords that follow them
+    ds.sort('desc downloads name')
+    assert names(ds) == ['A', 'd', 'c', 'b']
+
+    # mixed sort orders
+    ds.sort('desc downloads asc name')
+    assert names(ds) == ['A', 'd', 'b', 'c']
+    ds.sort('downloads desc uuids.name')
+    assert names(ds) == ['c', 'b', 'd', 'A']
+
+    # version strings are sorted by their parsed version numbers
+    ds.sort('desc v.version')
+    assert [v.version for v in ds.projects[1].versions] == \
+        ['1.10.0', '1.9.0', '0.1.0']
+
+    # ...unless they're sorted as strings (as they used to be)
+    ds.sort('desc v.uuids.version')
+    assert [v.version for v in ds.projects[1].versions] == \
+        ['1.9.0', '1.10.0', '0.1.0']
+
+
+def test_version_keys():
+    # pypi releases follow PEP 440
+    releases = ['1.0.dev1', '1.0a1', '1.0b2', '1.0rc1', '1.0', '1.0+ubuntu.1',
+                '1.0.post1', '1.1', '10.0', '1!0.1']
+    assert sorted(reversed(releases), key=PypiRelease.parse_version) \
+        == releases
+    assert PypiRelease.parse_version('1.0') \
+        == PypiRelease.parse_version('1.0.0')
+
+    # npm versions follow semver
+    versions = ['1.0.0-alpha', '1.0.0-alpha.1', '1.0.0-beta.2',
+                '1.0.0-beta.11', '1.0.0-rc.1', '1.0.0', '1.0.1', '10.0.0']
+    assert sorted(reversed(versions), key=NpmVersion.parse_version) \
+        == versions
+    assert NpmVersion.parse_version('v1.0.0+build.5') \
+        == NpmVersion.parse_version('1.0.0')
+
+    # github commits are ordered by date
+    commit = GithubCommit(uuids_={'commit': lambda v: v.sha}, raw_={
+        'sha': 'abc', 'commit': {'committer': {'date': '2019-02-01T00:00Z'}}
+    })
+    assert commit.version_key() == (2019, 2, 1, 0, 0)
+
+
+def test_trim_newest():
+    ds = make_dataset()
+    ds.projects[0].versions.append(
+        NpmVersion(uuids_={'version': lambda v: v.version}))
+    ds.trim(2, on_versions=True, newest=True)
+
+    # the newest versions are kept, in their original order
+    assert [[v.version for v in p.versions] for p in ds.projects] == \
+        [['1.9.0', '1.10.0'], ['2.0.0'], ['1.0.0', '1.0.1'], []]
+
+
+def test_sort_missing_key(capsys):
+    ds = make_dataset()
+    ds.projects[0].homepage = 'b.com'
+    ds.projects[2].homepage = 'C.com'
+
+    # missing attributes sort as ''
+    ds.sort('desc homepage')
+    assert names(ds) == ['c', 'b', 'A', 'd']
+    assert 'Warning' in capsys.readouterr().out
+
+
+def test_top():
+    # same result as a sort followed by a trim (ties keep their order)
+    for keywords in ['desc downloads', 'downloads', 'desc downloads name',
+                     'desc downloads asc name', 'downloads desc uuids.name']:
+        ds = make_dataset()
+        ds.sort(keywords)
+        ds.trim(3)
+        expected = names(ds)
+
+        ds = make_dataset()
+        ds.top(3, keywords)
+        assert names(ds) == expected
+
+    # ...with a (numeric) key that a project is missing (it sorts as '')
+    for keywords, expected in [('desc downloads asc name', ['d', 'b', 'c']),
+                               ('downloads desc name', ['A', 'c', 'b']),
+                               ('name desc downloads', ['A', 'b', 'c'])]:
+        ds = make_dataset()
+        del ds.projects[1].downloads
+        ds.sort(keywords)
+        ds.trim(3)
+        assert names(ds) == expected
+
+        ds = make_dataset()
+        del ds.projects[1].downloads
+        ds.top(3, keywords)
+        assert names(ds) == expected
+
+    # top versions
+    ds = make_dataset()
+    ds.top(1, 'desc v.version', on_versions=True)
+    assert [[v.version for v in p.versions] for p in ds.projects] == \
+        [['1.10.0'], ['2.0.0'], ['1.0.1'], []]
+
+
+def test_filter():
+    ds = make_dataset()
+    ds.filter('downloads >= 20 or uuids.name = "c"')
+    assert names(ds) == ['A', 'c', 'd']
+
+    # strings are compared case-insensitively; missing values never match
+    ds = make_dataset()
+    ds.projects[0].homepage = 'B.com'
+    ds.filter('not (homepage = b.com) and name != a')
+    assert names(ds) == ['c', 'd']
+
+    # project and version clauses
+    ds = make_dataset()
+    ds.filter('downloads = 10 and v.version >= 1.0.1')
+    assert [[v.version for v in p.versions] for p in ds.projects] == \
+        [['1.9.0', '1.10.0'], ['1.0.1']]
+
+
+def test_filter_errors():
+    for expression in ['downloads >', 'downloads = 1 name',
+                       'downloads = 1 or v.version = 1']:
+        try:
+            Filter(expression)
+            assert False, expression
+        except Exception as e:
+            assert 'Invalid filter' in str(e)
+
+
+def test_sample():
+    ds = make_dataset()
+    ds.sample(2, on_versions=False, seed='abc')
+    sampled = names(ds)
+    assert len(sampled) == 2
+
+    # seeded samples are reproducible and keep the original order
+    ds = make_dataset()
+    ds.sample(2, on_versions=False, seed='abc')
+    assert names(ds) == sampled
+    assert sampled == [n for n in ['b', 'A', 'c', 'd'] if n in sampled]
+
+    # sampling more projects than there are keeps them all
+    ds = make_dataset()
+    ds.sample(10, on_versions=False)
+    assert names(ds) == ['b', 'A', 'c', 'd']
+
+
+def test_reservoir():
+    # every position is equally likely to be kept
+    counts = [0] * 10
+    for seed in range(2000):
+        for i in Reservoir(3, seed=seed).extend(range(10)).items:
+            counts[i] += 1
+    assert all(500 < c < 700 for c in counts)
+
+
+def test_weighted_reservoir():
+    # items are kept in proportion to their weights; zero weights never are
+    counts = [0] * 4
+    for seed in range(2000):
+        res = reservoir(1, seed=seed, weight='w')
+        for i in res.extend([Item(w=w) for w in [0, 1, 3, 'x']]).indices:
+            counts[i] += 1
+    assert counts[0] == counts[3] == 0
+    assert 1350 < counts[2] < 1650
+
+    # inverse weights favor small values (eg, ranks)
+    counts = [0] * 2
+    for seed in range(2000):
+        res = reservoir(1, seed=seed, weight='w', inverse=True)
+        counts[res.extend([Item(w=1), Item(w=3)]).indices[0]] += 1
+    assert 1350 < counts[0] < 1650
+
+
+def test_sample_weighted_and_stratified():
+    ds = make_dataset()
+    ds.sample(2, on_versions=False, seed='abc', weight='downloads')
+    sampled = names(ds)
+    assert len(sampled) == 2
+
+    # weighted samples are reproducible too
+    ds = make_dataset()
+    ds.sample(2, on_versions=False, seed='abc', weight='downloads')
+    assert names(ds) == sampled
+
+    # one project per download count, in the original order
+    ds = make_dataset()
+    ds.sample(1, on_versions=False, seed='abc', strata='downloads')
+    assert len(names(ds)) == 3
+    assert sorted([p.downloads for p in ds.projects]) == [10, 20, 30]
+    assert names(ds) == [n for n in ['b', 'A', 'c', 'd'] if n in names(ds)]
+
+
+def test_sample_hashed():
+    def sample(project_names: list, on_versions: bool = False) -> list:
+        ds = Dataset('npm')
+        for name in project_names:
+            p = NpmPackage(uuids_={'name': lambda p: p.name}, name=name)
+            p.versions = [NpmVersion(uuids_={'version': lambda v: v.version},
+                                     version='1.%d' % i) for i in range(20)]
+            ds.projects.append(p)
+        ds.sample(10, on_versions=on_versions, seed='abc', hashed=True)
+        if on_versions:
+            return [[v.version for v in p.versions] for p in ds.projects]
+        return names(ds)
+
+    project_names = ['p%d' % i for i in range(100)]
+    sampled = sample(project_names)
+    assert len(sampled) == 10
+
+    # the sample doesn't depend on the order of the projects...
+    assert sorted(sample(list(reversed(project_names)))) == sorted(sampled)
+
+    # ...and growing the dataset displaces at most one project per new one
+    grown = sample(['new'] + project_names)
+    assert len(set(grown) - set(sampled)) <= 1
+    assert len(set(sampled) - set(grown)) <= 1
+    assert sorted(sample(project_names + ['new'])) == sorted(grown)
+
+    # versions are sampled independently in each project
+    versions = sample(['a', 'b'], on_versions=True)
+    assert len(versions[0]) == 10
+    assert versions[0] != versions[1]
+    assert sample(['b'], on_versions=True)[0] == versions[1]
+
+
+def test_sample_while_loading(tmp_path):
+    # sampling while loading keeps the same projects as sampling afterwards
+    path = tmp_path / 'projects.csv'
+    path.write_text('!name,!v.version\n' + ''.join(
+        'p%d,1.0\np%d,2.0\n' % (i, i) for i in range(50)))
+
+    ds = Dataset.load_file(str(path), 'npm')
+    ds.sample(5, on_versions=False, seed='abc')
+
+    sampled = Dataset.load_file(str(path), 'npm',
+                                sample={'n': 5, 'seed': 'abc'})
+    assert names(sampled) == names(ds)
+    assert [len(p.versions) for p in sampled.projects] == [2] * 5
+
+    # so does weighted/stratified sampling while loading
+    path.write_text('!name,!org,!stars,!v.version\n' + ''.join(
+        'p%d,o%d,%d,1.0\np%d,o%d,%d,2.0\n' % (i, i % 3, i, i, i % 3, i)
+        for i in range(50)))
+    spec = {'n': 2, 'seed': 'abc', 'weight': 'stars', 'strata': 'org'}
+
+    ds = Dataset.load_file(str(path), 'npm')
+    ds.sample(2, on_versions=False, seed='abc', weight='stars', strata='org')
+
+    sampled = Dataset.load_file(str(path), 'npm', sample=spec)
+    assert names(sampled) == names(ds)
+    assert len(names(ds)) == 6
+    assert 'p0' not in names(ds)
+
+    # as does hashed sampling (which doesn't depend on the file's order)
+    spec = {'n': 5, 'seed': 'abc', 'hashed': True}
+    ds = Dataset.load_file(str(path), 'npm')
+    ds.sample(5, on_versions=False, seed='abc', hashed=True)
+    assert names(Dataset.load_file(str(path), 'npm', sample=spec)) \
+        == names(ds)
+
+
+def test_canonical_key():
+    def key(cls: type, **kwargs) -> str:
+        uuids = {k: (lambda attr: lambda p: getattr(p, attr))(k)
+                 for k in kwargs if k != 'org'}
+        meta = {'org': lambda p: p.org} if 'org' in kwargs else {}
+        return cls(uuids_=uuids, meta_=meta, **kwargs).canonical_key()
+
+    # github repos by owner/name
+    assert key(GithubRepo, url='https://github.com/Org/Repo') == 'org/repo'
+    assert key(GithubRepo, url='http://www.github.com/org/repo.git/') \
+        == 'org/repo'
+    assert key(GithubRepo, url='git@github.com:org/repo.git') == 'org/repo'
+    assert key(GithubRepo, name='Repo', org='ORG') == 'org/repo'
+    assert key(GithubRepo, url='https://api.github.com/repos/Org/Repo') \
+        == 'org/repo'
+
+    # pypi names as per PEP 503
+    assert key(PypiProject, name='Zope.Interface') == 'zope-interface'
+    assert key(PypiProject, url='https://pypi.org/project/zope_interface/') \
+        == 'zope-interface'
+
+    # scoped npm names
+    assert key(NpmPackage, name='%40babel%2Fcore') == '@babel/core'
+    assert key(NpmPackage, url='https://www.npmjs.com/package/@babel/core'
+                               '/v/7.0.0') == '@babel/core'
+    assert key(NpmPackage, url='https://npmjs.com/package/left-pad') \
+        == 'left-pad'
+
+    # other urls
+    assert key(DefaultProject, url='HTTPS://Example.com/a/?x=1') \
+        == 'example.com/a'
+
+
+def test_github_api_urls():
+    from r2c_isg.apis.github import Github
+
+    # repos listed by their api urls are requested at the same urls
+    ds = Dataset.load_file(str(FILES / 'git_api_urls.csv'), 'github',
+                           fileargs='url')
+    api = Github()
+    urls = [p.uuids_['url']() for p in ds.projects]
+    assert urls and [api._make_api_url(p) for p in ds.projects] == urls
+
+
+def test_dedupe():
+    ds = Dataset('pypi')
+    uuids = {'name': lambda p: p.name}
+    v_uuids = {'version': lambda v: v.version}
+    for name, versions in [('Zope.Interface', ['1.0']), ('six', ['1.0']),
+                           ('zope_interface', ['1.0', '2.0']),
+                           ('SIX', []), ('zope-interface', ['3.0'])]:
+        p = PypiProject(uuids_=uuids, name=name)
+        p.versions = [NpmVersion(uuids_=v_uuids, version=v)
+                      for v in versions]
+        ds.projects.append(p)
+
+    ds.dedupe()
+    assert names(ds) == ['Zope.Interface', 'six']
+    assert [len(p.versions) for p in ds.projects] == [1, 1]
+
+    # duplicates' versions can be merged into the kept project
+    ds = Dataset('pypi')
+    for name, versions in [('Zope.Interface', ['1.0']),
+                           ('zope_interface', ['1.0', '2.0']),
+                           ('zope-interface', ['3.0'])]:
+        p = PypiProject(uuids_=uuids, name=name)
+        p.versions = [NpmVersion(uuids_=v_uuids, version=v)
+                      for v in versions]
+        ds.projects.append(p)
+
+    ds.dedupe(merge_versions=True)
+    assert names(ds) == ['Zope.Interface']
+    assert [v.version for v in ds.projects[0].versions] \
+        == ['1.0', '2.0', '3.0']
+
+
+def test_export_inputset(tmp_path):
+    ds = Dataset('github', name='set', version='1.0', description='ü [x]')
+    for i in range(5):
+        p = GithubRepo(uuids_={'url': lambda p: p.url},
+                       url='https://github.com/org/repo%d' % i)
+        p.versions = [GithubCommit(uuids_={'commit': lambda v: v.sha},
+                                   sha='%d%d' % (i, j)) for j in range(i)]
+        ds.projects.append(p)
+    expected = ds.to_inputset()
+
+    # pretty json is the same as dumping the whole input set at once
+    path = str(tmp_path / 'set.json')
+    ds.export_inputset(path)
+    with open(path) as file:
+        assert file.read() == json.dumps(expected, indent=4)
+
+    # compact json, json lines and gzip
+    ds.export_inputset(path, compact=True)
+    with open(path) as file:
+        assert json.load(file) == expected
+
+    ds.export_inputset(path.replace('.json', '.jsonl'), jsonl=True,
+                       compress=True)
+    with gzip.open(path.replace('.json', '.jsonl.gz'), 'rt') as file:
+        lines = [json.loads(line) for line in file]
+    assert lines[0] == {k: v for k, v in expected.items() if k != 'inputs'}
+    assert lines[1:] == expected['inputs']
+
+    # shards are complete input sets, with the projects dealt out to them
+    ds.export_inputset(path, shards=2)
+    inputs = []
+    for i in range(2):
+        with open(str(tmp_path / ('set-%05d-of-00002.json' % i))) as file:
+            shard = json.load(file)
+        assert shard['name'] == 'set'
+        inputs.extend(shard['inputs'])
+    assert sorted(inputs, key=str) == sorted(expected['inputs'], key=str)
+
+    # empty input sets
+    ds.projects = []
+    ds.export_inputset(path)
+    with open(path) as file:
+        assert file.read() == json.dumps(ds.to_inputset(), indent=4)
+
+
+def test_import_inputset(tmp_path):
+    ds = Dataset('github', name='set', version='1.0', description='ü [x]')
+    for i in range(5):
+        p = GithubRepo(uuids_={'url': lambda p: p.url},
+                       url='https://github.com/org/repo%d' % i)
+        p.versions = [GithubCommit(uuids_={'commit': lambda v: v.sha},
+                                   sha='%d%d' % (i, j)) for j in range(i)]
+        ds.projects.append(p)
+    expected = ds.to_inputset()
+
+    # every export format imports back to the same input set
+    path = str(tmp_path / 'set.json')
+    for kwargs in [{}, {'compact': True}, {'jsonl': True, 'compress': True}]:
+        ds.export_inputset(path, **kwargs)
+        if kwargs.get('jsonl'):
+            path = path + '.gz'
+        assert Dataset.import_inputset(path, 'github').to_inputset() \
+            == expected
+
+    # inputs are grouped by project/version wherever they appear (and the
+    # metadata can come after the inputs)
+    inputs = [
+        {'input_type': 'GitRepoCommit', 'repo_url': 'u1', 'commit_hash': 'a'},
+        {'input_type': 'GitRepoCommit', 'repo_url': 'u2', 'commit_hash': 'b'},
+        {'input_type': 'GitRepoCommit', 'repo_url': 'u1', 'commit_hash': 'c'},
+        {'input_type': 'GitRepoCommit', 'repo_url': 'u1', 'commit_hash': 'a'},
+    ]
+    with open(path, 'w') as file:
+        json.dump({'inputs': inputs, 'name': 'mixed', 'version': '2'}, file)
+    imported = Dataset.import_inputset(path, 'github')
+    assert imported.name == 'mixed'
+    assert [(p.repo_url, [v.commit_hash for v in p.versions])
+            for p in imported.projects] == [('u1', ['a', 'c']), ('u2', ['b'])]
+
+    # json lines without a header line
+    with open(path, 'w') as file:
+        file.write('\n'.join([json.dumps(inp) for inp in inputs]))
+    imported = Dataset.import_inputset(path, 'github')
+    assert len(imported.projects) == 2
+
+    # disk-backed projects
+    imported = Dataset.import_inputset(path, 'github',
+                                       store=str(tmp_path / 'set.db'))
+    assert [len(p.versions) for p in imported.projects.scan()] == [2, 1]
+
+
+def test_snapshot(tmp_path):
+    ds = Dataset('github', name='set', version='1.0', description='ü')
+    for i in range(3):
+        p = GithubRepo(uuids_={'url': lambda p: p.html_url},
+                       meta_={'org': lambda p: p.html_url.split('/')[-2]},
+                       raw_={'html_url': 'https://github.com/org/r%d' % i,
+                             'stargazers_count': i})
+        p.update(label='x%d' % i)
+        p.versions = [GithubCommit(uuids_={'commit': lambda v: v.sha},
+                                   sha='%d%d' % (i, j)) for j in range(i)]
+        ds.projects.append(p)
+    ds.api.configure(github_pat='token')
+
+    path = str(tmp_path / 'set.snap')
+    ds.backup(path, compress=True)
+    restored = Dataset.restore(path)
+    assert restored.to_inputset() == ds.to_inputset()
+    assert restored.api.github_pat == 'token'
+    assert restored.api.cache_timeout == ds.api.cache_timeout
+    p = restored.projects[2]
+    assert type(p) is GithubRepo and p.label == 'x2'
+    assert p.stargazers_count == 2 and p.meta_['org']() == 'org'
+    assert p.versions[1].uuids_['commit']() == '21'
+
+    # partial restores
+    assert all(not p.versions for p in
+               Dataset.restore(path, versions=False).projects)
+    from r2c_isg.structures.snapshot import Snapshot
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 3
+        assert [u['url'] for u in snapshot.identities()] == \
+            ['https://github.com/org/r%d' % i for i in range(3)]
+
+    # restoring into (and backing up from) a disk-backed store
+    restored = Dataset.restore(path, store=str(tmp_path / 'set.db'))
+    restored.backup(path)
+    assert Dataset.restore(path).to_inputset() == ds.to_inputset()
+
+    # older pickle backups still restore
+    import dill
+    with open(str(tmp_path / 'set.p'), 'wb') as file:
+        dill.dump(ds, file)
+    assert Dataset.restore(str(tmp_path / 'set.p')).to_inputset() == \
+        ds.to_inputset()
+
+
+def test_snapshot_view(tmp_path):
+    import pickle
+    from r2c_isg.structures.journal import Journal
+
+    path = str(tmp_path / 'set.snap')
+    original = make_dataset()
+    original.backup(path)
+    ds = Dataset.restore(path, view=True)
+    assert [p.name for p in ds.projects] == names(original)
+    assert [[v.version for v in p.versions] for p in ds.projects] == \
+        [[v.version for v in p.versions] for p in original.projects]
+
+    # reordering/dropping projects only changes the view's overlay
+    ds.sort('desc downloads asc name')
+    assert names(ds) == ['A', 'd', 'b', 'c']
+    ds.filter('downloads < 30')
+    ds.trim(2)
+    assert names(ds) == ['d', 'b']
+    assert [p.name for p in ds.projects[1:]] == ['b']
+
+    # views are sent to other processes as just their path and overlay
+    copy = pickle.loads(pickle.dumps(ds.projects))
+    assert [p.name for p in copy] == ['d', 'b']
+    assert [u['name'] for u in copy.identities()] == ['d', 'b']
+
+    # overlay changes can be undone; projects can't be changed
+    journal = Journal().start()
+    ds.sample(1, on_versions=False, seed=1)
+    journal.commit()
+    journal.rollback()
+    assert names(ds) == ['d', 'b']
+
+    # ...one command at a time
+    ds = Dataset.restore(path, view=True)
+    journals = []
+    for command in [lambda: ds.sort('asc name'), lambda: ds.trim(2)]:
+        journals.append(Journal().start())
+        command()
+        journals[-1].commit()
+    assert names(ds) == ['A', 'b']
+    journals.pop().rollback()
+    assert names(ds) == ['A', 'b', 'c', 'd']
+    journals.pop().rollback()
+    assert names(ds) == names(original)
+    try:
+        ds.sample(1, on_versions=True)
+        assert False
+    except Exception as e:
+        assert 'read-only' in str(e)
+
+
+def test_store(tmp_path):
+    def contents(ds: Dataset) -> list:
+        return [(p.name, [v.version for v in p.versions])
+                for p in ds.projects]
+
+    # transformations give the same results on disk as in memory
+    commands = [
+        lambda ds: ds.sort('desc downloads asc name'),
+        lambda ds: ds.sort('desc v.version'),
+        lambda ds: ds.trim(2),
+        lambda ds: ds.trim(1, on_versions=True),
+        lambda ds: ds.sample(2, on_versions=False, seed=1),
+        lambda ds: ds.sample(1, seed=1),
+        lambda ds: ds.filter('downloads >= 20 or name = b'),
+        lambda ds: ds.filter('v.version >= 1.0.1'),
+        lambda ds: ds.dedupe(),
+    ]
+    for i, command in enumerate(commands):
+        ds = make_dataset()
+        disk = Dataset('npm', store=str(tmp_path / ('%d.db' % i)))
+        disk.projects.extend(ds.projects)
+        command(ds)
+        command(disk)
+        assert contents(disk) == contents(ds), i
+
+    # exports too
+    exported = []
+    for d in [ds, disk]:
+        d.update(name='set', version='1.0')
+        d.filter('name != d')
+        d.export_inputset(str(tmp_path / 'set.json'))
+        with open(str(tmp_path / 'set.json')) as file:
+            exported.append(json.load(file))
+    assert exported[0]['inputs'] and exported[0] == exported[1]
+
+    # changes to projects are saved, even after they've been paged out
+    disk = Dataset('npm', store=str(tmp_path / 'paged.db'))
+    disk.projects.extend(make_dataset().projects)
+    disk.projects.cache_size = disk.projects.page_size = 1
+    p = disk.projects[0]
+    disk.projects[3].update(label='d')
+    p.update(label='b')
+    assert disk.projects[0] is p
+    disk.projects[3].update(label='x')
+    p.update(label='y')
+    disk.sort('asc name')
+    assert disk.projects[1] is p
+    assert [getattr(q, 'label', None) for q in disk.projects.scan()] == \
+        [None, 'y', None, 'x']
+
+    # existing stores aren't overwritten
+    try:
+        Dataset('npm', store=str(tmp_path / 'paged.db'))
+        assert False
+    except Exception as e:
+        assert 'already contains projects' in str(e)
+
+
+class FakeApi(object):
+    """Stands in for a registry api (no web access needed)."""
+
+    def __init__(self, fail_at: str = None, statuses: dict = None,
+                 error: type = Exception):
+        self.calls = []
+        self.fail_at = fail_at
+        self.statuses = statuses or {}
+        self.error = error
+
+    def get_project(self, p, **_):
+        if p.name == self.fail_at:
+            raise self.error('HTTP 403')
+        self.calls.append(p.name)
+        status = self.statuses.get(p.name, 200)
+        if status == 200:
+            p.update_raw({'description': 'about ' + p.name})
+        return status
+
+    def get_versions(self, p, **_):
+        self.calls.append('v.' + p.name)
+        p.versions.append(NpmVersion(uuids_={'version': lambda v: v.version},
+                                     version='9.9.9'))
+        return self.statuses.get(p.name, 200)
+
+
+def test_checkpoint(tmp_path, capsys):
+    from r2c_isg.structures.checkpoint import Checkpoint
+
+    # a get that dies partway through
+    path = str(tmp_path / 'checkpoint')
+    ds = make_dataset()
+    checkpoint = Checkpoint.start(path, ds, metadata=True, versions='all')
+    ds.api = FakeApi(fail_at='c')
+    try:
+        ds.get_projects_meta(checkpoint=checkpoint)
+        assert False
+    except Exception as e:
+        assert 'HTTP 403' in str(e)
+
+    # (the dataset is only saved once the get has stopped)
+    assert not (tmp_path / 'checkpoint' / 'dataset.snap').exists()
+    assert checkpoint.close()
+    assert (tmp_path / 'checkpoint' / 'dataset.snap').exists()
+
+    # resuming skips the finished projects (a cut-off line is ignored)
+    with open(str(tmp_path / 'checkpoint' / 'progress-001.jsonl'),
+              'a') as file:
+        file.write('{"step": "metad')
+    checkpoint, ds = Checkpoint.resume(path)
+    assert checkpoint.job['versions'] == 'all'
+    assert checkpoint.done['metadata'] == {0, 1}
+    assert [p.__dict__.get('raw_', None) is not None
+            for p in ds.projects] == [True, True, False, False]
+
+    ds.api = FakeApi(fail_at='A')
+    capsys.readouterr()
+    ds.get_projects_meta(checkpoint=checkpoint)
+    ds.get_project_versions(checkpoint=checkpoint)
+    assert ds.api.calls == ['c', 'd', 'v.b', 'v.A', 'v.c', 'v.d']
+
+    # (the summary only counts the projects got since resuming)
+    assert 'Retrieved metadata for 2 projects (2 already got before ' \
+        'resuming).' in capsys.readouterr().out
+    checkpoint.close()
+
+    # resuming again replays every log
+    checkpoint, ds = Checkpoint.resume(path)
+    assert checkpoint.done['versions'] == {0, 1, 2, 3}
+    assert [p.description for p in ds.projects] == \
+        ['about b', 'about A', 'about c', 'about d']
+    assert [len(p.versions) for p in ds.projects] == [4, 2, 3, 1]
+    checkpoint.remove()
+    assert not (tmp_path / 'checkpoint').exists()
+
+    # a get that stops before finishing anything leaves nothing to resume
+    checkpoint = Checkpoint.start(path, make_dataset(), metadata=True)
+    assert not checkpoint.close()
+    assert not (tmp_path / 'checkpoint').exists()
+
+    # disk-backed datasets are resumed from their store, as it is
+    ds = Dataset('npm', store=str(tmp_path / 'set.db'))
+    ds.projects.extend(make_dataset().projects)
+    checkpoint = Checkpoint.start(path, ds, metadata=True)
+    ds.api = FakeApi(fail_at='c')
+    try:
+        ds.get_projects_meta(checkpoint=checkpoint)
+        assert False
+    except Exception:
+        pass
+
+    # (say the get is killed here: only the log and the store are saved)
+    checkpoint._close_log()
+    ds.projects.flush()
+
+    checkpoint, ds = Checkpoint.resume(path)
+    assert ds.projects.path == str(tmp_path / 'set.db')
+    assert names(ds) == ['b', 'A', 'c', 'd']
+    ds.api = FakeApi()
+    ds.get_projects_meta(checkpoint=checkpoint)
+    assert ds.api.calls == ['c', 'd']
+    assert [p.description for p in ds.projects] == \
+        ['about b', 'about A', 'about c', 'about d']
+
+
+def test_fetch_state(tmp_path):
+    from datetime import timedelta
+
+    ds = make_dataset()
+    ds.api = FakeApi(statuses={'c': 404})
+    ds.get_projects_meta()
+    assert [p.fetched('metadata')['status'] for p in ds.projects] == \
+        [200, 200, 404, 200]
+    assert ds.projects[0].fetched('metadata')['source'] == 'api'
+    assert ds.projects[0].fetched('versions') is None
+
+    # only the failed project is retried; nothing is missing
+    ds.api = FakeApi()
+    ds.get_projects_meta(retry_failed=True)
+    ds.get_projects_meta(only_missing=True)
+    assert ds.api.calls == ['c']
+    assert ds.projects[2].fetched('metadata')['status'] == 200
+
+    # only stale projects are refetched
+    ds.projects[1].set_fetched('metadata', 200,
+                               fetched_at='2000-01-01T00:00:00Z')
+    ds.api = FakeApi()
+    ds.get_projects_meta(max_age=timedelta(days=7))
+    assert ds.api.calls == ['A']
+
+    # versions are tracked separately
+    ds.get_project_versions(only_missing=True, retry_failed=True)
+    ds.get_project_versions(only_missing=True)
+    assert ds.api.calls == ['A', 'v.b', 'v.A', 'v.c', 'v.d']
+
+    # the fetch state is kept by backups
+    ds.backup(str(tmp_path / 'ds.snap'))
+    ds = Dataset.restore(str(tmp_path / 'ds.snap'))
+    assert ds.projects[2].fetched('metadata')['status'] == 200
+    assert ds.projects[2].fetched('versions')['source'] == 'api'
+    assert not ds.projects[1].needs_fetch('versions', max_age=timedelta(1))
+
+
+def test_get_until():
+    from datetime import timedelta
+
+    # stops once the target is met, dropping the failures
+    ds = make_dataset()
+    ds.api = FakeApi(statuses={'b': 404})
+    ds.get_until(target=2)
+    assert names(ds) == ['A', 'c']
+    assert ds.api.calls == ['b', 'A', 'c']
+
+    # in priority order, with a filter on top of having versions
+    ds = make_dataset()
+    ds.api = FakeApi()
+    ds.get_until(metadata=False, historical='all', target=2,
+                 order='desc downloads', where='downloads < 30')
+    assert names(ds) == ['b', 'd']
+    assert ds.api.calls == ['v.A', 'v.d', 'v.b']
+
+    # concurrently, without a target or filter (failures are kept)
+    ds = make_dataset()
+    ds.api = FakeApi(statuses={'c': 500})
+    ds.get_until(workers=3)
+    assert names(ds) == ['b', 'A', 'c', 'd']
+    assert ds.projects[2].fetched('metadata')['status'] == 500
+    assert sorted(ds.api.calls) == ['A', 'b', 'c', 'd']
+
+    # ...and with a filter (failures are dropped)
+    ds = make_dataset()
+    ds.api = FakeApi(statuses={'c': 500})
+    ds.get_until(workers=3, where='downloads > 0')
+    assert names(ds) == ['b', 'A', 'd']
+
+    # a project whose get raises fails on its own
+    ds = make_dataset()
+    ds.api = FakeApi(fail_at='A')
+    ds.get_until(workers=2)
+    assert names(ds) == ['b', 'A', 'c', 'd']
+    assert ds.projects[1].fetched('metadata')['status'] == 0
+    assert sorted(ds.api.calls) == ['b', 'c', 'd']
+
+    ds = make_dataset()
+    ds.api = FakeApi(fail_at='b')
+    ds.get_until(target=2)
+    assert names(ds) == ['A', 'c']
+
+    # ...but critical api errors (eg, rate limits) stop the get
+    ds = make_dataset()
+    ds.api = FakeApi(fail_at='A', error=CriticalApiError)
+    try:
+        ds.get_until(workers=2)
+        assert False
+    except CriticalApiError as e:
+        assert 'HTTP 403' in str(e)
+    assert names(ds) == ['b', 'A', 'c', 'd']
+
+    # out of time before starting (nothing got, nothing dropped)
+    ds = make_dataset()
+    ds.api = FakeApi()
+    ds.get_until(budget=timedelta(0))
+    assert names(ds) == ['b', 'A', 'c', 'd']
+    assert ds.api.calls == []
+
+
+class DepsApi(object):
+    """Stands in for the npm registry, with a dependency graph."""
+
+    def __init__(self, graph: dict):
+        self.graph = graph
+        self.calls = []
+
+    def get_project(self, p, **_):
+        self.calls.append(p.name)
+        if p.name not in self.graph:
+            return 404
+        p.update_raw({'dependencies': {d: '^1.0.0'
+                                       for d in self.graph[p.name]}})
+        return 200
+
+
+def test_expand_deps():
+    # a diamond (b and c both need d) with a cycle (d needs a) and a
+    # package that doesn't exist
+    graph = {'a': ['b', 'c'], 'b': ['d'], 'c': ['d', 'x'], 'd': ['a'],
+             'e': []}
+
+    def seeds() -> Dataset:
+        ds = Dataset('npm')
+        for name in ['a', 'e']:
+            ds.projects.append(NpmPackage(uuids_={'name': lambda p: p.name},
+                                          name=name))
+        ds.api = DepsApi(graph)
+        return ds
+
+    ds = seeds()
+    ds.expand_deps(workers=3)
+    assert names(ds) == ['a', 'e', 'b', 'c', 'd', 'x']
+    assert sorted(ds.api.calls) == ['a', 'b', 'c', 'd', 'e', 'x']
+    assert ds.projects[-1].fetched('metadata')['status'] == 404
+
+    ds = seeds()
+    ds.expand_deps(depth=1)
+    assert names(ds) == ['a', 'e', 'b', 'c']
+
+    ds = seeds()
+    ds.expand_deps(max_projects=3)
+    assert names(ds) == ['a', 'e', 'b', 'c', 'd']
+
+    # dependencies are read from the registries' metadata
+    p = NpmPackage(uuids_={'name': lambda p: p.name}, name='p',
+                   dependencies={'left': '^1', 'alias': 'npm:@s/right@2',
+                                 'fork': 'github:me/fork'})
+    assert p.dependency_names() == ['left', '@s/right']
+    p = PypiProject(uuids_={'name': lambda p: p.name}, name='p',
+                    requires_dist=['requests (>=2.0)', 'Zope.Interface>=4',
+                                   'pytest; extra == "test"'])
+    assert p.dependency_names() == ['requests', 'Zope.Interface']
+    assert PypiProject(uuids_={'name': lambda p: p.name},
+                       name='p').dependency_names() is None
+
+
+def test_refresh():
+    def listing(rows: list) -> Dataset:
+        ds = Dataset('pypi')
+        ds.projects = [PypiProject(uuids_={'name': lambda p: p.project},
+                                   project=name, download_count=count)
+                       for name, count in rows]
+        return ds
+
+    def refreshed(flag_removed: bool = False) -> Dataset:
+        ds = listing([('a', 30), ('b', 20), ('c', 10)])
+        ds.projects[0].update_raw({'summary': 'about a'})
+        ds.projects[0].versions = [PypiRelease(
+            uuids_={'version': lambda v: v.version}, version='1.0')]
+        ds.projects[0].set_fetched('metadata', 200)
+        ds.refresh(listing([('C', 50), ('a', 40), ('d', 5), ('c', 1)]),
+                   flag_removed)
+        return ds
+
+    ds = refreshed()
+    assert [p.project for p in ds.projects] == ['C', 'a', 'd']
+    assert [p.download_count for p in ds.projects] == [50, 40, 5]
+    assert ds.projects[1].summary == 'about a'
+    assert len(ds.projects[1].versions) == 1
+    assert not ds.projects[1].needs_fetch('metadata', only_missing=True)
+    assert ds.projects[2].needs_fetch('metadata', only_missing=True)
+
+    ds = refreshed(flag_removed=True)
+    assert [p.project for p in ds.projects] == ['C', 'a', 'd', 'b']
+    assert ds.projects[3].delisted
+    ds.refresh(listing([('b', 1)]))
+    assert [(p.project, p.__dict__.get('delisted', False))
+            for p in ds.projects] == [('b', False)]
+
+
+def test_refresh_unchanged(capsys):
+    def listing(summary: str) -> Dataset:
+        # (eg, a github list, whose entries come with their metadata)
+        ds = Dataset('pypi')
+        p = PypiProject(uuids_={'name': lambda p: p.project}, project='a')
+        p.update_raw({'summary': summary, 'home_page': 'a.com'})
+        p.set_fetched('metadata', 200, source='list')
+        ds.projects = [p]
+        return ds
+
+    ds = listing('about a')
+    ds.projects[0].set_fetched('metadata', 200)
+    ds.projects[0].update_raw({'license': 'MIT'})
+    api_state = ds.projects[0].fetched('metadata')
+
+    # values that haven't changed (decoded or not) don't count as updates
+    ds.refresh(listing('about a'))
+    assert '(0 updated)' in capsys.readouterr().out
+    assert ds.projects[0].fetched('metadata') == api_state
+
+    # ...and changed ones take the list's fetch state
+    ds.refresh(listing('all about a'))
+    assert '(1 updated)' in capsys.readouterr().out
+    assert ds.projects[0].summary == 'all about a'
+    assert ds.projects[0].license == 'MIT'
+    assert ds.projects[0].fetched('metadata')['source'] == 'list'
+
+
+def test_get_from_dump(tmp_path):
+    def packument(name: str, *versions) -> dict:
+        return {'_id': name, 'name': name, 'description': 'about ' + name,
+                'dist-tags': {'latest': versions[-1]},
+                'versions': {v: {'name': name, 'version': v,
+                                 'dependencies': {'dep': '^' + v}}
+                             for v in versions}}
+
+    # an _all_docs export (gzipped) and json lines, in a directory
+    dump = tmp_path / 'npm'
+    dump.mkdir()
+    with gzip.open(str(dump / 'a.json.gz'), 'wt') as file:
+        json.dump({'total_rows': 3, 'offset': 0, 'rows': [
+            {'id': '_design/app', 'key': '_design/app', 'value': {},
+             'doc': {'_id': '_design/app', 'views': {}}},
+            {'id': 'a', 'key': 'a', 'value': {},
+             'doc': packument('a', '1.0.0', '2.0.0')},
+            {'id': '@s/b', 'key': '@s/b', 'value': {},
+             'doc': packument('@s/b', '0.1.0')}]}, file)
+    (dump / 'b.jsonl').write_text(
+        json.dumps(packument('c', '3.0.0')) + '\n' +
+        json.dumps({'_id': 'gone', 'name': 'gone', '_deleted': True}) + '\n')
+
+    ds = Dataset('npm')
+    ds.projects = [NpmPackage(uuids_={'name': lambda p: p.name}, name=name)
+                   for name in ['a', '@s%2fb', 'c', 'missing', 'a']]
+    ds.get_from_dump(str(dump), historical='latest')
+    a = ds.projects[0]
+    assert a.description == 'about a'
+    assert a.dependency_names() == ['dep']
+    assert [v.version for v in a.versions] == ['2.0.0']
+    assert a.fetched('versions')['source'] == 'dump:npm'
+    assert [len(p.versions) for p in ds.projects] == [1, 1, 1, 0, 1]
+    assert [p.needs_fetch('metadata', only_missing=True)
+            for p in ds.projects] == [False, False, False, True, False]
+
+    # pypi project json, one file per project
+    dump = tmp_path / 'pypi'
+    dump.mkdir()
+    (dump / 'zope.json').write_text(json.dumps({
+        'info': {'name': 'Zope.Interface', 'version': '5.0',
+                 'summary': 'interfaces'},
+        'releases': {'4.0': [], '5.0': [{'packagetype': 'sdist'}]}}))
+    ds = Dataset('pypi')
+    ds.projects = [PypiProject(uuids_={'name': lambda p: p.name},
+                               name='zope-interface')]
+    ds.get_from_dump(str(dump), historical='all')
+    assert ds.projects[0].summary == 'interfaces'
+    assert [v.version for v in ds.projects[0].versions] == ['4.0', '5.0']
+
+
+def test_api_cache(tmp_path, monkeypatch):
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from r2c_isg.apis import Npm, _api
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({'name': 'a'}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d/a' % server.server_port
+    try:
+        api = Npm(cache_dir=str(tmp_path / 'cache'))
+        assert api.request(url) == (200, {'name': 'a'})
+
+        # a request that reads the cache while it's being rewritten (eg, by
+        # another worker thread) gets the whole of the old response
+        dump = _api.json.dump
+        read = []
+
+        def rewrite(*args, **kwargs):
+            read.append(api.request(url))
+            dump(*args, **kwargs)
+
+        monkeypatch.setattr(_api.json, 'dump', rewrite)
+        assert api.request(url, nocache=True) == (200, {'name': 'a'})
+        assert read == [(200, {'name': 'a'})]
+        assert len(list((tmp_path / 'cache').iterdir())) == 1
+
+    finally:
+        server.shutdown()
+
+
+def test_npm_mirror(tmp_path):
+    import threading
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.parse import parse_qs, urlparse
+    from r2c_isg.apis import Npm
+    from r2c_isg.apis.npm_mirror import NpmMirror
+
+    def packument(name: str, version: str) -> dict:
+        return {'_id': name, 'name': name, 'description': name + version,
+                'dist-tags': {'latest': version},
+                'versions': {version: {'name': name, 'version': version}}}
+
+    # a couchdb stand-in: a recorded _changes feed and the docs the feed
+    # leaves out
+    changes = [{'seq': 1, 'id': 'a', 'doc': packument('a', '1.0.0')},
+               {'seq': 2, 'id': '@s/b'},
+               {'seq': 3, 'id': '_design/app'}]
+    docs = {'/@s%2Fb': packument('@s/b', '0.1.0')}
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            requests.append(self.path)
+            if url.path == '/_changes':
+                query = parse_qs(url.query)
+                since = int(query.get('since', ['0'])[0])
+                results = [c for c in changes if c['seq'] > since]
+                results = results[:int(query['limit'][0])]
+                body = {'results': results, 'last_seq':
+                        results[-1]['seq'] if results else since}
+            else:
+                body = docs[url.path]
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(json.dumps(body).encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:%d' % server.server_port
+    try:
+        path = str(tmp_path / 'npm.db')
+        mirror = NpmMirror(path)
+        assert mirror.sync(url, registry_url=url, batch=2) == (2, 0)
+        assert mirror.seq == 3 and len(mirror) == 2
+        assert mirror.get('@s/b')['description'] == '@s/b0.1.0'
+        assert len(requests) == 3
+
+        # only the changes since the last sync are got
+        changes.extend([{'seq': 4, 'id': 'a', 'doc': packument('a', '2.0.0')},
+                        {'seq': 5, 'id': '@s/b', 'deleted': True}])
+        del requests[:]
+        assert mirror.sync(url, registry_url=url) == (1, 1)
+        assert requests == ['/_changes?include_docs=true&limit=500&since=3']
+        assert mirror.seq == 5 and mirror.get('@s/b') is None
+        mirror.close()
+
+    finally:
+        server.shutdown()
+
+    # the api serves mirrored packages without the registry
+    api = Npm(cache_dir=str(tmp_path / 'cache'), npm_mirror=path)
+    p = NpmPackage(uuids_={'name': lambda p: p.name}, name='a')
+    assert api.get_project(p) == 200
+    assert api.get_versions(p, historical='latest') == 200
+    assert p.description == 'a2.0.0'
+    assert [v.version for v in p.versions] == ['2.0.0']
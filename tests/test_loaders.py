@@ -140,6 +140,7 @@ def test_load_weblist():
         github_pat=os.getenv('GITHUB_PAT')
     )
     ds.trim(10)
+    assert ds.projects[0].fetched('metadata')['source'] == 'list:top1kstarred'
     ds.get_projects_meta()
     ds.get_project_versions(historical='latest')
     ds.update(**{'name': 'test', 'version': '1.0'})
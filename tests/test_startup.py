@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import subprocess
+
+import pytest
+
+# heavy modules that only some commands need
+LAZY_MODULES = ['dill', 'requests', 'urllib3', 'tqdm', 'webbrowser',
+                'sqlite3', 'subprocess']
+
+# startup time budget (in seconds) on top of the bare interpreter's
+# Note: Wall-clock timings depend on the machine (and its load), so the
+# timing test only runs when STARTUP_TIMING is set; the import tests catch
+# the usual regressions (a heavy module imported at startup) anywhere.
+STARTUP_BUDGET = 0.1
+
+
+def run_time(args: list) -> float:
+    """Wall time of a command."""
+    start = time.perf_counter()
+    subprocess.run(args, input=b'', check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def imported(code: str) -> list:
+    """The lazy modules imported once some code has run (in a fresh
+    interpreter)."""
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        '%s\nimport sys; print(" ".join(sys.modules))' % code
+    ], input=b'', stderr=subprocess.DEVNULL).decode().split()
+
+    return [module for module in LAZY_MODULES if module in out]
+
+
+def test_lazy_imports():
+    assert imported('import r2c_isg.cli') == []
+
+    # nor by starting the cli and running an (empty) script
+    assert imported('from r2c_isg.cli import cli\n'
+                    'cli(["-q", "run"], standalone_mode=False)') == []
+
+
+@pytest.mark.skipif(not os.environ.get('STARTUP_TIMING'),
+                    reason='set STARTUP_TIMING to time the startup')
+def test_startup_time():
+    # alternate the runs (so both see the same machine load) and keep the
+    # best of each
+    bare, cli = [], []
+    for _ in range(10):
+        bare.append(run_time([sys.executable, '-c', 'pass']))
+        cli.append(run_time([sys.executable, '-m', 'r2c_isg.cli', '-q',
+                             'run']))
+
+    overhead = min(cli) - min(bare)
+    assert overhead < STARTUP_BUDGET, \
+        'startup took %.0fms' % (overhead * 1000)